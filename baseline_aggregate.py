@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+baseline_aggregate.py — 基准数据按查询键的预计算汇总
+功能：
+- CSV 中同一 (Location, sub_process step, material_name) 往往有多行（不同零件号 / 供应商），
+  加载时一次 groupby 算出每个键分组的 行数 / Low 最小值 / 中值 / High 最大值 / 最近 valid_time，
+  以及按供应商拆分的同样统计
+- 查询时按分组号直接取预计算结果，与单行查询同样是 O(1)
+- 子串匹配命中的任意行集合没有预计算分组，走同一套向量化统计现场计算
+口径：每行区间取 [Low, High]（只有一侧有值时两侧相同），中值为各行区间中点的中位数。
+"""
+
+import os
+from typing import Any, Dict, List
+
+import numpy as np
+import pandas as pd
+
+LOW_COLUMN = "Low"
+HIGH_COLUMN = "High"
+SUPPLIER_COLUMN = "supplier_code"
+VALID_TIME_COLUMN = "valid_time"
+VALID_TIME_FORMAT = "%m/%d/%Y"
+
+_STATS = ("count", "low", "median", "high", "latest")
+
+
+def parse_valid_time(series: pd.Series) -> np.ndarray:
+    """valid_time（m/d/Y，例如 9/2/2025）→ datetime64[D]；无法解析的为 NaT"""
+    parsed = pd.to_datetime(series.astype("string"), format=VALID_TIME_FORMAT, errors="coerce")
+    return parsed.to_numpy(dtype="datetime64[D]")
+
+
+def supplier_labels(series: pd.Series) -> np.ndarray:
+    """供应商编码统一为字符串（数值列去掉 .0），缺失为空字符串"""
+    if pd.api.types.is_numeric_dtype(series):
+        labels = series.astype("Int64").astype("string")
+    else:
+        labels = series.astype("string").str.strip()
+    return labels.fillna("").to_numpy(dtype=object)
+
+
+def _numeric(frame: pd.DataFrame, column: str) -> np.ndarray:
+    if column not in frame.columns:
+        return np.full(len(frame), np.nan)
+    return pd.to_numeric(frame[column].astype(object), errors="coerce").to_numpy(dtype=float)
+
+
+def valid_time_column(frame: pd.DataFrame) -> np.ndarray:
+    """整表的 valid_time 列（datetime64[D]）；没有该列时全部为 NaT"""
+    if VALID_TIME_COLUMN in frame.columns:
+        return parse_valid_time(frame[VALID_TIME_COLUMN])
+    return np.full(len(frame), np.datetime64("NaT"), dtype="datetime64[D]")
+
+
+def rate_frame(frame: pd.DataFrame, groups: np.ndarray, valid_time: np.ndarray | None = None) -> pd.DataFrame:
+    """抽出统计所需的列：分组号、供应商、区间下 / 上界、中点、生效日期（已解析时直接传入 valid_time）"""
+    low, high = _numeric(frame, LOW_COLUMN), _numeric(frame, HIGH_COLUMN)
+    low, high = np.where(np.isnan(low), high, low), np.where(np.isnan(high), low, high)
+    return pd.DataFrame(
+        {
+            "group": np.asarray(groups, dtype=np.int64),
+            "supplier": (
+                supplier_labels(frame[SUPPLIER_COLUMN]) if SUPPLIER_COLUMN in frame.columns
+                else np.full(len(frame), "", dtype=object)
+            ),
+            "low": low,
+            "high": high,
+            "mid": (low + high) / 2,
+            "valid_time": valid_time_column(frame) if valid_time is None else valid_time,
+        }
+    )
+
+
+def _grouped_stats(rates: pd.DataFrame, by: List[str]) -> pd.DataFrame:
+    return rates.groupby(by, sort=True).agg(
+        count=("mid", "size"),
+        low=("low", "min"),
+        median=("mid", "median"),
+        high=("high", "max"),
+        latest=("valid_time", "max"),
+    )
+
+
+def _float(value: Any) -> float | None:
+    return None if pd.isna(value) else round(float(value), 6)
+
+
+def _date(value: np.datetime64) -> str | None:
+    return None if np.isnat(value) else str(value.astype("datetime64[D]"))
+
+
+class BaselineAggregates:
+    """
+    每个分组一行的统计表（列式数组），外加按 (分组, 供应商) 排序的供应商统计表；
+    分组号为 0..n-1，与索引里每行的分组号一致。
+    """
+
+    def __init__(self, arrays: Dict[str, np.ndarray]) -> None:
+        self.arrays = arrays
+        self._suppliers: List[str] = arrays["supplier.label"].tolist()
+
+    @classmethod
+    def build(
+        cls,
+        frame: pd.DataFrame,
+        groups: np.ndarray,
+        n_groups: int,
+        valid_time: np.ndarray | None = None,
+    ) -> "BaselineAggregates":
+        rates = rate_frame(frame, groups, valid_time)
+        arrays: Dict[str, np.ndarray] = {}
+
+        totals = _grouped_stats(rates, ["group"]).reindex(range(n_groups))
+        for name in _STATS:
+            arrays[f"group.{name}"] = cls._column(totals[name], name)
+
+        per_supplier = _grouped_stats(rates, ["group", "supplier"]).reset_index()
+        arrays["supplier.group"] = per_supplier["group"].to_numpy(dtype=np.int64)
+        arrays["supplier.label"] = np.asarray(per_supplier["supplier"].astype(str).tolist(), dtype=str)
+        for name in _STATS:
+            arrays[f"supplier.{name}"] = cls._column(per_supplier[name], name)
+        return cls(arrays)
+
+    @staticmethod
+    def _column(series: pd.Series, name: str) -> np.ndarray:
+        if name == "count":
+            return series.fillna(0).to_numpy(dtype=np.int64)
+        if name == "latest":
+            return series.to_numpy(dtype="datetime64[D]")
+        return series.to_numpy(dtype=float)
+
+    # ------------------------------------------------------------------ #
+    # 持久化（内存映射存储随键索引一起保存）
+    # ------------------------------------------------------------------ #
+    def save(self, directory: str, prefix: str = "agg") -> None:
+        for name, array in self.arrays.items():
+            np.save(os.path.join(directory, f"{prefix}.{name}.npy"), array, allow_pickle=False)
+
+    @classmethod
+    def load(cls, directory: str, prefix: str = "agg", mmap_mode: str | None = None) -> "BaselineAggregates":
+        names = [f"group.{name}" for name in _STATS] + ["supplier.group", "supplier.label"]
+        names += [f"supplier.{name}" for name in _STATS]
+        return cls({
+            name: np.asarray(np.load(os.path.join(directory, f"{prefix}.{name}.npy"), mmap_mode=mmap_mode))
+            for name in names
+        })
+
+    # ------------------------------------------------------------------ #
+    # 查询
+    # ------------------------------------------------------------------ #
+    def _stats(self, table: str, i: int) -> Dict[str, Any]:
+        return {
+            "rows": int(self.arrays[f"{table}.count"][i]),
+            "low": _float(self.arrays[f"{table}.low"][i]),
+            "median": _float(self.arrays[f"{table}.median"][i]),
+            "high": _float(self.arrays[f"{table}.high"][i]),
+            "latest_valid_time": _date(self.arrays[f"{table}.latest"][i]),
+        }
+
+    def envelope(self, group: int) -> Dict[str, Any]:
+        """一个分组的 min / median / max 区间、行数、最近 valid_time 与供应商拆分"""
+        owners = self.arrays["supplier.group"]
+        start = int(np.searchsorted(owners, group, side="left"))
+        end = int(np.searchsorted(owners, group, side="right"))
+        result = self._stats("group", group)
+        result["suppliers"] = [
+            dict(supplier_code=self._suppliers[i] or None, **self._stats("supplier", i))
+            for i in range(start, end)
+        ]
+        return result
+
+
+def summarize_rows(frame: pd.DataFrame) -> Dict[str, Any]:
+    """任意行集合（例如子串匹配的结果）现场统计，输出与 envelope 相同"""
+    return BaselineAggregates.build(frame, np.zeros(len(frame), dtype=np.int64), 1).envelope(0)
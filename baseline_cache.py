@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+"""
+baseline_cache.py — 基准费率表（CSV / XLSX）的列式二进制缓存
+功能：
+- 第一次加载时解析源文件，每列写成一个 NumPy .npy 文件：
+  数值列保持原 dtype，字符串列做字典编码（int32 codes + 定长 unicode 类别表，缺失值 code = -1）
+- 之后加载直接读 .npy 并还原为 DataFrame（字符串列为 pandas Categorical），不再解析 CSV / XLSX
+- 失效判断：源文件大小 / mtime 与 manifest 一致时直接复用；不一致时再算 sha256，
+  内容未变只刷新 manifest，内容变化才重建
+- 每个内容版本写在独立子目录中，manifest 最后原子替换，并发读取者不会看到写了一半的缓存
+- 重建后保留紧邻的上一个版本（BASELINE_CACHE_KEEP_VERSIONS），仍在读取旧版本的进程不受影响；
+  读取缓存失败时重新检查一次缓存，仍失败再直接解析源文件
+环境变量：BASELINE_CACHE_DIR（默认 ./.cache/baseline），BASELINE_CACHE=off 关闭缓存（每次解析源文件），
+BASELINE_CACHE_KEEP_VERSIONS（默认 1）。
+说明：XLSX 需要可选依赖 openpyxl。
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+CACHE_FORMAT = 1
+MANIFEST_NAME = "manifest.json"
+# ensure_cache 的状态 → load_baseline_table 返回的来源
+STATUS_ORIGINS = {"hit": "cache", "touched": "cache-touched", "rebuilt": "parsed"}
+
+
+# --------------------------------------------------------------------------- #
+# 源文件
+# --------------------------------------------------------------------------- #
+def read_source(path: str) -> pd.DataFrame:
+    """按扩展名解析 CSV（utf-8-sig）或 XLSX（需要 openpyxl）"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension in (".xlsx", ".xlsm"):
+        try:
+            import openpyxl  # noqa: F401
+        except ImportError as e:
+            raise ImportError("读取 XLSX 基准数据需要安装 openpyxl：pip install openpyxl") from e
+        return pd.read_excel(path, engine="openpyxl")
+    return pd.read_csv(path, encoding="utf-8-sig")
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cache_dir_for(source_path: str, cache_root: str | None = None) -> str:
+    """每个源文件一个缓存目录：<cache_root>/<文件名>-<路径哈希>"""
+    cache_root = cache_root or os.getenv("BASELINE_CACHE_DIR") or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), ".cache", "baseline"
+    )
+    source_path = os.path.abspath(source_path)
+    stem = "".join(c if c.isalnum() else "_" for c in os.path.basename(source_path))
+    path_hash = hashlib.sha1(source_path.encode("utf-8")).hexdigest()[:8]
+    return os.path.join(cache_root, f"{stem}-{path_hash}")
+
+
+# --------------------------------------------------------------------------- #
+# 编码 / 写入
+# --------------------------------------------------------------------------- #
+def encode_column(series: pd.Series) -> Tuple[str, Dict[str, np.ndarray]]:
+    """返回 (kind, 数组)；kind 为 numeric（原样保存）或 category（codes + categories）"""
+    if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        return "numeric", {"values": series.to_numpy()}
+    if pd.api.types.is_bool_dtype(series):
+        return "numeric", {"values": series.to_numpy(dtype=bool)}
+
+    categorical = pd.Categorical(series.astype("string"))
+    categories = np.asarray(list(categorical.categories.astype(str)), dtype=str)
+    if not len(categories):
+        categories = np.empty(0, dtype="<U1")
+    return "category", {
+        "codes": np.asarray(categorical.codes, dtype=np.int32),
+        "categories": categories,
+    }
+
+
+def _write_version(df: pd.DataFrame, version_dir: str) -> List[Dict[str, Any]]:
+    """把 DataFrame 写成 version_dir 下的 .npy 文件，返回列描述"""
+    columns = []
+    for i, name in enumerate(df.columns):
+        kind, arrays = encode_column(df[name])
+        entry: Dict[str, Any] = {"name": str(name), "kind": kind}
+        for part, array in arrays.items():
+            filename = f"col{i}.{part}.npy"
+            np.save(os.path.join(version_dir, filename), array, allow_pickle=False)
+            entry[part] = filename
+        columns.append(entry)
+    return columns
+
+
+def _write_manifest(directory: str, manifest: Dict[str, Any]) -> None:
+    """先写临时文件再 os.replace，读取者看到的要么是旧 manifest 要么是新 manifest"""
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".manifest-", suffix=".json")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, os.path.join(directory, MANIFEST_NAME))
+
+
+def read_manifest(directory: str) -> Dict[str, Any] | None:
+    try:
+        with open(os.path.join(directory, MANIFEST_NAME), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return manifest if manifest.get("format") == CACHE_FORMAT else None
+
+
+def build_cache(source_path: str, directory: str, sha256: str | None = None) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+    """解析源文件并写入新的内容版本；返回 (解析出的 DataFrame, manifest)"""
+    stat = os.stat(source_path)
+    sha256 = sha256 or file_sha256(source_path)
+    df = read_source(source_path)
+
+    os.makedirs(directory, exist_ok=True)
+    version = sha256[:16]
+    version_dir = os.path.join(directory, version)
+    staging = tempfile.mkdtemp(dir=directory, prefix=".build-")
+    try:
+        columns = _write_version(df, staging)
+        if os.path.isdir(version_dir):
+            shutil.rmtree(staging)
+        else:
+            os.replace(staging, version_dir)
+    except Exception:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    manifest = {
+        "format": CACHE_FORMAT,
+        "source": os.path.abspath(source_path),
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "sha256": sha256,
+        "version": version,
+        "rows": len(df),
+        "columns": columns,
+    }
+    _write_manifest(directory, manifest)
+    _remove_stale_versions(directory, keep=version)
+    return df, manifest
+
+
+def _keep_versions() -> int:
+    """除当前版本外保留的旧版本个数（BASELINE_CACHE_KEEP_VERSIONS，默认 1）"""
+    try:
+        return max(0, int(os.getenv("BASELINE_CACHE_KEEP_VERSIONS", "1")))
+    except ValueError:
+        print("[WARN] BASELINE_CACHE_KEEP_VERSIONS 不是整数，按 1 处理")
+        return 1
+
+
+def _remove_stale_versions(directory: str, keep: str) -> None:
+    """
+    删除更早的内容版本。紧邻的上一个版本（按目录 mtime）默认保留：
+    其他进程可能刚读到旧 manifest、正在 load_columns，或仍在映射旧版本的文件。
+    """
+    versions = []
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if name != keep and os.path.isdir(path) and not name.startswith(".build-"):
+            try:
+                versions.append((os.stat(path).st_mtime_ns, path))
+            except OSError:
+                continue
+    versions.sort(reverse=True)
+    for _, path in versions[_keep_versions():]:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+# --------------------------------------------------------------------------- #
+# 读取
+# --------------------------------------------------------------------------- #
+def load_columns(directory: str, manifest: Dict[str, Any], mmap_mode: str | None = None) -> Dict[str, Dict[str, np.ndarray]]:
+    """按 manifest 读取（或内存映射）各列的 .npy 文件"""
+    version_dir = os.path.join(directory, manifest["version"])
+    columns = {}
+    for entry in manifest["columns"]:
+        columns[entry["name"]] = {
+            part: np.load(os.path.join(version_dir, entry[part]), mmap_mode=mmap_mode, allow_pickle=False)
+            for part in ("values", "codes", "categories")
+            if part in entry
+        }
+    return columns
+
+
+def frame_from_columns(manifest: Dict[str, Any], arrays: Dict[str, Dict[str, np.ndarray]]) -> pd.DataFrame:
+    """把列数组还原为 DataFrame：字符串列为 Categorical，缺失值为 NaN"""
+    data = {}
+    for entry in manifest["columns"]:
+        parts = arrays[entry["name"]]
+        if entry["kind"] == "numeric":
+            data[entry["name"]] = np.asarray(parts["values"])
+        else:
+            data[entry["name"]] = pd.Categorical.from_codes(
+                np.asarray(parts["codes"]), categories=pd.Index(parts["categories"].tolist(), dtype=object)
+            )
+    return pd.DataFrame(data, columns=[entry["name"] for entry in manifest["columns"]])
+
+
+def ensure_cache(source_path: str, cache_root: str | None = None) -> Tuple[str, Dict[str, Any], str]:
+    """
+    保证源文件的列式缓存是最新的，返回 (缓存目录, manifest, 状态)；
+    状态为 hit（直接复用）/ touched（mtime 变了但内容未变）/ rebuilt（重新解析）
+    """
+    directory = cache_dir_for(source_path, cache_root)
+    manifest = read_manifest(directory)
+    stat = os.stat(source_path)
+
+    if manifest is not None and manifest["size"] == stat.st_size and manifest["mtime_ns"] == stat.st_mtime_ns:
+        return directory, manifest, "hit"
+
+    sha256 = file_sha256(source_path)
+    if manifest is not None and manifest["sha256"] == sha256 and os.path.isdir(os.path.join(directory, manifest["version"])):
+        manifest = dict(manifest, size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+        _write_manifest(directory, manifest)
+        return directory, manifest, "touched"
+
+    _, manifest = build_cache(source_path, directory, sha256)
+    return directory, manifest, "rebuilt"
+
+
+def load_baseline_table(source_path: str, cache_root: str | None = None) -> Tuple[pd.DataFrame, str]:
+    """
+    读取基准费率表，返回 (DataFrame, 来源)；来源为 cache / cache-touched / parsed（已写缓存）/ source（未用缓存）。
+    缓存不可用（关闭、目录不可写等）时退回直接解析源文件。
+    """
+    if os.getenv("BASELINE_CACHE", "on").strip().lower() in ("off", "0", "false", "no"):
+        return read_source(source_path), "source"
+
+    # 读取期间其他进程可能重建缓存并清理掉刚读到的版本（FileNotFoundError 等），重新取一次 manifest 再读
+    for attempt in range(2):
+        try:
+            directory, manifest, status = ensure_cache(source_path, cache_root)
+            df = frame_from_columns(manifest, load_columns(directory, manifest))
+            return df, STATUS_ORIGINS[status]
+        except (OSError, ValueError, KeyError) as e:
+            if not os.path.exists(source_path):
+                raise
+            if attempt == 0:
+                print(f"[WARN] 读取基准数据列式缓存失败（{e}），重新检查缓存后重试")
+                continue
+            print(f"[WARN] 基准数据列式缓存不可用（{e}），直接解析源文件")
+    return read_source(source_path), "source"
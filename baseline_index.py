@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+"""
+baseline_index.py — CSV 基准数据的内存索引
+功能：
+- 加载时对 (Location, sub_process step, material_name) 做规范化（去首尾空白、折叠空白、统一大小写）
+- 以规范化后的三元组建立哈希索引，精确查询为 O(1)
+- 材料为空 / "Nan" 的行视为“与材料无关”，可被任意材料命中（如检测、包装类工序）
+- 精确未命中时，用工序名的 n-gram 模糊索引匹配（"Machining OP10" → "Maching OP10"）
+- 模糊匹配命中的多道工序只差编号（"Machining" → OP20 / OP30）时返回 "ambiguous" 与候选，不静默选一个
+- 保留子串匹配作为最后的兜底路径，兼容 "Ningbo" 命中 "Ningbo, Zhejiang" 这类简写
+- 按零件号（part_number）索引整条工艺路线，供 cost_part 整件核算使用
+- 每个键分组的区间 / 中值 / 行数 / 最近 valid_time / 供应商拆分在加载时预计算（见 baseline_aggregate.py）
+- valid_time 解析一次为日期列，按键分组建立有序时间索引，支持 as_of 回溯查询（见 baseline_timeline.py）
+"""
+
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from baseline_aggregate import BaselineAggregates, summarize_rows, valid_time_column
+from baseline_timeline import TimeIndex, latest_rows, to_day
+from fuzzy_matcher import NGramMatcher, same_numbering_family
+
+LOCATION_COLUMN = "Location"
+STEP_COLUMN = "sub_process step"
+MATERIAL_COLUMN = "material_name"
+KEY_COLUMNS = (LOCATION_COLUMN, STEP_COLUMN, MATERIAL_COLUMN)
+PART_COLUMN = "part_number"
+
+# CSV 中表示“无材料”的占位值
+_EMPTY_MARKERS = {"", "nan", "none", "null"}
+_NO_ROWS = np.empty(0, dtype=np.intp)
+
+# 模糊匹配最低分数（Dice 系数）与候选数量
+FUZZY_MIN_SCORE = 0.6
+FUZZY_CANDIDATES = 5
+
+
+def normalize_text(value: Any) -> str:
+    """规范化单个键值：去首尾空白、折叠内部空白、casefold；空值统一为空字符串"""
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return ""
+    text = " ".join(str(value).split()).casefold()
+    return "" if text in _EMPTY_MARKERS else text
+
+
+def normalize_column(series: pd.Series) -> np.ndarray:
+    """向量化规范化一整列，返回 object 数组"""
+    normalized = (
+        series.astype("string")
+        .str.strip()
+        .str.replace(r"\s+", " ", regex=True)
+        .str.casefold()
+        .fillna("")
+    )
+    normalized = normalized.mask(normalized.isin(_EMPTY_MARKERS), "")
+    return normalized.to_numpy(dtype=object)
+
+
+class BaselineIndex:
+    """基准数据索引：构建一次，之后每次查询不再扫描整张表"""
+
+    def __init__(self, df: pd.DataFrame | None = None) -> None:
+        """df 为 None 时只初始化为空索引（子类在此基础上填充自己的存储）"""
+        self._df = pd.DataFrame() if df is None else df
+        self._normalized: Dict[str, np.ndarray] = {}
+        self._exact: Dict[Tuple[str, str, str], np.ndarray] = {}
+        self._locations: List[str] = []
+        self._parts: Dict[str, np.ndarray] = {}
+        self._group = _NO_ROWS
+        self._aggregates: BaselineAggregates | None = None
+        self._valid_time = np.empty(0, dtype="datetime64[D]")
+        self._timeline: TimeIndex | None = None
+        self.step_matcher = NGramMatcher(())
+
+        if df is None or df.empty or not all(column in df.columns for column in KEY_COLUMNS):
+            return
+
+        for column in KEY_COLUMNS:
+            self._normalized[column] = normalize_column(df[column])
+
+        keys = pd.DataFrame(
+            {column: self._normalized[column] for column in KEY_COLUMNS}
+        )
+        # groupby.indices 一次遍历得到 “键 → 行号数组”；ngroup 为每行的分组号
+        grouped = keys.groupby(list(KEY_COLUMNS), sort=False)
+        self._exact = {tuple(key): positions for key, positions in grouped.indices.items()}
+        self._group = grouped.ngroup().to_numpy()
+        self._valid_time = valid_time_column(df)
+        self._aggregates = BaselineAggregates.build(df, self._group, grouped.ngroups, self._valid_time)
+        self._timeline = TimeIndex.build(self._group, self._valid_time, grouped.ngroups)
+
+        # 模糊匹配只针对去重后的词表构建，与行数无关
+        self._locations = sorted({key[0] for key in self._exact})
+        self.step_matcher = NGramMatcher(key[1] for key in self._exact)
+
+        # 零件号 → 行号数组（保持 CSV 中的工序顺序）
+        if PART_COLUMN in df.columns:
+            parts = pd.Series(normalize_column(df[PART_COLUMN]))
+            self._parts = {
+                part: positions
+                for part, positions in parts.groupby(parts, sort=False).indices.items()
+                if part
+            }
+
+    @property
+    def df(self) -> pd.DataFrame:
+        return self._df
+
+    def __len__(self) -> int:
+        return len(self.df)
+
+    @property
+    def empty(self) -> bool:
+        return not self._exact
+
+    # ------------------------------------------------------------------ #
+    # 查询
+    # ------------------------------------------------------------------ #
+    def _key_rows(self, key: Tuple[str, str, str]) -> np.ndarray | None:
+        """规范化三元组 → 行号数组；不存在时返回 None"""
+        return self._exact.get(key)
+
+    def lookup_exact(self, location: str, step: str, material: str) -> np.ndarray:
+        """规范化后精确匹配；材料未命中时退回到“与材料无关”的行"""
+        key = (normalize_text(location), normalize_text(step), normalize_text(material))
+        positions = self._key_rows(key)
+        if positions is None and key[2]:
+            positions = self._key_rows((key[0], key[1], ""))
+        return _NO_ROWS if positions is None else positions
+
+    def _contains(self, column: str, value: str) -> np.ndarray:
+        needle = normalize_text(value)
+        if not needle:
+            return np.ones(len(self.df), dtype=bool)
+        return np.fromiter(
+            (needle in text for text in self._normalized[column]),
+            dtype=bool,
+            count=len(self.df),
+        )
+
+    def _blank(self, column: str) -> np.ndarray:
+        return self._normalized[column] == ""
+
+    def lookup_substring(self, location: str, step: str, material: str) -> np.ndarray:
+        """次级路径：与旧实现一致的“包含”匹配（大小写不敏感，不解析正则）"""
+        if self.empty:
+            return _NO_ROWS
+
+        mask = self._contains(LOCATION_COLUMN, location) & self._contains(STEP_COLUMN, step)
+        matched = mask & self._contains(MATERIAL_COLUMN, material)
+        if not matched.any():
+            matched = mask & self._blank(MATERIAL_COLUMN)
+        return np.flatnonzero(matched)
+
+    def match_steps(self, step: str, limit: int = FUZZY_CANDIDATES) -> List[Tuple[str, float]]:
+        """返回与工序名最相近的候选 [(规范化工序名, 分数)]，按分数降序"""
+        return self.step_matcher.search(step, limit=limit)
+
+    def _fuzzy_matches(self, location: str, step: str, material: str) -> List[Tuple[str, np.ndarray, float]]:
+        """
+        工序名走 n-gram 模糊匹配，地区允许简写（在去重后的地区词表上做包含匹配）；
+        按候选分数从高到低，返回在精确索引中有数据的 [(候选工序名, 行号数组, 分数)]。
+        """
+        loc = normalize_text(location)
+        locations = [loc] if loc in self._locations else [
+            known for known in self._locations if loc and loc in known
+        ]
+        mat = normalize_text(material)
+
+        matches = []
+        for candidate, score in self.step_matcher.search(
+            step, limit=FUZZY_CANDIDATES, min_score=FUZZY_MIN_SCORE
+        ):
+            for known_location in locations:
+                positions = self._key_rows((known_location, candidate, mat))
+                if positions is None and mat:
+                    positions = self._key_rows((known_location, candidate, ""))
+                if positions is not None:
+                    matches.append((candidate, positions, score))
+                    break
+        return matches
+
+    def lookup_fuzzy(self, location: str, step: str, material: str) -> Tuple[np.ndarray, float]:
+        """模糊匹配得分最高且有数据的工序，返回 (行号数组, 分数)"""
+        matches = self._fuzzy_matches(location, step, material)
+        if not matches:
+            return _NO_ROWS, 0.0
+        return matches[0][1], matches[0][2]
+
+    def ambiguous_steps(self, location: str, step: str, material: str) -> List[str]:
+        """
+        最佳模糊候选与其它只差编号、同样有数据的候选（如 ["machining op20", "machining op30"]）；
+        不到两个时返回空列表
+        """
+        matches = self._fuzzy_matches(location, step, material)
+        if not matches:
+            return []
+        best = matches[0][0]
+        family = [best] + [name for name, _, _ in matches[1:] if same_numbering_family(best, name)]
+        return family if len(family) > 1 else []
+
+    def lookup(self, location: str, step: str, material: str) -> Tuple[np.ndarray, str, float]:
+        """
+        依次走精确索引 → 模糊匹配 → 子串匹配；返回 (行号数组, 匹配方式, 分数)。
+        模糊匹配到的多道工序只差编号时返回 (空, "ambiguous", 最高分)，候选见 ambiguous_steps，
+        且不再走子串匹配（否则会把几道工序的行混在一起）。
+        """
+        positions = self.lookup_exact(location, step, material)
+        if len(positions):
+            return positions, "exact", 1.0
+
+        matches = self._fuzzy_matches(location, step, material)
+        if matches:
+            best, positions, score = matches[0]
+            if any(same_numbering_family(best, name) for name, _, _ in matches[1:]):
+                return _NO_ROWS, "ambiguous", score
+            return positions, "fuzzy", score
+
+        positions = self.lookup_substring(location, step, material)
+        if len(positions):
+            return positions, "substring", 0.0
+
+        return _NO_ROWS, "none", 0.0
+
+    def row(self, position: int) -> pd.Series:
+        return self.df.iloc[position]
+
+    def as_of(self, positions: np.ndarray, method: str, as_of: Any) -> np.ndarray:
+        """
+        把匹配行收窄到 as_of 日期（含）之前最近一个生效日的行；
+        精确 / 模糊匹配在分组时间索引上二分查找，子串匹配的行集合直接过滤。
+        """
+        day = to_day(as_of)
+        if method in ("exact", "fuzzy"):
+            return self._timeline.latest(int(self._group[positions[0]]), day)
+        return latest_rows(positions, self._valid_time, day)
+
+    def valid_time(self, position: int) -> str | None:
+        """某行解析后的生效日期（ISO 格式）"""
+        day = self._valid_time[position]
+        return None if np.isnat(day) else str(day)
+
+    def _rows_frame(self, positions: np.ndarray) -> pd.DataFrame:
+        return self.df.iloc[positions]
+
+    def summarize(self, positions: np.ndarray, method: str) -> Dict[str, Any]:
+        """
+        匹配行的汇总：min / median / max 区间、行数、最近 valid_time 与供应商拆分。
+        精确 / 模糊匹配命中的是整个键分组，直接取预计算结果；子串匹配的行集合现场统计。
+        """
+        if method in ("exact", "fuzzy"):
+            return self._aggregates.envelope(int(self._group[positions[0]]))
+        return summarize_rows(self._rows_frame(positions))
+
+    # ------------------------------------------------------------------ #
+    # 零件工艺路线
+    # ------------------------------------------------------------------ #
+    @property
+    def part_numbers(self) -> List[str]:
+        """CSV 中出现的零件号（原始写法，按首次出现顺序）"""
+        return [str(self.df[PART_COLUMN].iloc[positions[0]]).strip() for positions in self._parts.values()]
+
+    def routing(self, part_number: str) -> pd.DataFrame:
+        """返回零件的全部工艺路线行（原料 + 增值工序，保持 CSV 顺序）；未知零件号返回空表"""
+        positions = self._parts.get(normalize_text(part_number))
+        if positions is None:
+            return self.df.iloc[0:0]
+        return self.df.iloc[np.sort(positions)]
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+baseline_reloader.py — 基准费率文件的热加载（轮询）
+功能：
+- 后台守护线程按固定间隔检查源文件的 大小 / mtime
+- 发现变化后先等文件“稳定”（连续两次轮询签名一致，避免读到正在写入的文件），
+  再在后台线程中完整构建新索引，最后一次赋值替换（对读取方是原子的）
+- 加载失败时保留旧索引并打印警告，文件再次变化时重试
+- 正在进行的查询持有旧索引的引用，不会看到加载了一半的表
+用法：ProcessRateFinderTool 设置 BASELINE_RELOAD_INTERVAL（秒）后自动启动，
+也可调用 tool.start_baseline_reloader() / tool.reload_baseline()。
+"""
+
+import os
+import threading
+from typing import Any, Callable, Tuple
+
+Signature = Tuple[int, int]
+
+
+def file_signature(path: str) -> Signature | None:
+    """(大小, mtime_ns)；文件不存在时返回 None"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+class BaselineReloader:
+    """
+    轮询 path，变化且稳定后调用 load() 构建新对象，再交给 apply() 完成替换。
+    load 在重载线程中执行，可以很慢；apply 只应做一次赋值。
+    """
+
+    def __init__(
+        self,
+        path: str,
+        load: Callable[[], Any],
+        apply: Callable[[Any], None],
+        interval: float = 5.0,
+    ) -> None:
+        self.path = path
+        self.load = load
+        self.apply = apply
+        self.interval = interval
+        self.reloads = 0
+        self.failures = 0
+        self._loaded = file_signature(path)
+        self._pending: Signature | None = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    # ------------------------------------------------------------------ #
+    # 重载
+    # ------------------------------------------------------------------ #
+    def reload(self) -> bool:
+        """立即重新加载（不检查签名）；成功返回 True，失败保留旧索引并返回 False"""
+        with self._lock:
+            signature = file_signature(self.path)
+            try:
+                loaded = self.load()
+            except Exception as e:
+                self.failures += 1
+                self._loaded = signature
+                print(f"[WARN] ⚠️ 基准数据重新加载失败，继续使用旧数据：{e}")
+                return False
+
+            if file_signature(self.path) != signature:
+                # 加载期间文件又被改写，丢弃这次结果，等下一轮
+                print("[INFO] 基准数据在加载过程中再次变化，稍后重新加载")
+                return False
+
+            self.apply(loaded)
+            self._loaded = signature
+            self.reloads += 1
+            print(f"[INFO] 🔄 基准数据已重新加载：{self.path}")
+            return True
+
+    def check(self) -> bool:
+        """一次轮询：签名变化且与上一轮一致（文件已稳定）时重新加载"""
+        signature = file_signature(self.path)
+        if signature is None or signature == self._loaded:
+            self._pending = None
+            return False
+        if signature != self._pending:
+            self._pending = signature
+            return False
+        self._pending = None
+        return self.reload()
+
+    # ------------------------------------------------------------------ #
+    # 后台线程
+    # ------------------------------------------------------------------ #
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                print(f"[WARN] ⚠️ 基准数据热加载检查失败：{e}")
+
+    def start(self) -> "BaselineReloader":
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="baseline-reloader", daemon=True)
+            self._thread.start()
+            print(f"[INFO] 👀 基准数据热加载已开启：每 {self.interval:g} 秒检查 {self.path}")
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 1)
+            self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
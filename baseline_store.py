@@ -0,0 +1,355 @@
+# -*- coding: utf-8 -*-
+"""
+baseline_store.py — 基于内存映射列文件的只读基准数据存储
+功能：
+- 直接内存映射 baseline_cache 写出的 .npy 列文件（mmap_mode="r"），不解析 CSV、不构建 DataFrame；
+  同一台机器上的多个工作进程通过页缓存共享同一份物理内存
+- 键列（Location / sub_process step / material_name / part_number）的规范化字典（有序 unicode 数组）
+  与每行 int32 编码在首次打开某个内容版本时写入 <版本目录>/index/，之后各进程只映射行编码，
+  字典按去重后的取值个数加载（与行数无关）
+- 精确查询：三个编码合成一个 int64 键，在排好序的键数组上二分查找（np.searchsorted），
+  材料无关行、模糊匹配与子串匹配的语义与 BaselineIndex 完全一致
+- 键分组的汇总统计（baseline_aggregate.py）、解析后的 valid_time 列与时间索引（baseline_timeline.py）
+  同样随键索引保存并内存映射
+- 行数据按需从映射数组解码；只有访问 .df 时才物化完整 DataFrame
+环境变量：BASELINE_STORE=mmap|memory（见 process_rate_finder_tool.py），缓存目录沿用 BASELINE_CACHE_DIR。
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from baseline_aggregate import (
+    HIGH_COLUMN,
+    LOW_COLUMN,
+    SUPPLIER_COLUMN,
+    VALID_TIME_COLUMN,
+    BaselineAggregates,
+    valid_time_column,
+)
+from baseline_cache import STATUS_ORIGINS, ensure_cache, frame_from_columns, load_columns
+from baseline_index import (
+    KEY_COLUMNS,
+    PART_COLUMN,
+    BaselineIndex,
+    normalize_column,
+    normalize_text,
+)
+from baseline_timeline import TimeIndex
+from fuzzy_matcher import NGramMatcher
+
+INDEX_FORMAT = 3
+INDEX_DIRNAME = "index"
+INDEX_META = "index.json"
+
+_NO_ROWS = np.empty(0, dtype=np.intp)
+
+
+# --------------------------------------------------------------------------- #
+# 构建键索引（每个内容版本只做一次）
+# --------------------------------------------------------------------------- #
+def _normalized_codes(entry: Dict[str, Any], arrays: Dict[str, np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    一列 → (规范化后的有序字典, 每行 int32 编码)。
+    只对原始字典做规范化，与行数无关；空值 / "nan" 等占位统一编码为空字符串。
+    """
+    if entry["kind"] == "category":
+        raw_codes = np.asarray(arrays["codes"])
+        raw_values = arrays["categories"].tolist()
+    else:
+        raw_codes, uniques = pd.factorize(pd.Series(np.asarray(arrays["values"])))
+        raw_values = list(uniques)
+
+    normalized = normalize_column(pd.Series(raw_values + [""], dtype=object))
+    vocabulary, remap = np.unique(normalized.astype(str), return_inverse=True)
+    # remap 最后一项是追加的空字符串，缺失值（code = -1）恰好索引到它
+    codes = remap.astype(np.int32)[raw_codes]
+    return np.asarray(vocabulary, dtype=str), codes
+
+
+def _save(directory: str, name: str, array: np.ndarray) -> None:
+    np.save(os.path.join(directory, f"{name}.npy"), array, allow_pickle=False)
+
+
+def build_index(version_dir: str, manifest: Dict[str, Any]) -> None:
+    """在版本目录下写入 index/；先写临时目录再 os.replace，并发进程重复构建时保留先完成的一份"""
+    index_dir = os.path.join(version_dir, INDEX_DIRNAME)
+    entries = {entry["name"]: entry for entry in manifest["columns"]}
+    arrays = load_columns(os.path.dirname(version_dir), manifest, mmap_mode="r")
+    meta: Dict[str, Any] = {"format": INDEX_FORMAT, "version": manifest["version"], "rows": manifest["rows"], "columns": {}}
+
+    staging = tempfile.mkdtemp(dir=version_dir, prefix=".index-")
+    try:
+        for i, column in enumerate(KEY_COLUMNS + (PART_COLUMN,)):
+            if column not in entries:
+                continue
+            vocabulary, codes = _normalized_codes(entries[column], arrays[column])
+            _save(staging, f"key{i}.vocabulary", vocabulary)
+            _save(staging, f"key{i}.codes", codes)
+            meta["columns"][column] = {"file": f"key{i}", "size": len(vocabulary)}
+
+        if all(column in meta["columns"] for column in KEY_COLUMNS):
+            # 三元组编码合成 int64 键；稳定排序保证同键行保持 CSV 顺序
+            composite = np.zeros(manifest["rows"], dtype=np.int64)
+            for i, column in enumerate(KEY_COLUMNS):
+                size = meta["columns"][column]["size"]
+                composite = composite * size + np.load(os.path.join(staging, f"key{i}.codes.npy"))
+            order = np.argsort(composite, kind="stable")
+            _save(staging, "triple.keys", composite[order])
+            _save(staging, "triple.rows", order.astype(np.int64))
+
+            # 分组号 = 三元组键在去重键表中的位置；各分组的汇总统计随索引一起保存
+            unique, groups = np.unique(composite, return_inverse=True)
+            _save(staging, "triple.groups", groups.astype(np.int64))
+            rate_columns = [
+                entries[column] for column in (LOW_COLUMN, HIGH_COLUMN, SUPPLIER_COLUMN, VALID_TIME_COLUMN)
+                if column in entries
+            ]
+            rates = frame_from_columns({"columns": rate_columns}, arrays)
+            valid_time = valid_time_column(rates)
+            _save(staging, "valid_time", valid_time)
+            BaselineAggregates.build(rates, groups, len(unique), valid_time).save(staging)
+            TimeIndex.build(groups, valid_time, len(unique)).save(staging)
+
+        if PART_COLUMN in meta["columns"]:
+            codes = np.load(os.path.join(staging, f"key{len(KEY_COLUMNS)}.codes.npy"))
+            order = np.argsort(codes, kind="stable")
+            _save(staging, "part.keys", codes[order])
+            _save(staging, "part.rows", order.astype(np.int64))
+
+        with open(os.path.join(staging, INDEX_META), "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+
+        if read_index_meta(version_dir) is not None:
+            shutil.rmtree(staging)
+            return
+        # 旧格式的索引整体替换；替换失败说明另一个进程刚写好，保留它的即可
+        shutil.rmtree(index_dir, ignore_errors=True)
+        try:
+            os.replace(staging, index_dir)
+        except OSError:
+            shutil.rmtree(staging, ignore_errors=True)
+    except Exception:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+
+def read_index_meta(version_dir: str) -> Dict[str, Any] | None:
+    try:
+        with open(os.path.join(version_dir, INDEX_DIRNAME, INDEX_META), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return meta if meta.get("format") == INDEX_FORMAT else None
+
+
+# --------------------------------------------------------------------------- #
+# 只读存储
+# --------------------------------------------------------------------------- #
+def _mapped(path: str) -> np.ndarray:
+    """只读内存映射；转成普通 ndarray 视图（仍指向映射内存），避免 np.memmap 子类的逐次开销"""
+    return np.asarray(np.load(path, mmap_mode="r"))
+
+
+class _MappedColumn:
+    """一个键列的规范化字典与行编码（行编码为内存映射）"""
+
+    def __init__(self, index_dir: str, file: str) -> None:
+        self.codes = _mapped(os.path.join(index_dir, f"{file}.codes.npy"))
+        # 字典的 Python 形式（词表 + 反查表）大小与去重后的取值个数相同，与行数无关
+        self.words: List[str] = np.load(os.path.join(index_dir, f"{file}.vocabulary.npy")).tolist()
+        self._codes = {word: i for i, word in enumerate(self.words)}
+        self.blank = self.code("")
+
+    def code(self, text: str) -> int:
+        """规范化文本 → 编码；不在字典中时返回 -1"""
+        return self._codes.get(text, -1)
+
+
+class MappedBaselineStore(BaselineIndex):
+    """
+    与 BaselineIndex 接口一致的只读存储（lookup / row / routing / part_numbers / empty）；
+    ProcessRateFinderTool._query_csv_baseline 与 cost_part 可直接替换使用。
+    """
+
+    def __init__(self, directory: str, manifest: Dict[str, Any]) -> None:
+        """
+        打开时一次性映射 / 加载全部列文件与索引文件；之后的查询只访问已映射的数组，
+        不再按路径打开文件（版本目录随后被清理也不影响，POSIX 上已映射的文件删除后仍可读）
+        """
+        super().__init__()
+        self.directory = directory
+        self.manifest = manifest
+        self.version_dir = os.path.join(directory, manifest["version"])
+        self._rows = int(manifest["rows"])
+        self._columns = {
+            name: {part: np.asarray(array) for part, array in parts.items()}
+            for name, parts in load_columns(directory, manifest, mmap_mode="r").items()
+        }
+        self._kinds = {entry["name"]: entry["kind"] for entry in manifest["columns"]}
+        self._categories = {
+            name: parts["categories"].tolist() for name, parts in self._columns.items() if "categories" in parts
+        }
+        self._frame: pd.DataFrame | None = None
+        self._frame_lock = threading.Lock()
+
+        meta = read_index_meta(self.version_dir)
+        if meta is None:
+            build_index(self.version_dir, manifest)
+            meta = read_index_meta(self.version_dir)
+        index_dir = os.path.join(self.version_dir, INDEX_DIRNAME)
+        self._keys: Dict[str, _MappedColumn] = {
+            column: _MappedColumn(index_dir, info["file"]) for column, info in meta["columns"].items()
+        }
+
+        self._triple_keys = self._triple_rows = None
+        if all(column in self._keys for column in KEY_COLUMNS) and self._rows:
+            self._triple_keys = _mapped(os.path.join(index_dir, "triple.keys.npy"))
+            self._triple_rows = _mapped(os.path.join(index_dir, "triple.rows.npy"))
+            self._group = _mapped(os.path.join(index_dir, "triple.groups.npy"))
+            self._aggregates = BaselineAggregates.load(index_dir, mmap_mode="r")
+            self._valid_time = _mapped(os.path.join(index_dir, "valid_time.npy"))
+            self._timeline = TimeIndex.load(index_dir, mmap_mode="r")
+            location, step, _ = (self._keys[column] for column in KEY_COLUMNS)
+            self._locations = location.words
+            self.step_matcher = NGramMatcher(step.words)
+
+        self._part_keys = self._part_rows = None
+        if PART_COLUMN in self._keys:
+            self._part_keys = _mapped(os.path.join(index_dir, "part.keys.npy"))
+            self._part_rows = _mapped(os.path.join(index_dir, "part.rows.npy"))
+
+    def __len__(self) -> int:
+        return self._rows
+
+    @property
+    def empty(self) -> bool:
+        return self._triple_keys is None
+
+    @property
+    def df(self) -> pd.DataFrame:
+        """完整 DataFrame（首次访问时物化，仅供需要整表的调用方使用）"""
+        if self._frame is None:
+            with self._frame_lock:
+                if self._frame is None:
+                    self._frame = frame_from_columns(self.manifest, self._columns)
+        return self._frame
+
+    # ------------------------------------------------------------------ #
+    # BaselineIndex 的存储相关钩子
+    # ------------------------------------------------------------------ #
+    @staticmethod
+    def _range(keys: np.ndarray, rows: np.ndarray, key: int) -> np.ndarray | None:
+        lo = int(np.searchsorted(keys, key, side="left"))
+        hi = int(np.searchsorted(keys, key, side="right"))
+        return np.asarray(rows[lo:hi], dtype=np.intp) if hi > lo else None
+
+    def _key_rows(self, key: Tuple[str, str, str]) -> np.ndarray | None:
+        if self.empty:
+            return None
+        composite = 0
+        for column, text in zip(KEY_COLUMNS, key):
+            mapped = self._keys[column]
+            code = mapped.code(text)
+            if code < 0:
+                return None
+            composite = composite * len(mapped.words) + code
+        return self._range(self._triple_keys, self._triple_rows, composite)
+
+    def _contains(self, column: str, value: str) -> np.ndarray:
+        needle = normalize_text(value)
+        if not needle:
+            return np.ones(self._rows, dtype=bool)
+        mapped = self._keys[column]
+        # 在字典上判断一次，再按行编码展开
+        hits = np.fromiter((needle in word for word in mapped.words), dtype=bool, count=len(mapped.words))
+        return hits[mapped.codes]
+
+    def _blank(self, column: str) -> np.ndarray:
+        mapped = self._keys[column]
+        return np.asarray(mapped.codes) == mapped.blank
+
+    # ------------------------------------------------------------------ #
+    # 行数据
+    # ------------------------------------------------------------------ #
+    def _value(self, name: str, position: int) -> Any:
+        parts = self._columns[name]
+        if self._kinds[name] == "numeric":
+            return parts["values"][position].item()
+        code = int(parts["codes"][position])
+        return self._categories[name][code] if code >= 0 else np.nan
+
+    def row(self, position: int) -> Dict[str, Any]:
+        """单行 {列名: 值}，缺失的字符串值为 NaN（与 DataFrame 行的 .get 用法兼容）"""
+        return {name: self._value(name, int(position)) for name in self._columns}
+
+    def _rows_frame(self, positions: np.ndarray) -> pd.DataFrame:
+        data = {}
+        for name, parts in self._columns.items():
+            if self._kinds[name] == "numeric":
+                data[name] = np.asarray(parts["values"][positions])
+            else:
+                data[name] = pd.Categorical.from_codes(
+                    np.asarray(parts["codes"][positions]),
+                    categories=pd.Index(self._categories[name], dtype=object),
+                )
+        return pd.DataFrame(data, index=positions, columns=list(self._columns))
+
+    # ------------------------------------------------------------------ #
+    # 零件工艺路线
+    # ------------------------------------------------------------------ #
+    @property
+    def part_numbers(self) -> List[str]:
+        if self._part_keys is None:
+            return []
+        mapped = self._keys[PART_COLUMN]
+        codes, first = np.unique(np.asarray(mapped.codes), return_index=True)
+        first = np.sort(first[codes != mapped.blank])
+        return [str(self._value(PART_COLUMN, int(position))).strip() for position in first]
+
+    def routing(self, part_number: str) -> pd.DataFrame:
+        positions = None
+        if self._part_keys is not None:
+            code = self._keys[PART_COLUMN].code(normalize_text(part_number))
+            if code >= 0 and code != self._keys[PART_COLUMN].blank:
+                positions = self._range(self._part_keys, self._part_rows, code)
+        return self._rows_frame(_NO_ROWS if positions is None else positions)
+
+
+# --------------------------------------------------------------------------- #
+# 打开
+# --------------------------------------------------------------------------- #
+_STORES: Dict[Tuple[str, str], MappedBaselineStore] = {}
+_STORES_LOCK = threading.Lock()
+
+
+def _open_store(source_path: str, cache_root: str | None) -> Tuple[MappedBaselineStore, str]:
+    directory, manifest, status = ensure_cache(source_path, cache_root)
+    key = (directory, manifest["version"])
+    with _STORES_LOCK:
+        store = _STORES.get(key)
+        if store is None:
+            # 源文件内容变化后旧版本不再复用（已持有旧存储的调用方仍可继续读取）
+            for stale in [k for k in _STORES if k[0] == directory]:
+                del _STORES[stale]
+            store = _STORES[key] = MappedBaselineStore(directory, manifest)
+    return store, STATUS_ORIGINS[status]
+
+
+def open_baseline_store(source_path: str, cache_root: str | None = None) -> Tuple[MappedBaselineStore, str]:
+    """
+    保证列式缓存与键索引是最新的并打开存储，返回 (存储, 来源)；来源同 load_baseline_table
+    （cache / cache-touched / parsed）。同一进程内相同内容版本共用一个存储对象。
+    打开期间其他进程可能重建缓存并清理掉刚读到的版本，此时重新取一次 manifest 再打开。
+    """
+    try:
+        return _open_store(source_path, cache_root)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"[WARN] 打开内存映射基准数据失败（{e}），重新检查缓存后重试")
+    return _open_store(source_path, cache_root)
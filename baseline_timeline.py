@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+baseline_timeline.py — 基准数据的 valid_time 时间索引（按日期回溯查询）
+功能：
+- valid_time 在加载时解析一次为 datetime64[D] 列（见 baseline_aggregate.parse_valid_time）
+- 按 (键分组, 生效日期) 排序建立时间索引：每个分组在有序数组中占一段连续区间
+- as_of 查询：在分组区间内二分查找“生效日期 ≤ D 的最近一天”，返回该日生效的全部行；
+  费率历史再长也是 O(log n)
+说明：valid_time 缺失或无法解析的行不进入时间索引（指定 as_of 时不会被命中）。
+"""
+
+import datetime
+import os
+from typing import Any, Dict
+
+import numpy as np
+import pandas as pd
+
+from baseline_aggregate import VALID_TIME_FORMAT
+
+_NO_ROWS = np.empty(0, dtype=np.intp)
+
+
+def to_day(value: Any) -> np.datetime64:
+    """as_of 参数 → datetime64[D]；接受 date / datetime / "2025-09-02" / "9/2/2025" 等写法"""
+    if isinstance(value, datetime.date) and not isinstance(value, datetime.datetime):
+        return np.datetime64(value, "D")
+    text = str(value).strip()
+    try:
+        return np.datetime64(datetime.datetime.strptime(text, VALID_TIME_FORMAT).date(), "D")
+    except ValueError:
+        pass
+    timestamp = pd.Timestamp(value)
+    if pd.isna(timestamp):
+        raise ValueError(f"无法解析的 as_of 日期：{value!r}")
+    return np.datetime64(timestamp.date(), "D")
+
+
+class TimeIndex:
+    """按 (分组, 生效日期) 排序的行号数组 + 每个分组的区间起点（长度 n_groups + 1）"""
+
+    def __init__(self, arrays: Dict[str, np.ndarray]) -> None:
+        self.rows = arrays["rows"]
+        self.dates = arrays["dates"]
+        self.start = arrays["start"]
+
+    @classmethod
+    def build(cls, groups: np.ndarray, valid_time: np.ndarray, n_groups: int) -> "TimeIndex":
+        groups = np.asarray(groups, dtype=np.int64)
+        dated = np.flatnonzero(~np.isnat(valid_time))
+        # lexsort 以最后一个键为主键：先按分组，组内按日期，同日保持 CSV 顺序
+        order = dated[np.lexsort((dated, valid_time[dated], groups[dated]))]
+        start = np.searchsorted(groups[order], np.arange(n_groups + 1), side="left")
+        return cls({
+            "rows": order.astype(np.int64),
+            "dates": valid_time[order].astype("datetime64[D]"),
+            "start": start.astype(np.int64),
+        })
+
+    def save(self, directory: str, prefix: str = "time") -> None:
+        for name in ("rows", "dates", "start"):
+            np.save(os.path.join(directory, f"{prefix}.{name}.npy"), getattr(self, name), allow_pickle=False)
+
+    @classmethod
+    def load(cls, directory: str, prefix: str = "time", mmap_mode: str | None = None) -> "TimeIndex":
+        return cls({
+            name: np.asarray(np.load(os.path.join(directory, f"{prefix}.{name}.npy"), mmap_mode=mmap_mode))
+            for name in ("rows", "dates", "start")
+        })
+
+    def latest(self, group: int, day: np.datetime64) -> np.ndarray:
+        """分组内截至 day（含）最近一个生效日的全部行号；没有则返回空数组"""
+        start, end = int(self.start[group]), int(self.start[group + 1])
+        dates = self.dates[start:end]
+        hi = int(np.searchsorted(dates, day, side="right"))
+        if hi == 0:
+            return _NO_ROWS
+        lo = int(np.searchsorted(dates, dates[hi - 1], side="left"))
+        return np.asarray(self.rows[start + lo:start + hi], dtype=np.intp)
+
+
+def latest_rows(positions: np.ndarray, valid_time: np.ndarray, day: np.datetime64) -> np.ndarray:
+    """任意行集合（例如子串匹配的结果）中截至 day 最近一个生效日的行"""
+    dates = valid_time[positions]
+    eligible = ~np.isnat(dates) & (dates <= day)
+    if not eligible.any():
+        return _NO_ROWS
+    return np.asarray(positions, dtype=np.intp)[dates == dates[eligible].max()]
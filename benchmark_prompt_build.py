@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+"""
+benchmark_prompt_build.py — prompt 构建开销的微基准（不调用 LLM / Tavily，可离线运行）
+
+对比：
+- 旧实现：每次调用都 ChatPromptTemplate.from_template 解析单一的大模板
+  （LEGACY_COST_PROMPT 为拆分前 _llm_cost_reasoning 中模板文本的原样副本，仅供本基准使用）
+- 每次调用都 build_cost_prompt_template（按工艺族拼装 system / human，from_messages 重新解析）
+- 从预编译注册表取模板后渲染（get_cost_prompt_template）
+
+用法：
+    python benchmark_prompt_build.py            # 默认每种场景 2000 次
+    python benchmark_prompt_build.py 10000
+"""
+
+import statistics
+import sys
+import time
+from typing import Callable, Dict, List
+
+from langchain_core.prompts import ChatPromptTemplate
+
+from cost_prompts import (
+    build_cost_prompt_template,
+    get_cost_prompt_template,
+    precompile_cost_prompt_templates,
+)
+
+SAMPLE_VARIABLES = {
+    "location": "Ningbo",
+    "material_name": "AlSi9MnMoZr",
+    "surface_area": 3110.0,
+    "volume": 195.6,
+    "annual_volume": 420000,
+    "labor_data": "宁波制造业一线工人平均工资约 35~45 元/小时 ……" * 20,
+    "energy_data": "浙江一般工商业电价约 0.65~0.85 元/kWh ……" * 20,
+    "equipment_data": "1250t 压铸机市场公开报价约 600~900 万元 ……" * 20,
+    "consumption_data": "压铸单元平均功率约 120~180 kW ……" * 20,
+}
+
+# 拆分前 _llm_cost_reasoning 每次调用都 from_template 解析的完整模板（原样保留，含 target_unit）
+LEGACY_COST_PROMPT = """
+你是一位资深的制造业成本工程师，精通 metallurgical processes 和 cost estimation。
+
+你的任务：
+1. 结合实时数据（人工、能源、设备折旧、工艺能耗）和专业知识，估算 {process_name} 工艺的成本。
+2. 内部请统一先在 CNY/h 维度上建模和拆分成本（labor + energy + depreciation）。
+3. 然后将 CNY/h 转换为用户指定的最终计费单位："{target_unit}"。
+   - 这个单位是完全自由字符串，可能是 CNY/h, CNY/cm³, CNY/kg, CNY/pcs, EUR/h, USD/kg, CNY/m² 等。
+   - 你需要根据这个单位的含义，推理出合理的转换方式。
+   - 如果目标单位与 CNY/h 无法直接通过物理量（体积、质量、表面积、件数、时间等）转换，请在 reasoning 中说明你的假设并给出一个清晰的转换逻辑。
+4. 所有推理必须有物理和经济上的合理性，不能凭空拍脑袋。
+
+-------------------------
+【工艺参数】
+- 地区：{location}
+- 工艺：{process_name}
+- 材料：{material_name}
+- 表面积：{surface_area} cm²
+- 体积：{volume} cm³
+- 年产量：{annual_volume} 件/年
+- 目标计费单位（完全自由字符串）：{target_unit}
+
+【实时数据（原始文本，仅供你理解和提取数值）】
+- 人工成本数据：
+{labor_data}
+
+- 能源价格数据：
+{energy_data}
+
+- 设备成本 / 折旧数据：
+{equipment_data}
+
+- 工艺能耗数据：
+{consumption_data}
+-------------------------
+【语言要求】
+- 所有 reasoning 字段（包括 processing_speed.reasoning、base_hourly_cost.reasoning、
+  unit_conversion.reasoning、detailed_reasoning）必须全部使用中文撰写。
+- JSON 的字段名保持英文（如 processing_speed、final_cost），但所有描述性文字必须输出中文。
+-------------------------
+
+-------------------------
+【推理与单位转换要求】
+
+1. 先在 CNY/h 维度上建立 cost model，将成本拆解为：
+   - labor_CNY_per_hour
+   - energy_CNY_per_hour
+   - depreciation_CNY_per_hour
+   - total_CNY_per_hour
+
+2. 如果工艺名称包含 "KTL"（例如 "KTL coating"），请参考典型 KTL 产线在实际商务 Workshop 中的拆分结构来构建成本模型（但不要照搬任何具体项目的数值，只学习结构和思路），可包括但不限于：
+   - 管理与间接人工：
+     - 如 workshop manager、shift leader、assistant、quality controller 等。
+     - 用“人数 × RMB/小时 × 小时/天 / 产量（housing/天）”的方式先折算到单件，再统一折算到 CNY/h。
+   - 直接操作工人工：
+     - 根据操作工人数、工资水平（RMB/小时）、每天工作小时数和产量，计算每件人工成本，并统一到 CNY/h。
+   - 设备折旧（KTL 线投资）：
+     - 基于整条 KTL 线的投资金额，采用长期折旧思路（例如按 10 年、每年工作天数、每天工作小时数等逻辑）；
+     - 不把折旧只摊在单一客户项目上，而是考虑多项目、多年的综合利用。
+   - 厂房/空间成本：
+     - 参考“面积 m² × RMB/m² / 月或天 / 产量”这种结构；
+     - 注意如果只部分时间给某个客户生产，应按实际利用时间分摊，而不是 100% 全部摊给该客户。
+   - 能源成本：
+     - 以总功率 kW、利用率（0~1）、每日运行小时数以及当地电价（RMB/kWh）为基础；
+     - 必要时可补充压缩空气、天然气、水处理等能耗成本。
+   - 维护与治具成本：
+     - 如 racks、plastic caps、passivation line、water treatment 等；
+     - 以“每月/每天维护或更换费用 / 产量”的结构折算到每件，再统一折算到 CNY/h。
+   - 质量检测与实验成本：
+     - 如盐雾试验、清洁测试、水测试、拉拔测试等；
+     - 将年度或每日测试费用按频次和产量分摊到单件，再统一到 CNY/h。
+   - 其他间接费用 / RMOC / Overhead：
+     - 在“直接成本小计”基础上施加合理的百分比（例如管理附加、风险附加等），
+     - 但必须在 reasoning 中写清楚采用的百分比区间与依据，仅作为假设。
+   - Scrap 报废成本：
+     - 采用合理的 Scrap Rate（%）区间；
+     - 将 Scrap 视为“合格件成本 × Scrap Rate”的附加成本。
+   在 detailed_reasoning 中，请像商务 Workshop 一样，清晰列出各项假设（人数、工时、功率、面积、Scrap 率等）和每一项的计算逻辑，最终仍需汇总为 CNY/h 维度的 base_hourly_cost。
+
+3. 如果工艺与高压压铸 / Die casting / HPDC 相关（例如 process_name 包含 "Casting"），请在设备折旧部分显式考虑压铸机投资，并遵守以下要求：
+   - 你可以通过实时数据搜索，获取类似“1250t Toshiba die casting machine / 东芝 1250t 压铸机”的市场公开报价或投资金额，用于估算折旧成本。
+   - 当你在推理中实际采用了某个公开网页上的设备价格（尤其是 1250t 东芝压铸机的价格）时：
+     - 必须在 detailed_reasoning 或 base_hourly_cost.reasoning 文本中，写出你引用该价格的公开网页 URL，
+       例如增加一行 `"source_url": "https://......"` 或 类似 “设备价格参考来源：https://......” 的说明。
+     - URL 必须是真实可访问的网页地址，而不是随意编造的字符串。
+     - 同时注明“该价格仅为公开市场参考价，用于折旧估算，并非合同价或最终报价”。
+   - 如果在线搜索没有获得可靠或明确的设备报价网页：
+     - 请在 detailed_reasoning 中明确写出“未找到可靠的 1250t 东芝压铸机公开报价 URL”的情况；
+     - 根据同吨位压铸机的一般价格区间或行业常识，给出一个合理的假设投资金额；
+     - 解释你假设的依据（例如行业报告、类似机型价格区间），但不要伪造 URL。
+   - 压铸机折旧思路仍应采用长期折旧 + 产能分摊（例如按年工作小时数、利用率、小时产能等），
+     避免把设备投资只摊在单一项目的总量上。
+
+4. 完成上述工艺成本建模（包括 KTL 或 Casting 等特殊要求，如果适用）后，再根据 {target_unit} 的含义，设计一个合理的单位转换逻辑，例如：
+   - 如果 {target_unit} 是 "CNY/cm³"：
+     - 说明你如何估算单位时间内可加工体积（cm³/h），并将 CNY/h 换算为 CNY/cm³。
+   - 如果 {target_unit} 是 "CNY/kg"：
+     - 估算材料密度（g/cm³），计算单件重量（kg），推理单位时间可加工质量（kg/h），再完成转换。
+   - 如果 {target_unit} 是 "CNY/pcs"：
+     - 估算单位时间内可加工件数（pcs/h），从而转换为 CNY/pcs。
+   - 如果 {target_unit} 是其它自定义单位（例如货币不同、包含多个物理量）：
+     - 在 reasoning 中清楚解释你是如何从 CNY/h 映射到该单位的，并确保逻辑自洽。
+
+5. 如果缺少某项数据，可以根据中国或全球制造业的典型区间给出一个合理区间，并在 reasoning 中明确标注为“假设”。
+
+6. 最终输出必须是 **纯 JSON**，不能包含任何 markdown 语法或 ```json 包裹。
+
+-------------------------
+【输出 JSON 模板（示例结构）】
+
+请严格按以下结构输出（字段可以根据需要扩展，但不要删除已有字段）：
+
+{{
+  "target_unit": "{target_unit}",
+  "material_density_g_per_cm3": <如果需要按质量相关单位，则给出估算的材料密度，否则可以为 null>,
+  "calculated_weight_kg": <如果需要按质量相关单位，则给出单件估算重量，否则可以为 null>,
+  "processing_speed": {{
+    "value": <数值>,
+    "unit": "<例如 cm³/h 或 kg/h 或 pcs/h 等>",
+    "reasoning": "<你是如何估算加工速度的>"
+  }},
+  "base_hourly_cost": {{
+    "labor_CNY_per_hour": <数值>,
+    "energy_CNY_per_hour": <数值>,
+    "depreciation_CNY_per_hour": <数值>,
+    "total_CNY_per_hour": <数值>,
+    "reasoning": "<成本拆分的详细推理过程>"
+  }},
+  "unit_conversion": {{
+    "from_unit": "CNY/h",
+    "to_unit": "{target_unit}",
+    "conversion_factor": <数值>,
+    "reasoning": "<单位转换的推理过程，尤其是如何从 CNY/h 得到目标单位的>"
+  }},
+  "final_cost": <数值>,
+  "final_unit": "{target_unit}",
+  "cost_breakdown": {{
+    "labor": <数值>,
+    "energy": <数值>,
+    "depreciation": <数值>
+  }},
+  "detailed_reasoning": "<完整推理过程，包括所有关键假设和中间步骤>"
+}}
+
+注意：
+- 你可以根据目标单位自由设计转换逻辑，但必须保证物理和经济上合理。
+- 如果目标单位过于奇怪或信息不足，无法给出可靠转换，请在 detailed_reasoning 里解释局限性。
+- 必须输出纯 JSON，不能有 ```json 或 ``` 包裹。
+"""
+
+PROCESS_NAMES = ["Casting", "KTL coating", "Trimming", "Washing", "Packaging"]
+
+
+def _measure(label: str, render: Callable[[str], object], iterations: int) -> Dict[str, float]:
+    samples: List[float] = []
+    for i in range(iterations):
+        process_name = PROCESS_NAMES[i % len(PROCESS_NAMES)]
+        start = time.perf_counter()
+        render(process_name)
+        samples.append((time.perf_counter() - start) * 1e6)
+
+    samples.sort()
+    result = {
+        "mean_us": statistics.fmean(samples),
+        "p50_us": samples[len(samples) // 2],
+        "p95_us": samples[int(len(samples) * 0.95) - 1],
+    }
+    print(
+        f"{label:<44} mean {result['mean_us']:8.1f} µs   "
+        f"p50 {result['p50_us']:8.1f} µs   p95 {result['p95_us']:8.1f} µs"
+    )
+    return result
+
+
+def main() -> None:
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    precompile_cost_prompt_templates()
+
+    print("=" * 96)
+    print(f"prompt 构建开销（每种场景 {iterations} 次，工艺名轮换 {PROCESS_NAMES}）")
+    print("=" * 96)
+
+    def legacy_from_template(process_name: str) -> object:
+        return ChatPromptTemplate.from_template(LEGACY_COST_PROMPT).invoke(
+            {"process_name": process_name, "target_unit": "CNY/pcs", **SAMPLE_VARIABLES}
+        )
+
+    def rebuild_each_call(process_name: str) -> object:
+        return build_cost_prompt_template(process_name).invoke(
+            {"process_name": process_name, **SAMPLE_VARIABLES}
+        )
+
+    def precompiled_invoke(process_name: str) -> object:
+        return get_cost_prompt_template(process_name).invoke(
+            {"process_name": process_name, **SAMPLE_VARIABLES}
+        )
+
+    def precompiled_format(process_name: str) -> object:
+        return get_cost_prompt_template(process_name).format_prompt(
+            process_name=process_name, **SAMPLE_VARIABLES
+        )
+
+    before = _measure("before: 旧单一模板 from_template + invoke", legacy_from_template, iterations)
+    _measure("split:  按工艺族 from_messages + invoke（每次解析）", rebuild_each_call, iterations)
+    _measure("after:  预编译模板 + invoke", precompiled_invoke, iterations)
+    after = _measure("after:  预编译模板 + format_prompt", precompiled_format, iterations)
+
+    print("-" * 96)
+    print(
+        f"每次调用节省约 {before['mean_us'] - after['mean_us']:.1f} µs "
+        f"（{before['mean_us'] / after['mean_us']:.1f}x）"
+    )
+
+
+if __name__ == "__main__":
+    main()
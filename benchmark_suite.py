@@ -0,0 +1,533 @@
+# -*- coding: utf-8 -*-
+"""
+benchmark_suite.py — 离线性能基准（不访问 Azure OpenAI / Tavily，任意 Linux 机器上可运行）
+
+用本地替身代替外部服务：
+- FakeCostLLM：代替 AzureChatOpenAI 做成本推理，返回固定结构的 JSON 与 usage_metadata
+- FakeAgentLLM：代替 Agent 的对话模型，第一轮发起 process_rate_finder 工具调用，拿到结果后给出回答
+- FakeTavilySearch：代替 TavilySearch，返回指定大小的搜索结果
+三者都支持配置延迟、抖动与失败率（失败时抛出 / 返回 429，走真实的重试逻辑），随机数固定种子，结果可复现。
+指定 --traffic 时，成本推理与 Tavily 替身改为返回录制的真实响应（见 traffic_replay.py），负载大小与线上一致。
+
+测量三条路径的吞吐、p50 / p95 / p99 延迟与内存（tracemalloc 峰值）：
+- run：max_concurrency 个线程并发调用 tool.run
+- batch：多轮 tool.run_batch
+- agent：ProcessCostAgent.chat（tool calling → tool.run → 回答）
+
+用法：
+    python benchmark_suite.py                                   # 默认参数
+    python benchmark_suite.py --llm-latency 0.2 --failure-rate 0.05
+    python benchmark_suite.py --traffic .cache/traffic.sqlite3  # 使用录制的真实负载
+    python benchmark_suite.py --save bench.json                 # 保存结果
+    python benchmark_suite.py --compare bench.json              # 与基线对比，退化超过 --tolerance 时退出码为 1
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+import zlib
+from abc import abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+# 基准只测未命中缓存的完整路径；需要测缓存命中时可在命令行前显式设置这两个变量
+os.environ.setdefault("TAVILY_CACHE_TTL", "0")
+os.environ.setdefault("LLM_CACHE_TTL", "0")
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from process_rate_finder_tool import ProcessRateFinderTool
+from run_metrics import PROCESS_METRICS
+from tavily_client import TavilyHTTPError
+from traffic_replay import TrafficStore
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CSV = os.path.join(BASE_DIR, "process_rates 6 -fixed.csv")
+
+# 基准查询：取自 CSV 中 044220003G 的增值工序
+BENCH_STEPS = [
+    "Melting", "Casting", "Trimming", "Deburring", "Sand blasting", "Manual polishing",
+    "Machining OP10", "Washing", "FSW", "Polishing", "Machining OP20", "Ultrasonic washing",
+    "KTL coating", "Machining OP30", "Air leakage test", "Final inspection",
+]
+BENCH_UNITS = ["CNY/pcs", "CNY/h", "CNY/kg"]
+
+
+# --------------------------------------------------------------------------- #
+# 本地替身
+# --------------------------------------------------------------------------- #
+class FakeServiceError(Exception):
+    """替身模拟的服务端错误（默认 429，可被 resilience.is_retryable 识别）"""
+
+    def __init__(self, message: str, status_code: int = 429) -> None:
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class LatencyProfile:
+    """延迟 / 抖动 / 失败率配置；同一实例被多线程共用，随机数在锁内生成"""
+
+    def __init__(self, latency: float, jitter: float, failure_rate: float, seed: int) -> None:
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.failures = 0
+
+    def draw(self) -> tuple[float, bool]:
+        """返回 (本次延迟秒数, 本次是否失败)"""
+        with self._lock:
+            self.calls += 1
+            delay = max(0.0, self.latency + self._rng.uniform(-self.jitter, self.jitter))
+            failed = self._rng.random() < self.failure_rate
+            if failed:
+                self.failures += 1
+        return delay, failed
+
+
+def _cost_content(seed_text: str) -> str:
+    """按 prompt 生成确定性的成本推理 JSON（字段与 cost_prompts.OUTPUT_SCHEMA_SECTION 一致）"""
+    rng = random.Random(seed_text)
+    labor = round(rng.uniform(30, 60), 2)
+    energy = round(rng.uniform(10, 200), 2)
+    depreciation = round(rng.uniform(5, 400), 2)
+    speed = rng.choice([30, 60, 120, 240])
+    total = round(labor + energy + depreciation, 2)
+    return json.dumps({
+        "material_density_g_per_cm3": 2.7,
+        "calculated_weight_kg": 0.528,
+        "processing_speed": {"value": speed, "unit": "pcs/h", "reasoning": "benchmark"},
+        "base_hourly_cost": {
+            "labor_CNY_per_hour": labor,
+            "energy_CNY_per_hour": energy,
+            "depreciation_CNY_per_hour": depreciation,
+            "total_CNY_per_hour": total,
+            "reasoning": "benchmark",
+        },
+        "detailed_reasoning": "离线基准替身生成的推理说明。" * 20,
+    }, ensure_ascii=False)
+
+
+def _usage(messages: List[BaseMessage], output: str) -> Dict[str, Any]:
+    prompt_tokens = sum(len(str(message.content)) for message in messages) // 4
+    output_tokens = len(output) // 4
+    return {
+        "input_tokens": prompt_tokens,
+        "output_tokens": output_tokens,
+        "total_tokens": prompt_tokens + output_tokens,
+        "input_token_details": {"cache_read": 0},
+    }
+
+
+class _FakeChatModel(BaseChatModel):
+    """同步 / 异步共用的延迟与失败模拟"""
+
+    profile: Any = None
+
+    @abstractmethod
+    def _respond(self, messages: List[BaseMessage]) -> AIMessage:
+        """子类按消息内容生成假回复"""
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        delay, failed = self.profile.draw()
+        time.sleep(delay)
+        if failed:
+            raise FakeServiceError(f"Error code: 429 - {self._llm_type} 模拟限流")
+        return ChatResult(generations=[ChatGeneration(message=self._respond(messages))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        delay, failed = self.profile.draw()
+        await asyncio.sleep(delay)
+        if failed:
+            raise FakeServiceError(f"Error code: 429 - {self._llm_type} 模拟限流")
+        return ChatResult(generations=[ChatGeneration(message=self._respond(messages))])
+
+
+def _pick(samples: List[Any], text: str) -> Any:
+    """按文本稳定地挑选一条录制样本"""
+    return samples[zlib.crc32(text.encode("utf-8")) % len(samples)]
+
+
+class FakeCostLLM(_FakeChatModel):
+    """成本推理替身：输出合法的成本 JSON；给了 recorded（录制的响应内容）时从中挑选"""
+
+    recorded: List[str] = []
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-cost-llm"
+
+    def _respond(self, messages: List[BaseMessage]) -> AIMessage:
+        text = str(messages[-1].content)
+        content = _pick(self.recorded, text) if self.recorded else _cost_content(text)
+        return AIMessage(content=content, usage_metadata=_usage(messages, content))
+
+
+class FakeAgentLLM(_FakeChatModel):
+    """Agent 对话替身：最后一条不是工具结果时发起工具调用，否则给出最终回答"""
+
+    tool_args: Dict[str, Any] = {}
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-agent-llm"
+
+    def bind_tools(self, tools: Any, **kwargs: Any) -> "FakeAgentLLM":
+        return self
+
+    def _respond(self, messages: List[BaseMessage]) -> AIMessage:
+        if isinstance(messages[-1], ToolMessage):
+            content = f"查询完成，工具返回 {len(str(messages[-1].content))} 字符的结果。"
+            return AIMessage(content=content, usage_metadata=_usage(messages, content))
+        return AIMessage(
+            content="",
+            tool_calls=[{"name": "process_rate_finder", "args": dict(self.tool_args), "id": f"call_{len(messages)}"}],
+            usage_metadata=_usage(messages, ""),
+        )
+
+
+class FakeTavilySearch:
+    """TavilySearch 替身：invoke / ainvoke 返回 dict；失败时与 TavilySearch 一样返回 {"error": e}"""
+
+    def __init__(
+        self,
+        profile: LatencyProfile,
+        payload_chars: int = 4000,
+        recorded: Optional[List[Any]] = None,
+    ) -> None:
+        self.profile = profile
+        self.payload_chars = payload_chars
+        self.recorded = recorded or []
+
+    def _payload(self, query: str) -> Any:
+        if self.recorded:
+            return _pick(self.recorded, query)
+        body = (f"{query} 相关报价与行业数据。" * (self.payload_chars // (len(query) + 10) + 1))
+        per_result = max(1, self.payload_chars // 5)
+        return {
+            "query": query,
+            "results": [
+                {"title": f"{query} #{i}", "url": f"https://example.com/{i}", "content": body[:per_result]}
+                for i in range(5)
+            ],
+        }
+
+    def invoke(self, query: str) -> Dict[str, Any]:
+        delay, failed = self.profile.draw()
+        time.sleep(delay)
+        if failed:
+            return {"error": TavilyHTTPError("Error 429: 模拟限流", 429)}
+        return self._payload(query)
+
+    async def ainvoke(self, query: str) -> Dict[str, Any]:
+        delay, failed = self.profile.draw()
+        await asyncio.sleep(delay)
+        if failed:
+            return {"error": TavilyHTTPError("Error 429: 模拟限流", 429)}
+        return self._payload(query)
+
+
+# --------------------------------------------------------------------------- #
+# 统计
+# --------------------------------------------------------------------------- #
+def percentile(samples: List[float], pct: float) -> float:
+    """最近秩百分位"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(1, math.ceil(pct / 100.0 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(
+    name: str,
+    latencies: List[float],
+    items: int,
+    wall: float,
+    errors: int,
+    memory: Dict[str, float],
+) -> Dict[str, Any]:
+    return {
+        "path": name,
+        "calls": len(latencies),
+        "items": items,
+        "errors": errors,
+        "wall_s": round(wall, 3),
+        "throughput_items_per_s": round(items / wall, 2) if wall > 0 else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        **memory,
+    }
+
+
+@contextlib.contextmanager
+def _quiet(enabled: bool):
+    """屏蔽工具与 Agent 的逐条日志（打印本身也算在路径耗时内，但会淹没报告）"""
+    if not enabled:
+        yield
+        return
+    with open(os.devnull, "w", encoding="utf-8") as sink, contextlib.redirect_stdout(sink):
+        yield
+
+
+def _measure_memory(workload: Callable[[], Any]) -> Dict[str, float]:
+    """在 tracemalloc 下再执行一次 workload，返回峰值与执行后仍保留的内存（MiB）"""
+    tracemalloc.start()
+    try:
+        workload()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"peak_mib": round(peak / 2**20, 2), "retained_mib": round(current / 2**20, 2)}
+
+
+# --------------------------------------------------------------------------- #
+# 基准路径
+# --------------------------------------------------------------------------- #
+def make_queries(count: int, offset: int = 0) -> List[Dict[str, Any]]:
+    return [
+        {
+            "location": "Ningbo, Zhejiang",
+            "process_name": BENCH_STEPS[(offset + i) % len(BENCH_STEPS)],
+            "material_name": "AlSi9Mn",
+            "surface_area": 3110.0,
+            "volume": 195.6,
+            "annual_volume": 800000 + offset + i,
+            "unit": BENCH_UNITS[(offset + i) % len(BENCH_UNITS)],
+        }
+        for i in range(count)
+    ]
+
+
+def bench_run(tool: ProcessRateFinderTool, args: argparse.Namespace) -> Dict[str, Any]:
+    queries = make_queries(args.run_queries)
+
+    def workload() -> tuple[List[float], int, float]:
+        latencies: List[float] = []
+        errors = 0
+        lock = threading.Lock()
+
+        def one(query: Dict[str, Any]) -> None:
+            nonlocal errors
+            started = time.perf_counter()
+            output = json.loads(tool.run(**query))
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                if "error" in output.get("llm_reasoning", {}):
+                    errors += 1
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            list(executor.map(one, queries))
+        return latencies, errors, time.perf_counter() - started
+
+    with _quiet(not args.verbose):
+        latencies, errors, wall = workload()
+        memory = _measure_memory(workload) if not args.no_memory else {}
+    return summarize("run", latencies, len(queries), wall, errors, memory)
+
+
+def bench_batch(tool: ProcessRateFinderTool, args: argparse.Namespace) -> Dict[str, Any]:
+    rounds = [make_queries(args.batch_size, offset=r * args.batch_size) for r in range(args.batch_rounds)]
+
+    def workload() -> tuple[List[float], int, float]:
+        latencies: List[float] = []
+        errors = 0
+        started = time.perf_counter()
+        for queries in rounds:
+            batch_started = time.perf_counter()
+            items = tool.run_batch(queries, max_concurrency=args.concurrency)
+            latencies.append(time.perf_counter() - batch_started)
+            errors += sum(1 for item in items if not item["ok"])
+        return latencies, errors, time.perf_counter() - started
+
+    with _quiet(not args.verbose):
+        latencies, errors, wall = workload()
+        memory = _measure_memory(workload) if not args.no_memory else {}
+    return summarize("batch", latencies, args.batch_size * args.batch_rounds, wall, errors, memory)
+
+
+def bench_agent(tool: ProcessRateFinderTool, args: argparse.Namespace) -> Dict[str, Any]:
+    with _quiet(not args.verbose):
+        # process_cost_agent 在导入时就会加载 .env 并打印代理配置
+        from process_cost_agent import ProcessCostAgent
+
+    query = make_queries(1)[0]
+    agent_llm = FakeAgentLLM(
+        profile=LatencyProfile(args.llm_latency, args.llm_jitter, args.failure_rate, args.seed + 2),
+        tool_args=query,
+    )
+    with _quiet(not args.verbose):
+        agent = ProcessCostAgent(llm=agent_llm, tool=tool)
+        # AgentExecutor 默认 verbose，基准中关闭以免日志开销计入
+        agent.agent_executor.verbose = False
+
+    message = "帮我查询宁波地区 AlSi9Mn 材料的 Casting 工艺成本，表面积 3110 cm²，体积 195.6 cm³，年产量 80 万件"
+
+    def workload() -> tuple[List[float], int, float]:
+        latencies: List[float] = []
+        errors = 0
+        started = time.perf_counter()
+        for _ in range(args.agent_turns):
+            turn_started = time.perf_counter()
+            reply = agent.chat(message)
+            latencies.append(time.perf_counter() - turn_started)
+            errors += reply.startswith("❌")
+            agent.reset()
+        return latencies, errors, time.perf_counter() - started
+
+    with _quiet(not args.verbose):
+        latencies, errors, wall = workload()
+        memory = _measure_memory(workload) if not args.no_memory else {}
+    return summarize("agent", latencies, args.agent_turns, wall, errors, memory)
+
+
+BENCHMARKS = {"run": bench_run, "batch": bench_batch, "agent": bench_agent}
+
+
+# --------------------------------------------------------------------------- #
+# 报告 / 对比
+# --------------------------------------------------------------------------- #
+def print_report(results: List[Dict[str, Any]]) -> None:
+    print("=" * 104)
+    print(
+        f"{'path':<8}{'items':>7}{'errors':>8}{'wall s':>9}{'items/s':>10}"
+        f"{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'peak MiB':>11}{'kept MiB':>11}"
+    )
+    print("-" * 104)
+    for r in results:
+        print(
+            f"{r['path']:<8}{r['items']:>7}{r['errors']:>8}{r['wall_s']:>9.2f}"
+            f"{r['throughput_items_per_s']:>10.2f}{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}"
+            f"{r['p99_ms']:>10.1f}{r.get('peak_mib', float('nan')):>11.2f}"
+            f"{r.get('retained_mib', float('nan')):>11.2f}"
+        )
+    print("=" * 104)
+
+
+def compare(results: List[Dict[str, Any]], baseline_path: str, tolerance: float) -> List[str]:
+    """与基线对比：p95 变慢或吞吐下降超过 tolerance（比例）即视为退化"""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = {r["path"]: r for r in json.load(f)["results"]}
+
+    regressions = []
+    for r in results:
+        base = baseline.get(r["path"])
+        if base is None:
+            continue
+        if base["p95_ms"] and r["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{r['path']}: p95 {base['p95_ms']} → {r['p95_ms']} ms")
+        if r["throughput_items_per_s"] < base["throughput_items_per_s"] * (1 - tolerance):
+            regressions.append(
+                f"{r['path']}: 吞吐 {base['throughput_items_per_s']} → {r['throughput_items_per_s']} items/s"
+            )
+        if base.get("peak_mib") and r.get("peak_mib", 0) > base["peak_mib"] * (1 + tolerance):
+            regressions.append(f"{r['path']}: 内存峰值 {base['peak_mib']} → {r['peak_mib']} MiB")
+    return regressions
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="ProcessRateFinderTool 离线性能基准")
+    parser.add_argument("--paths", default="run,batch,agent", help="要测的路径，逗号分隔：run,batch,agent")
+    parser.add_argument("--csv", default=DEFAULT_CSV, help="CSV 基准数据路径")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="LLM 替身平均延迟（秒）")
+    parser.add_argument("--llm-jitter", type=float, default=0.02, help="LLM 替身延迟抖动（±秒）")
+    parser.add_argument("--search-latency", type=float, default=0.02, help="Tavily 替身平均延迟（秒）")
+    parser.add_argument("--search-jitter", type=float, default=0.01, help="Tavily 替身延迟抖动（±秒）")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="替身返回 429 的概率（0~1）")
+    parser.add_argument("--payload-chars", type=int, default=4000, help="每次 Tavily 结果的字符数")
+    parser.add_argument("--traffic", help="录制的流量文件（traffic_replay.TrafficStore），替身改为返回其中的真实响应")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--run-queries", type=int, default=32, help="run 路径的查询条数")
+    parser.add_argument("--concurrency", type=int, default=8, help="run 路径线程数 / run_batch 最大并发")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--batch-rounds", type=int, default=4)
+    parser.add_argument("--agent-turns", type=int, default=8)
+    parser.add_argument("--no-memory", action="store_true", help="跳过 tracemalloc 内存测量（省一半时间）")
+    parser.add_argument("--verbose", action="store_true", help="保留工具与 Agent 的日志输出")
+    parser.add_argument("--save", help="把结果写入 JSON 文件")
+    parser.add_argument("--compare", help="与之前 --save 的基线 JSON 对比")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="对比时允许的退化比例")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    paths = [p.strip() for p in args.paths.split(",") if p.strip()]
+    unknown = [p for p in paths if p not in BENCHMARKS]
+    if unknown:
+        print(f"[ERROR] 未知的基准路径：{unknown}（可选 {list(BENCHMARKS)}）")
+        return 2
+
+    llm_profile = LatencyProfile(args.llm_latency, args.llm_jitter, args.failure_rate, args.seed)
+    search_profile = LatencyProfile(args.search_latency, args.search_jitter, args.failure_rate, args.seed + 1)
+    recorded_llm: List[str] = []
+    recorded_search: List[Any] = []
+    if args.traffic:
+        store = TrafficStore(args.traffic)
+        recorded_llm = [str(r.get("content", "")) for r in store.responses("llm")]
+        recorded_search = store.responses("tavily")
+        print(f"[INFO] 📼 使用录制负载：LLM {len(recorded_llm)} 条，Tavily {len(recorded_search)} 条（{args.traffic}）")
+
+    with _quiet(not args.verbose):
+        tool = ProcessRateFinderTool(
+            llm=FakeCostLLM(profile=llm_profile, recorded=recorded_llm),
+            csv_path=args.csv,
+            search_client=FakeTavilySearch(search_profile, args.payload_chars, recorded_search),
+            # 基准只测替身，不受 RATE_TOOL_TRAFFIC_MODE 影响
+            traffic_mode="off",
+        )
+
+    print(
+        f"[INFO] 🧪 离线基准：LLM {args.llm_latency * 1000:.0f}±{args.llm_jitter * 1000:.0f} ms，"
+        f"Tavily {args.search_latency * 1000:.0f}±{args.search_jitter * 1000:.0f} ms，"
+        f"失败率 {args.failure_rate:.0%}，并发 {args.concurrency}"
+    )
+    PROCESS_METRICS.reset()
+    results = []
+    for path in paths:
+        print(f"[INFO] ▶ {path} ...")
+        results.append(BENCHMARKS[path](tool, args))
+
+    print_report(results)
+    snapshot = PROCESS_METRICS.snapshot()
+    print("各阶段累计耗时（run_metrics.PROCESS_METRICS）：")
+    for name, entry in snapshot["stages"].items():
+        print(f"  {name:<16} count {entry['count']:>5}   avg {entry['avg_ms']:>9.2f} ms   max {entry['max_ms']:>9.2f} ms")
+    print(
+        f"替身调用：LLM {llm_profile.calls} 次（失败 {llm_profile.failures}），"
+        f"Tavily {search_profile.calls} 次（失败 {search_profile.failures}）；重试 {snapshot['retries']}"
+    )
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results, "stages": snapshot["stages"]}, f, ensure_ascii=False, indent=2)
+        print(f"[INFO] 💾 结果已保存：{args.save}")
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.tolerance)
+        if regressions:
+            print(f"[ERROR] ❌ 相对基线 {args.compare} 出现性能退化（容忍 {args.tolerance:.0%}）：")
+            for line in regressions:
+                print(f"  - {line}")
+            return 1
+        print(f"[INFO] ✅ 与基线 {args.compare} 相比无退化（容忍 {args.tolerance:.0%}）")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
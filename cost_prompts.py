@@ -0,0 +1,324 @@
+# -*- coding: utf-8 -*-
+"""
+cost_prompts.py — 成本推理 prompt 的模块化构建
+功能：
+- 把原来的整块 prompt 拆成若干段：通用说明、CNY/h 建模、加工速度估算、输出模板、工艺参数
+- LLM 只输出 CNY/h 成本拆分与加工速度 / 材料密度，不接收目标计费单位；
+  目标单位由 unit_conversion.py 在本地换算，因此同一工艺换不同单位查询共用同一个 prompt（及 LLM 缓存）
+- 静态前缀在前：不变的说明与 JSON 模板作为 system 消息放在最前，每次查询的变量放在最后的 human 消息，
+  便于命中 Azure OpenAI 的 prompt 前缀缓存
+- KTL 电泳线拆分、压铸机（1250t 东芝）折旧要求只在工艺名称属于对应工艺族时才加入（追加在 system 消息末尾）
+- 提供 prompt token 计数（优先 tiktoken，不可用时按字符估算），便于衡量省下的输入 token
+说明：设置环境变量 COST_PROMPT_SECTIONS=all 可恢复为始终发送全部工艺段落。
+"""
+
+import os
+import threading
+from typing import Dict, List, Tuple
+
+from langchain_core.prompts import ChatPromptTemplate
+
+PROMPT_VERSION = "4"
+
+# 工艺族 → 工艺名称中的关键词（规范化后做包含匹配）
+PROCESS_FAMILY_KEYWORDS: Dict[str, Tuple[str, ...]] = {
+    "ktl": ("ktl", "e-coat", "ecoat", "电泳"),
+    "casting": ("casting", "die cast", "diecast", "hpdc", "压铸"),
+}
+
+
+def detect_process_families(process_name: str) -> Tuple[str, ...]:
+    """返回工艺名称命中的工艺族（按 PROCESS_FAMILY_KEYWORDS 的顺序）"""
+    if os.getenv("COST_PROMPT_SECTIONS", "").strip().lower() == "all":
+        return tuple(PROCESS_FAMILY_KEYWORDS)
+    name = " ".join(str(process_name).split()).casefold()
+    return tuple(
+        family
+        for family, keywords in PROCESS_FAMILY_KEYWORDS.items()
+        if any(keyword in name for keyword in keywords)
+    )
+
+
+# --------------------------------------------------------------------------- #
+# prompt 段落（ChatPromptTemplate 语法：变量用 {...}，字面大括号写作 {{ }}）
+# --------------------------------------------------------------------------- #
+# 布局：不变的说明、推理要求、JSON 模板全部放在 system 消息里且位于最前面，
+# 各次查询完全相同，可命中 Azure OpenAI 的 prompt 前缀缓存；工艺族附加段落放在 system 消息末尾，
+# 地区、几何、实时数据等每次查询不同的变量全部放在最后的 human 消息里。
+SYSTEM_HEADER_SECTION = """\
+你是一位资深的制造业成本工程师，精通 metallurgical processes 和 cost estimation。
+
+你的任务：
+1. 结合实时数据（人工、能源、设备折旧、工艺能耗）和专业知识，估算用户消息中指定工艺的成本。
+2. 统一在 CNY/h 维度上建模和拆分成本（labor + energy + depreciation）。
+3. 估算该工艺的加工速度（processing_speed）以及材料密度，供程序把 CNY/h 换算成各种计费单位。
+   - 不要做任何计费单位换算（CNY/kg、CNY/pcs、USD/h 等），换算由程序根据你给出的数值在本地完成。
+4. 所有推理必须有物理和经济上的合理性，不能凭空拍脑袋。
+
+-------------------------
+【语言要求】
+- 所有 reasoning 字段（包括 processing_speed.reasoning、base_hourly_cost.reasoning、
+  detailed_reasoning）必须全部使用中文撰写。
+- JSON 的字段名保持英文（如 processing_speed、base_hourly_cost），但所有描述性文字必须输出中文。
+-------------------------
+
+-------------------------
+【推理要求】
+"""
+
+# 通用推理要求条目，编号在组装时生成
+HOURLY_MODEL_ITEM = """\
+先在 CNY/h 维度上建立 cost model，将成本拆解为：
+   - labor_CNY_per_hour
+   - energy_CNY_per_hour
+   - depreciation_CNY_per_hour
+   - total_CNY_per_hour
+"""
+
+PROCESSING_SPEED_ITEM = """\
+完成上述工艺成本建模（包括【特定工艺附加要求】，如果适用）后，结合零件几何与年产量估算加工速度 processing_speed：
+   - 优先给出单位时间可加工件数（pcs/h）；
+   - 如果该工艺通常按质量、体积或面积计产能，也可以给出 kg/h、cm³/h 或 m²/h，并在 reasoning 中说明；
+   - 同时给出材料密度 material_density_g_per_cm3（g/cm³）与单件重量 calculated_weight_kg（kg）的估算。
+"""
+
+MISSING_DATA_ITEM = """\
+如果缺少某项数据，可以根据中国或全球制造业的典型区间给出一个合理区间，并在 reasoning 中明确标注为“假设”。
+"""
+
+PURE_JSON_ITEM = """\
+最终输出必须是 **纯 JSON**，不能包含任何 markdown 语法或 ```json 包裹。
+"""
+
+OUTPUT_SCHEMA_SECTION = """\
+-------------------------
+【输出 JSON 模板（示例结构）】
+
+请严格按以下结构输出（字段可以根据需要扩展，但不要删除已有字段）：
+
+{{
+  "material_density_g_per_cm3": <估算的材料密度（g/cm³），无法估算时为 null>,
+  "calculated_weight_kg": <单件估算重量（kg），无法估算时为 null>,
+  "processing_speed": {{
+    "value": <数值>,
+    "unit": "<pcs/h，或 kg/h、cm³/h、m²/h>",
+    "reasoning": "<你是如何估算加工速度的>"
+  }},
+  "base_hourly_cost": {{
+    "labor_CNY_per_hour": <数值>,
+    "energy_CNY_per_hour": <数值>,
+    "depreciation_CNY_per_hour": <数值>,
+    "total_CNY_per_hour": <数值>,
+    "reasoning": "<成本拆分的详细推理过程>"
+  }},
+  "detailed_reasoning": "<完整推理过程，包括所有关键假设和中间步骤>"
+}}
+
+注意：
+- 所有金额都以 CNY/h 表示，不要输出其它计费单位下的成本。
+- 如果信息不足，请在 detailed_reasoning 里解释局限性。
+- 必须输出纯 JSON，不能有 ```json 或 ``` 包裹。
+"""
+
+FAMILY_SECTION_HEADER = """\
+-------------------------
+【特定工艺附加要求】（仅在用户消息中的工艺属于对应类型时适用，在 CNY/h 建模时一并遵守）
+"""
+
+KTL_ITEM = """\
+如果工艺名称包含 "KTL"（例如 "KTL coating"），请参考典型 KTL 产线在实际商务 Workshop 中的拆分结构来构建成本模型（但不要照搬任何具体项目的数值，只学习结构和思路），可包括但不限于：
+   - 管理与间接人工：
+     - 如 workshop manager、shift leader、assistant、quality controller 等。
+     - 用“人数 × RMB/小时 × 小时/天 / 产量（housing/天）”的方式先折算到单件，再统一折算到 CNY/h。
+   - 直接操作工人工：
+     - 根据操作工人数、工资水平（RMB/小时）、每天工作小时数和产量，计算每件人工成本，并统一到 CNY/h。
+   - 设备折旧（KTL 线投资）：
+     - 基于整条 KTL 线的投资金额，采用长期折旧思路（例如按 10 年、每年工作天数、每天工作小时数等逻辑）；
+     - 不把折旧只摊在单一客户项目上，而是考虑多项目、多年的综合利用。
+   - 厂房/空间成本：
+     - 参考“面积 m² × RMB/m² / 月或天 / 产量”这种结构；
+     - 注意如果只部分时间给某个客户生产，应按实际利用时间分摊，而不是 100% 全部摊给该客户。
+   - 能源成本：
+     - 以总功率 kW、利用率（0~1）、每日运行小时数以及当地电价（RMB/kWh）为基础；
+     - 必要时可补充压缩空气、天然气、水处理等能耗成本。
+   - 维护与治具成本：
+     - 如 racks、plastic caps、passivation line、water treatment 等；
+     - 以“每月/每天维护或更换费用 / 产量”的结构折算到每件，再统一折算到 CNY/h。
+   - 质量检测与实验成本：
+     - 如盐雾试验、清洁测试、水测试、拉拔测试等；
+     - 将年度或每日测试费用按频次和产量分摊到单件，再统一到 CNY/h。
+   - 其他间接费用 / RMOC / Overhead：
+     - 在“直接成本小计”基础上施加合理的百分比（例如管理附加、风险附加等），
+     - 但必须在 reasoning 中写清楚采用的百分比区间与依据，仅作为假设。
+   - Scrap 报废成本：
+     - 采用合理的 Scrap Rate（%）区间；
+     - 将 Scrap 视为“合格件成本 × Scrap Rate”的附加成本。
+   在 detailed_reasoning 中，请像商务 Workshop 一样，清晰列出各项假设（人数、工时、功率、面积、Scrap 率等）和每一项的计算逻辑，最终仍需汇总为 CNY/h 维度的 base_hourly_cost。
+"""
+
+CASTING_ITEM = """\
+如果工艺与高压压铸 / Die casting / HPDC 相关（例如 process_name 包含 "Casting"），请在设备折旧部分显式考虑压铸机投资，并遵守以下要求：
+   - 你可以通过实时数据搜索，获取类似“1250t Toshiba die casting machine / 东芝 1250t 压铸机”的市场公开报价或投资金额，用于估算折旧成本。
+   - 当你在推理中实际采用了某个公开网页上的设备价格（尤其是 1250t 东芝压铸机的价格）时：
+     - 必须在 detailed_reasoning 或 base_hourly_cost.reasoning 文本中，写出你引用该价格的公开网页 URL，
+       例如增加一行 `"source_url": "https://......"` 或 类似 “设备价格参考来源：https://......” 的说明。
+     - URL 必须是真实可访问的网页地址，而不是随意编造的字符串。
+     - 同时注明“该价格仅为公开市场参考价，用于折旧估算，并非合同价或最终报价”。
+   - 如果在线搜索没有获得可靠或明确的设备报价网页：
+     - 请在 detailed_reasoning 中明确写出“未找到可靠的 1250t 东芝压铸机公开报价 URL”的情况；
+     - 根据同吨位压铸机的一般价格区间或行业常识，给出一个合理的假设投资金额；
+     - 解释你假设的依据（例如行业报告、类似机型价格区间），但不要伪造 URL。
+   - 压铸机折旧思路仍应采用长期折旧 + 产能分摊（例如按年工作小时数、利用率、小时产能等），
+     避免把设备投资只摊在单一项目的总量上。
+"""
+
+# 工艺族 → 对应的附加要求条目
+FAMILY_ITEMS: Dict[str, str] = {
+    "ktl": KTL_ITEM,
+    "casting": CASTING_ITEM,
+}
+
+# human 消息：每次查询不同的变量
+QUERY_SECTION = """\
+-------------------------
+【工艺参数】
+- 地区：{location}
+- 工艺：{process_name}
+- 材料：{material_name}
+- 表面积：{surface_area} cm²
+- 体积：{volume} cm³
+- 年产量：{annual_volume} 件/年
+
+【实时数据（原始文本，仅供你理解和提取数值）】
+- 人工成本数据：
+{labor_data}
+
+- 能源价格数据：
+{energy_data}
+
+- 设备成本 / 折旧数据：
+{equipment_data}
+
+- 工艺能耗数据：
+{consumption_data}
+-------------------------
+请按系统消息中的要求完成推理，并只输出 JSON。
+"""
+
+
+def build_cost_prompt_messages(families: Tuple[str, ...] = ()) -> Tuple[str, str, List[str]]:
+    """按工艺族组装 (system 模板文本, human 模板文本, 实际包含的段落名)"""
+    items = [
+        ("hourly_model", HOURLY_MODEL_ITEM),
+        ("processing_speed", PROCESSING_SPEED_ITEM),
+        ("missing_data", MISSING_DATA_ITEM),
+        ("pure_json", PURE_JSON_ITEM),
+    ]
+    numbered = [f"{number}. {text}" for number, (_, text) in enumerate(items, start=1)]
+    system = SYSTEM_HEADER_SECTION + "\n" + "\n".join(numbered) + "\n" + OUTPUT_SCHEMA_SECTION
+    sections = ["header"] + [name for name, _ in items] + ["output_schema"]
+
+    family_items = [(family, FAMILY_ITEMS[family]) for family in families if family in FAMILY_ITEMS]
+    if family_items:
+        numbered = [f"{number}. {text}" for number, (_, text) in enumerate(family_items, start=1)]
+        system += "\n" + FAMILY_SECTION_HEADER + "\n" + "\n".join(numbered)
+        sections += [name for name, _ in family_items]
+
+    return system, QUERY_SECTION, sections + ["query"]
+
+
+def build_cost_prompt_template(process_name: str) -> ChatPromptTemplate:
+    """根据工艺名称构建新的 ChatPromptTemplate（每次都重新解析模板，热路径请用 get_cost_prompt_template）"""
+    return _compile_template(detect_process_families(process_name))
+
+
+def _compile_template(families: Tuple[str, ...]) -> ChatPromptTemplate:
+    system, human, _ = build_cost_prompt_messages(families)
+    return ChatPromptTemplate.from_messages([("system", system), ("human", human)])
+
+
+# --------------------------------------------------------------------------- #
+# 预编译模板注册表
+# --------------------------------------------------------------------------- #
+# (PROMPT_VERSION, 工艺族) → 已解析的模板；工艺族组合很少，模板只解析一次后在进程内复用
+_TEMPLATES: Dict[Tuple[str, Tuple[str, ...]], ChatPromptTemplate] = {}
+_TEMPLATES_LOCK = threading.Lock()
+
+
+def get_cost_prompt_template(process_name: str) -> ChatPromptTemplate:
+    """按工艺族从注册表取预编译模板（ChatPromptTemplate 只读使用，可跨线程共享）"""
+    key = (PROMPT_VERSION, detect_process_families(process_name))
+    template = _TEMPLATES.get(key)
+    if template is None:
+        with _TEMPLATES_LOCK:
+            template = _TEMPLATES.get(key)
+            if template is None:
+                template = _compile_template(key[1])
+                _TEMPLATES[key] = template
+    return template
+
+
+def precompile_cost_prompt_templates() -> int:
+    """预先编译所有工艺族组合的模板（工具初始化时调用），返回模板数"""
+    families = tuple(FAMILY_ITEMS)
+    combos = [()] + [(family,) for family in families] + [families]
+    with _TEMPLATES_LOCK:
+        for combo in combos:
+            key = (PROMPT_VERSION, combo)
+            if key not in _TEMPLATES:
+                _TEMPLATES[key] = _compile_template(combo)
+        return len(_TEMPLATES)
+
+
+# --------------------------------------------------------------------------- #
+# token 计数
+# --------------------------------------------------------------------------- #
+_ENCODING = None
+_ENCODING_FAILED = False
+_ENCODING_LOCK = threading.Lock()
+
+
+def _get_encoding():
+    """惰性加载 tiktoken 编码；未安装或无法下载编码文件时只尝试一次"""
+    global _ENCODING, _ENCODING_FAILED
+    if _ENCODING is not None or _ENCODING_FAILED:
+        return _ENCODING
+    with _ENCODING_LOCK:
+        if _ENCODING is None and not _ENCODING_FAILED:
+            try:
+                import tiktoken
+
+                _ENCODING = tiktoken.get_encoding(os.getenv("PROMPT_TOKEN_ENCODING", "o200k_base"))
+            except Exception as e:
+                print(f"[WARN] ⚠️ tiktoken 不可用，prompt token 数改为估算: {e}")
+                _ENCODING_FAILED = True
+    return _ENCODING
+
+
+def _estimate_tokens(text: str) -> int:
+    """粗略估算：中日韩字符约 1 token / 字，其余字符约 4 字符 / token"""
+    cjk = sum(1 for char in text if "\u2e80" <= char <= "\u9fff" or "\uff00" <= char <= "\uffef")
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def count_tokens(text: str) -> Tuple[int, str]:
+    """返回 (token 数, 计数方式 "tiktoken" / "estimate")；PROMPT_TOKEN_COUNTER=estimate 时跳过 tiktoken"""
+    if os.getenv("PROMPT_TOKEN_COUNTER", "").strip().lower() != "estimate":
+        encoding = _get_encoding()
+        if encoding is not None:
+            return len(encoding.encode(text, disallowed_special=())), "tiktoken"
+    return _estimate_tokens(text), "estimate"
+
+
+_SECTION_TOKENS: Dict[str, int] = {}
+
+
+def omitted_section_tokens(families: Tuple[str, ...]) -> Tuple[List[str], int]:
+    """未发送的工艺段落及其 token 数（段落是静态文本，计数结果按段落缓存）"""
+    omitted = [family for family in FAMILY_ITEMS if family not in families]
+    total = 0
+    for family in omitted:
+        if family not in _SECTION_TOKENS:
+            _SECTION_TOKENS[family] = count_tokens(FAMILY_ITEMS[family])[0]
+        total += _SECTION_TOKENS[family]
+    return omitted, total
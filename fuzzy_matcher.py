@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+fuzzy_matcher.py — 基于字符 n-gram 倒排索引的模糊匹配
+功能：
+- 构建时把候选词表（如 CSV 中所有去重后的工序名）切成字符 trigram，建立 gram → 候选 的倒排索引
+- 查询时只访问与查询共享 gram 的候选，按 Dice 系数打分并排序，不做全表线性扫描
+- 工序编号敏感：查询中的数字（OP10 / OP20）与候选不一致时降分，避免 OP10 误配到 OP20
+- 查询没有指明编号而多个候选只差编号时（"Machining" → OP20 / OP30），由调用方判为歧义，
+  不静默选其中一个（见 same_numbering_family）
+"""
+
+import re
+from collections import defaultdict
+from typing import Dict, Iterable, List, Set, Tuple
+
+import numpy as np
+
+_DIGITS = re.compile(r"\d+")
+
+# 数字编号不一致时的降分系数
+DIGIT_MISMATCH_PENALTY = 0.5
+
+
+def _normalize(text: str) -> str:
+    return " ".join(str(text).split()).casefold()
+
+
+def same_numbering_family(a: str, b: str) -> bool:
+    """两个工序名去掉数字后相同、只有编号不同（"machining op20" / "machining op30"）"""
+    return a != b and _DIGITS.sub("#", _normalize(a)) == _DIGITS.sub("#", _normalize(b))
+
+
+def char_ngrams(text: str, n: int = 3) -> Set[str]:
+    """带首尾空格填充的字符 n-gram 集合（让词首 / 词尾也参与匹配）"""
+    padded = f" {text} "
+    if len(padded) <= n:
+        return {padded}
+    return {padded[i:i + n] for i in range(len(padded) - n + 1)}
+
+
+class NGramMatcher:
+    """候选词表的 n-gram 倒排索引，返回带分数的排序候选"""
+
+    def __init__(self, vocabulary: Iterable[str], n: int = 3) -> None:
+        self.n = n
+        self.terms: List[str] = []
+
+        grams_per_term: List[Set[str]] = []
+        digit_ids: Dict[Tuple[str, ...], int] = {(): -1}
+        term_digits: List[int] = []
+        postings: Dict[str, List[int]] = defaultdict(list)
+
+        seen = set()
+        for raw in vocabulary:
+            term = _normalize(raw)
+            if not term or term in seen:
+                continue
+            seen.add(term)
+
+            term_id = len(self.terms)
+            grams = char_ngrams(term, n)
+            self.terms.append(term)
+            grams_per_term.append(grams)
+            digits = tuple(_DIGITS.findall(term))
+            term_digits.append(digit_ids.setdefault(digits, len(digit_ids)))
+            for gram in grams:
+                postings[gram].append(term_id)
+
+        # 倒排表与每个候选的 gram 数、数字编号都转成数组，查询时向量化计算
+        self._postings: Dict[str, np.ndarray] = {
+            gram: np.asarray(ids, dtype=np.int32) for gram, ids in postings.items()
+        }
+        self._gram_counts = np.asarray([len(g) for g in grams_per_term], dtype=np.float64)
+        self._term_digits = np.asarray(term_digits, dtype=np.int32)
+        self._digit_ids = digit_ids
+
+    def __len__(self) -> int:
+        return len(self.terms)
+
+    def search(self, query: str, limit: int = 5, min_score: float = 0.0) -> List[Tuple[str, float]]:
+        """返回 [(候选, 分数)]，分数区间 0~1，按分数降序"""
+        text = _normalize(query)
+        if not text or not self.terms:
+            return []
+
+        query_grams = char_ngrams(text, self.n)
+        hits = [self._postings[gram] for gram in query_grams if gram in self._postings]
+        if not hits:
+            return []
+
+        # 每个候选与查询共享的 gram 数
+        overlaps = np.bincount(np.concatenate(hits), minlength=len(self.terms))
+        candidates = np.flatnonzero(overlaps)
+        scores = 2.0 * overlaps[candidates] / (len(query_grams) + self._gram_counts[candidates])
+
+        query_digits = tuple(_DIGITS.findall(text))
+        if query_digits:
+            query_digit_id = self._digit_ids.get(query_digits, -2)
+            term_digits = self._term_digits[candidates]
+            mismatch = (term_digits != -1) & (term_digits != query_digit_id)
+            scores = np.where(mismatch, scores * DIGIT_MISMATCH_PENALTY, scores)
+
+        keep = scores >= min_score
+        candidates, scores = candidates[keep], scores[keep]
+        if len(candidates) > limit:
+            top = np.argpartition(-scores, limit - 1)[:limit]
+            candidates, scores = candidates[top], scores[top]
+
+        ranked = sorted(
+            ((self.terms[term_id], round(float(score), 4)) for term_id, score in zip(candidates, scores)),
+            key=lambda item: (-item[1], item[0]),
+        )
+        return ranked[:limit]
@@ -37,6 +37,7 @@ def print_help():
     print("=" * 80)
     print("  help    - 显示此帮助信息")
     print("  reset   - 重置对话历史")
+    print("  reload  - 重新加载 CSV 基准数据（不重启 Agent；设置 BASELINE_RELOAD_INTERVAL 可自动热加载）")
     print("  quit    - 退出程序")
     print("  exit    - 退出程序")
     print("\n💡 示例问题:")
@@ -86,6 +87,10 @@ def main():
                 agent.reset()
                 continue
 
+            if user_input.lower() == "reload":
+                agent.tool.reload_baseline()
+                continue
+
             # 调用 Agent
             response = agent.chat(user_input)
 
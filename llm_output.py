@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+llm_output.py — LLM 成本推理输出的解析、修复与校验
+功能：
+- CostReasoningResult：与 prompt 中【输出 JSON 模板】一致的 Pydantic schema（允许额外字段）
+- repair_json：增量扫描修复被截断或轻微不合法的 JSON
+  （去掉 ```json 包裹与首尾杂文、补全未闭合的字符串 / 括号、删除尾随逗号与悬空的键、
+   转义字符串内的换行、把 True / False / None / NaN 换成 JSON 字面量）
+- parse_cost_result：先按标准 JSON 解析，失败时修复后再解析，最后用 schema 校验并规范数值
+这样格式小问题不会让一次完整的 LLM 调用白白作废。
+"""
+
+import json
+import re
+from typing import Annotated, Any, Dict, List, Tuple
+
+from pydantic import BaseModel, BeforeValidator, ConfigDict, ValidationError
+
+_FENCE = re.compile(r"```(?:json)?", re.IGNORECASE)
+_NUMBER = re.compile(r"-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?")
+
+# 修复时最多回退尝试的次数（每次尝试是一次 json.loads）
+MAX_REPAIR_ATTEMPTS = 64
+
+_LITERALS = {"True": "true", "False": "false", "None": "null", "NaN": "null", "nan": "null"}
+_CLOSERS = {"{": "}", "[": "]"}
+
+# prompt 已不再要求 LLM 换算目标单位；模型仍输出这些字段时丢弃，
+# 目标单位成本只来自本地换算（unit_conversion.py），避免同一结果里出现两个成本数字
+RETIRED_FIELDS = ("target_unit", "unit_conversion", "final_cost", "final_unit", "cost_breakdown")
+
+
+# --------------------------------------------------------------------------- #
+# schema
+# --------------------------------------------------------------------------- #
+def _to_number(value: Any) -> Any:
+    """数值字段容忍 "120"、"约 1,250.5 CNY/h" 这类写法；取不到数字时置为 None"""
+    if value is None or isinstance(value, (int, float)) and not isinstance(value, bool):
+        return value
+    if isinstance(value, str):
+        match = _NUMBER.search(value.replace(",", ""))
+        return float(match.group()) if match else None
+    return None
+
+
+Number = Annotated[float | None, BeforeValidator(_to_number)]
+
+
+class _Section(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+
+class ProcessingSpeed(_Section):
+    value: Number = None
+    unit: str | None = None
+    reasoning: str | None = None
+
+
+class BaseHourlyCost(_Section):
+    labor_CNY_per_hour: Number = None
+    energy_CNY_per_hour: Number = None
+    depreciation_CNY_per_hour: Number = None
+    total_CNY_per_hour: Number = None
+    reasoning: str | None = None
+
+
+class CostReasoningResult(_Section):
+    """LLM 成本推理结果（字段与 cost_prompts.OUTPUT_SCHEMA_SECTION 一一对应）"""
+
+    material_density_g_per_cm3: Number = None
+    calculated_weight_kg: Number = None
+    processing_speed: ProcessingSpeed | None = None
+    base_hourly_cost: BaseHourlyCost | None = None
+    detailed_reasoning: str | None = None
+
+
+# --------------------------------------------------------------------------- #
+# JSON 修复
+# --------------------------------------------------------------------------- #
+def strip_code_fences(text: str) -> str:
+    """去掉 ```json / ``` 包裹"""
+    return _FENCE.sub("", text).strip()
+
+
+def _close(out: List[str], stack: List[str]) -> str:
+    """在 out 末尾清理悬空的逗号 / 键，再按栈补全右括号"""
+    text = "".join(out).rstrip()
+    while text.endswith(","):
+        text = text[:-1].rstrip()
+    if text.endswith(":"):
+        # 只有键没有值："key": → 删除整个键
+        text = re.sub(r',?\s*"(?:[^"\\]|\\.)*"\s*:$', "", text).rstrip()
+    return text + "".join(_CLOSERS[opener] for opener in reversed(stack))
+
+
+def repair_json(text: str) -> str:
+    """
+    增量扫描并修复 JSON 文本，返回可被 json.loads 解析的字符串。
+    截断的输出会回退到最近一个完整的值再补全括号（不完整的最后一个字段被丢弃）。
+    无法修复时抛出 ValueError。
+    """
+    text = strip_code_fences(text)
+    start = min((i for i in (text.find("{"), text.find("[")) if i >= 0), default=-1)
+    if start < 0:
+        raise ValueError("LLM 输出中没有 JSON 对象")
+
+    out: List[str] = []
+    stack: List[str] = []
+    # 安全点：(out 长度, 当时的括号栈)，位于一个完整的值之后
+    safe_points: List[Tuple[int, List[str]]] = []
+    in_string = escaped = False
+    i, n = start, len(text)
+
+    while i < n:
+        char = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+            elif char == "\n":
+                char = "\\n"
+            out.append(char)
+            i += 1
+            continue
+
+        if char == '"':
+            in_string = True
+        elif char in _CLOSERS:
+            stack.append(char)
+            out.append(char)
+            i += 1
+            # 空容器本身就是完整的值
+            safe_points.append((len(out), list(stack)))
+            continue
+        elif char in "}]":
+            if not stack:
+                break
+            # 尾随逗号：{"a": 1,} → {"a": 1}
+            while out and (out[-1].isspace() or out[-1] == ","):
+                out.pop()
+            # 括号不匹配时以栈顶为准
+            out.append(_CLOSERS[stack.pop()])
+            i += 1
+            safe_points.append((len(out), list(stack)))
+            if not stack:
+                break
+            continue
+        elif char == ",":
+            safe_points.append((len(out), list(stack)))
+        elif char.isalpha():
+            # 裸字面量：True / False / None / NaN
+            j = i
+            while j < n and (text[j].isalnum() or text[j] == "_"):
+                j += 1
+            word = text[i:j]
+            out.append(_LITERALS.get(word, word))
+            i = j
+            continue
+        out.append(char)
+        i += 1
+
+    if not stack and out:
+        return "".join(out)
+
+    # 被截断：先尝试直接补全（补上未闭合的字符串），再依次回退到更早的安全点
+    tail = out + (['"'] if in_string else [])
+    candidates = [_close(tail, stack)]
+    for length, snapshot in reversed(safe_points[-MAX_REPAIR_ATTEMPTS:]):
+        candidates.append(_close(out[:length], snapshot))
+
+    for candidate in candidates:
+        try:
+            json.loads(candidate)
+            return candidate
+        except json.JSONDecodeError:
+            continue
+    raise ValueError("无法修复 LLM 输出的 JSON")
+
+
+def loads_lenient(text: str) -> Tuple[Any, bool]:
+    """返回 (解析结果, 是否经过修复)；先走标准解析，失败再修复"""
+    content = strip_code_fences(text)
+    try:
+        return json.loads(content), False
+    except json.JSONDecodeError:
+        return json.loads(repair_json(content)), True
+
+
+def parse_cost_result(text: str) -> Tuple[Dict[str, Any], bool, List[str]]:
+    """
+    解析并校验成本推理输出，返回 (结果 dict, 是否经过修复, schema 校验问题)。
+    校验通过时数值字段被规范为 float；校验失败时保留原始 dict，问题列表非空。
+    RETIRED_FIELDS 中的字段在校验前被丢弃。
+    """
+    data, repaired = loads_lenient(text)
+    if not isinstance(data, dict):
+        raise ValueError(f"LLM 输出应为 JSON 对象，实际为 {type(data).__name__}")
+    data = {key: value for key, value in data.items() if key not in RETIRED_FIELDS}
+
+    try:
+        result = CostReasoningResult.model_validate(data)
+    except ValidationError as e:
+        problems = [
+            f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}"
+            for error in e.errors()
+        ]
+        return data, repaired, problems
+    return result.model_dump(exclude_unset=True), repaired, []
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""
+part_costing.py — 按零件号汇总整条工艺路线的单件成本
+功能：
+- classify_routing：把 CSV 中某个零件号的路线行拆成
+  主材料单价（/kg）、材料损耗率（% of metal）、外购件（/bag、/pcs 等）、
+  增值工序（逐道交给 LLM 推理）与 SG&A + Profit 比例（%）
+- rollup：按 材料（单价 × 重量 × (1 + 损耗率)）+ 外购件 + 各增值工序 CNY/pcs
+  得到小计，再加 SG&A + Profit 得到单件总成本
+说明：原料单价、损耗率与 SG&A 比例取 CSV 的 Low / High 中值；主材料重量、外购件数量与其他材料用量可由调用方指定；
+增值工序成本来自 ProcessRateFinderTool.run_batch（CNY/pcs），与单工序查询的口径一致。
+"""
+
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+
+from baseline_index import MATERIAL_COLUMN, STEP_COLUMN, normalize_text
+from unit_conversion import material_density
+
+PART_TARGET_UNIT = "CNY/pcs"
+
+
+class PartCostingError(ValueError):
+    """零件号不存在或路线无法核算"""
+
+
+@dataclass
+class PartRouting:
+    """一个零件号的工艺路线（已分类）"""
+
+    part_number: str
+    location: str
+    material_name: str
+    material_price_per_kg: Optional[float] = None
+    scrap_pct: float = 0.0
+    sga_profit_pct: float = 0.0
+    components: List[Dict[str, Any]] = field(default_factory=list)
+    secondary_materials: List[Dict[str, Any]] = field(default_factory=list)
+    steps: List[str] = field(default_factory=list)
+
+
+def _clean(value: Any) -> str:
+    return "" if pd.isna(value) else " ".join(str(value).split())
+
+
+def midpoint(low: Any, high: Any) -> Optional[float]:
+    """Low / High 的中值；只有一侧有值时取该值，都为空时返回 None"""
+    values = [float(v) for v in (low, high) if v is not None and not pd.isna(v)]
+    return sum(values) / len(values) if values else None
+
+
+def _is_sga_step(step: str) -> bool:
+    text = normalize_text(step)
+    return "sg&a" in text or "profit" in text
+
+
+def classify_routing(routing: pd.DataFrame, material_name: Optional[str] = None) -> PartRouting:
+    """
+    把零件的路线行分类。material_name 未指定时，取增值工序中出现最多的材料作为主材料。
+    """
+    if routing.empty:
+        raise PartCostingError("零件路线为空")
+
+    part_number = _clean(routing["part_number"].iloc[0])
+    location = _clean(routing["Location"].iloc[0])
+    process_types = routing["process_type"].map(normalize_text)
+
+    if not material_name:
+        materials = routing.loc[process_types == "value_add", MATERIAL_COLUMN].map(_clean)
+        materials = materials[materials.map(normalize_text) != ""]
+        if materials.empty:
+            materials = routing.loc[process_types == "raw_material", MATERIAL_COLUMN].map(_clean)
+        material_name = materials.mode().iloc[0] if not materials.empty else ""
+
+    result = PartRouting(part_number=part_number, location=location, material_name=material_name)
+    main_material = normalize_text(material_name)
+
+    for (_, row), process_type in zip(routing.iterrows(), process_types):
+        step = _clean(row[STEP_COLUMN])
+        unit = normalize_text(row.get("Unit"))
+        value = midpoint(row.get("Low"), row.get("High"))
+
+        if process_type == "raw_material":
+            if unit.startswith("%"):
+                result.scrap_pct = value or 0.0
+            elif unit == "/kg":
+                entry = {"name": step, "price_CNY_per_kg": value}
+                if normalize_text(row.get(MATERIAL_COLUMN)) == main_material and result.material_price_per_kg is None:
+                    result.material_price_per_kg = value
+                else:
+                    result.secondary_materials.append(entry)
+            else:
+                result.components.append({"name": step, "price_CNY": value, "unit": _clean(row.get("Unit"))})
+        elif unit == "%" or _is_sga_step(step):
+            result.sga_profit_pct = value or 0.0
+        else:
+            result.steps.append(step)
+
+    return result
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return round(value, 4) if value is not None else None
+
+
+def estimate_weight_kg(material_name: str, volume_cm3: float) -> Optional[float]:
+    """体积 × 材料密度；密度未知时返回 None"""
+    density = material_density(material_name)
+    if density is None or not volume_cm3:
+        return None
+    return volume_cm3 * density / 1000.0
+
+
+def rollup(
+    routing: PartRouting,
+    weight_kg: Optional[float],
+    step_results: List[Dict[str, Any]],
+    component_quantities: Optional[Dict[str, float]] = None,
+    secondary_weights_kg: Optional[Dict[str, float]] = None,
+) -> Dict[str, Any]:
+    """
+    汇总单件成本（CNY/pcs）。step_results 与 routing.steps 一一对应，每项为
+    {"step", "ok", "cost", "error", ...}；失败或缺价的项计入 unpriced，complete 置为 False。
+    """
+    component_quantities = {normalize_text(k): v for k, v in (component_quantities or {}).items()}
+    secondary_weights_kg = {normalize_text(k): v for k, v in (secondary_weights_kg or {}).items()}
+    unpriced: List[str] = []
+
+    # 1. 主材料
+    material_cost = None
+    if routing.material_price_per_kg is not None and weight_kg:
+        material_cost = routing.material_price_per_kg * weight_kg * (1 + routing.scrap_pct / 100.0)
+    else:
+        unpriced.append(f"主材料 {routing.material_name}（缺少 /kg 单价或重量）")
+
+    # 2. 其他按重量计价的材料：需要调用方给出单件用量
+    secondary = []
+    for entry in routing.secondary_materials:
+        weight = secondary_weights_kg.get(normalize_text(entry["name"]))
+        cost = entry["price_CNY_per_kg"] * weight if weight and entry["price_CNY_per_kg"] is not None else None
+        if cost is None:
+            unpriced.append(f"材料 {entry['name']}（未提供单件用量 kg）")
+        secondary.append(dict(entry, weight_kg=weight, cost_CNY_per_pcs=_round(cost)))
+
+    # 3. 外购件：默认每件 1 个
+    components = []
+    for entry in routing.components:
+        quantity = component_quantities.get(normalize_text(entry["name"]), 1.0)
+        cost = entry["price_CNY"] * quantity if entry["price_CNY"] is not None else None
+        if cost is None:
+            unpriced.append(f"外购件 {entry['name']}（CSV 无单价）")
+        components.append(dict(entry, quantity=quantity, cost_CNY_per_pcs=_round(cost)))
+
+    # 4. 增值工序
+    value_add = []
+    for result in step_results:
+        if not result.get("ok") or result.get("cost") is None:
+            unpriced.append(f"工序 {result['step']}（{result.get('error') or '无成本结果'}）")
+        value_add.append(result)
+
+    def total(values: List[Optional[float]]) -> float:
+        return sum(v for v in values if v is not None)
+
+    material_total = total([material_cost] + [e["cost_CNY_per_pcs"] for e in secondary])
+    components_total = total([e["cost_CNY_per_pcs"] for e in components])
+    value_add_total = total([r.get("cost") for r in value_add])
+    subtotal = material_total + components_total + value_add_total
+    sga_profit = subtotal * routing.sga_profit_pct / 100.0
+
+    return {
+        "part_number": routing.part_number,
+        "location": routing.location,
+        "target_unit": PART_TARGET_UNIT,
+        "material": {
+            "name": routing.material_name,
+            "price_CNY_per_kg": routing.material_price_per_kg,
+            "weight_kg": round(weight_kg, 6) if weight_kg else weight_kg,
+            "scrap_pct": routing.scrap_pct,
+            "cost_CNY_per_pcs": _round(material_cost),
+        },
+        "secondary_materials": secondary,
+        "components": components,
+        "value_add": value_add,
+        "sga_profit_pct": routing.sga_profit_pct,
+        "summary": {
+            "material": round(material_total, 4),
+            "components": round(components_total, 4),
+            "value_add": round(value_add_total, 4),
+            "subtotal": round(subtotal, 4),
+            "sga_profit": round(sga_profit, 4),
+            "total_CNY_per_pcs": round(subtotal + sga_profit, 4),
+        },
+        "complete": not unpriced,
+        "unpriced": unpriced,
+    }
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""
+persistent_cache.py — 基于 SQLite 的持久化 TTL 缓存
+功能：
+- 磁盘持久化：进程重启后缓存仍然有效，多个脚本 / 进程可共享同一个缓存文件
+- TTL 过期：超过 ttl_seconds 的条目视为失效并在读取时清理
+- LRU 淘汰：条目数超过 max_entries 时，按最近访问时间淘汰最旧条目
+- 命中统计：记录 hits / misses / evictions，便于评估缓存效果
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+
+class PersistentTTLCache:
+    """线程安全的磁盘 TTL + LRU 缓存，值以 JSON 形式存储"""
+
+    def __init__(
+        self,
+        path: str,
+        namespace: str = "default",
+        ttl_seconds: float = 24 * 3600,
+        max_entries: int = 5000,
+    ) -> None:
+        self.path = path
+        self.namespace = namespace
+        self.ttl_seconds = float(ttl_seconds)
+        self.max_entries = int(max_entries)
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        try:
+            # WAL 模式允许多进程并发读写；部分文件系统不支持时退回默认模式
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        except sqlite3.DatabaseError:
+            pass
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS cache_entries (
+                namespace   TEXT NOT NULL,
+                key         TEXT NOT NULL,
+                value       TEXT NOT NULL,
+                created_at  REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                PRIMARY KEY (namespace, key)
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_cache_lru ON cache_entries (namespace, accessed_at)"
+        )
+        self._conn.commit()
+
+    # ------------------------------------------------------------------ #
+    # 键规范化
+    # ------------------------------------------------------------------ #
+    @staticmethod
+    def normalize_key(text: str) -> str:
+        """折叠空白并统一大小写，使等价查询命中同一条目"""
+        return " ".join(str(text).split()).casefold()
+
+    # ------------------------------------------------------------------ #
+    # 读写
+    # ------------------------------------------------------------------ #
+    def get(self, key: str) -> Optional[Any]:
+        """读取缓存；未命中或已过期返回 None"""
+        key = self.normalize_key(key)
+        now = time.time()
+
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM cache_entries WHERE namespace = ? AND key = ?",
+                (self.namespace, key),
+            ).fetchone()
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            value, created_at = row
+            if self.ttl_seconds > 0 and now - created_at > self.ttl_seconds:
+                self._conn.execute(
+                    "DELETE FROM cache_entries WHERE namespace = ? AND key = ?",
+                    (self.namespace, key),
+                )
+                self._conn.commit()
+                self.misses += 1
+                return None
+
+            self._conn.execute(
+                "UPDATE cache_entries SET accessed_at = ? WHERE namespace = ? AND key = ?",
+                (now, self.namespace, key),
+            )
+            self._conn.commit()
+            self.hits += 1
+
+        return json.loads(value)
+
+    def set(self, key: str, value: Any) -> None:
+        """写入缓存，并在超出容量时按 LRU 淘汰"""
+        key = self.normalize_key(key)
+        now = time.time()
+        payload = json.dumps(value, ensure_ascii=False)
+
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT OR REPLACE INTO cache_entries (namespace, key, value, created_at, accessed_at)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                (self.namespace, key, payload, now, now),
+            )
+            self._evict_locked()
+            self._conn.commit()
+
+    def delete(self, key: str) -> None:
+        """删除单个条目"""
+        key = self.normalize_key(key)
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM cache_entries WHERE namespace = ? AND key = ?",
+                (self.namespace, key),
+            )
+            self._conn.commit()
+
+    def clear(self) -> None:
+        """清空当前 namespace 下的所有条目"""
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM cache_entries WHERE namespace = ?", (self.namespace,)
+            )
+            self._conn.commit()
+
+    def _evict_locked(self) -> None:
+        """调用方需持有锁：删除过期条目，再按 accessed_at 淘汰超出容量的部分"""
+        if self.ttl_seconds > 0:
+            self._conn.execute(
+                "DELETE FROM cache_entries WHERE namespace = ? AND created_at < ?",
+                (self.namespace, time.time() - self.ttl_seconds),
+            )
+
+        if self.max_entries <= 0:
+            return
+
+        (count,) = self._conn.execute(
+            "SELECT COUNT(*) FROM cache_entries WHERE namespace = ?", (self.namespace,)
+        ).fetchone()
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                """
+                DELETE FROM cache_entries WHERE rowid IN (
+                    SELECT rowid FROM cache_entries
+                    WHERE namespace = ?
+                    ORDER BY accessed_at ASC
+                    LIMIT ?
+                )
+                """,
+                (self.namespace, overflow),
+            )
+            self.evictions += overflow
+
+    # ------------------------------------------------------------------ #
+    # 统计
+    # ------------------------------------------------------------------ #
+    def __len__(self) -> int:
+        with self._lock:
+            (count,) = self._conn.execute(
+                "SELECT COUNT(*) FROM cache_entries WHERE namespace = ?", (self.namespace,)
+            ).fetchone()
+        return int(count)
+
+    def stats(self) -> Dict[str, Any]:
+        """返回命中率等统计信息"""
+        total = self.hits + self.misses
+        return {
+            "namespace": self.namespace,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "size": len(self),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -13,9 +13,14 @@ import json
 from typing import Optional
 from dotenv import load_dotenv
 
-from langchain.agents import AgentExecutor, create_tool_calling_agent
+from langchain.agents import AgentExecutor
+from langchain.agents.format_scratchpad.tools import format_to_tool_messages
+from langchain.agents.output_parsers.tools import ToolsAgentOutputParser
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.prompt_values import PromptValue
+from langchain_core.runnables import RunnableLambda, RunnablePassthrough
 from langchain_openai import AzureChatOpenAI
+from langchain_openai.chat_models.base import BaseChatOpenAI
 from langchain_core.messages import AIMessage, HumanMessage
 # --------------------------------------------------------------------------------------
 # 1. 加载 .env 并配置公司代理（如果有 PROXY_URL）
@@ -40,13 +45,32 @@ else:
 # --------------------------------------------------------------------------------------
 # 导入你的工具
 from process_rate_finder_tool import ProcessRateFinderTool
+from resilience import RetryPolicy, call_with_retry
+from run_metrics import record_rate_limit_wait
 
 
 class ProcessCostAgent:
     """工艺成本智能 Agent"""
 
-    def __init__(self):
-        """初始化 Agent"""
+    def __init__(
+        self,
+        llm: Optional[AzureChatOpenAI] = None,
+        tool: Optional[ProcessRateFinderTool] = None,
+        llm_retry: Optional[RetryPolicy] = None,
+    ):
+        """
+        初始化 Agent
+
+        Args:
+            llm: Agent 使用的对话模型（默认按环境变量创建 AzureChatOpenAI）
+            tool: 成本查询工具（默认新建 ProcessRateFinderTool）；
+                  离线基准测试（benchmark_suite.py）通过这两个参数注入本地替身
+            llm_retry: Agent LLM 调用的重试策略（默认与工具的 llm_retry 相同）
+        """
+        self.llm = llm
+        self.tool = tool
+        self.llm_retry = llm_retry
+
         # 1. 加载 .env 文件
         BASE_DIR = os.path.dirname(__file__)
         env_path = os.path.join(BASE_DIR, ".env")
@@ -75,29 +99,42 @@ class ProcessCostAgent:
         """初始化 LLM、工具和 Agent"""
         print("🔄 正在初始化 Agent...")
 
-        # 1. 初始化 LLM
-        self.llm = AzureChatOpenAI(
-            deployment_name=os.getenv("AZURE_OPENAI_DEPLOYMENT"),
-            api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-            azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
-            api_version=os.getenv("AZURE_OPENAI_API_VERSION"),
-            temperature=1,
-        )
-        print("  ✓ Azure OpenAI 已连接")
-
-        # 2. 初始化工具
-        self.tool = ProcessRateFinderTool()
+        # 1. 初始化工具（Agent LLM 的重试策略与限流器沿用工具的配置）
+        if self.tool is None:
+            self.tool = ProcessRateFinderTool()
         self.tools = [self.tool.as_tool()]
+        if self.llm_retry is None:
+            self.llm_retry = self.tool.llm_retry
         print("  ✓ 工具已加载")
 
+        # 2. 初始化 LLM
+        if self.llm is None:
+            self.llm = AzureChatOpenAI(
+                deployment_name=os.getenv("AZURE_OPENAI_DEPLOYMENT"),
+                api_key=os.getenv("AZURE_OPENAI_API_KEY"),
+                azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+                api_version=os.getenv("AZURE_OPENAI_API_VERSION"),
+                temperature=1,
+                # 重试统一由 llm_retry 负责，避免与 openai 客户端内置重试叠加
+                max_retries=0,
+                timeout=self.llm_retry.attempt_timeout,
+            )
+        self.llm_takes_timeout = isinstance(self.llm, BaseChatOpenAI)
+        self.llm_with_tools = self.llm.bind_tools(self.tools)
+        print("  ✓ Azure OpenAI 已连接")
+
         # 3. 创建 Agent Prompt
         self.prompt = self._create_prompt()
 
-        # 4. 创建 Agent（使用 tool calling 而不是 function calling）
-        self.agent = create_tool_calling_agent(
-            llm=self.llm,
-            tools=self.tools,
-            prompt=self.prompt,
+        # 4. 创建 Agent（使用 tool calling 而不是 function calling）；
+        #    结构与 create_tool_calling_agent 相同，只是模型调用换成带限流与重试的 _invoke_llm
+        self.agent = (
+            RunnablePassthrough.assign(
+                agent_scratchpad=lambda x: format_to_tool_messages(x["intermediate_steps"])
+            )
+            | self.prompt
+            | RunnableLambda(self._invoke_llm, name="agent_llm")
+            | ToolsAgentOutputParser()
         )
 
         # 5. 创建 Executor
@@ -114,6 +151,30 @@ class ProcessCostAgent:
         self.chat_history = []
         print("✅ Agent 初始化成功！\n")
 
+    def _llm_once(self, prompt_value: PromptValue, timeout: Optional[float] = None):
+        """一次 Agent LLM 请求；timeout 作为 openai 客户端的单次请求超时"""
+        if timeout is None:
+            return self.llm_with_tools.invoke(prompt_value)
+        return self.llm_with_tools.invoke(prompt_value, timeout=timeout)
+
+    def _invoke_llm(self, prompt_value: PromptValue):
+        """带限流与重试的 Agent LLM 调用（与工具的成本推理共用 LLM 限流器，429 时遵守 Retry-After）"""
+        limiter = self.tool.llm_limiter
+        estimated = self.tool._estimate_llm_tokens(prompt_value)
+        response = call_with_retry(
+            (lambda timeout: self._llm_once(prompt_value, timeout)) if self.llm_takes_timeout
+            else (lambda: self._llm_once(prompt_value)),
+            self.llm_retry,
+            label="Agent LLM",
+            on_retry=self.tool._retry_hook("llm"),
+            before_attempt=(
+                (lambda: record_rate_limit_wait("llm", limiter.acquire(estimated))) if limiter else None
+            ),
+            pass_timeout=self.llm_takes_timeout,
+        )
+        self.tool._settle_llm_tokens(response, estimated)
+        return response
+
     def _create_prompt(self) -> ChatPromptTemplate:
         """创建 Agent 的系统提示词"""
         system_template = """
@@ -267,6 +328,13 @@ class ProcessCostAgent:
                 high = csv_baseline.get("high")
                 if low and high:
                     output.append(f"  • 参考区间: {low:.2f} - {high:.2f} {csv_baseline.get('unit')}")
+                    if csv_baseline.get("rows", 1) > 1:
+                        output.append(
+                            f"  • 汇总 {csv_baseline['rows']} 行 / {len(csv_baseline.get('suppliers') or [])} 家供应商，"
+                            f"中值 {csv_baseline.get('median')}，最近生效 {csv_baseline.get('latest_valid_time')}"
+                        )
+                elif csv_baseline.get("candidates"):
+                    output.append(f"  • 工序名有歧义，候选：{', '.join(csv_baseline['candidates'])}")
                 else:
                     output.append("  • 无匹配数据")
 
@@ -5,23 +5,77 @@ process_rate_finder_tool.py — v2.3（加入 KTL / Casting 提示词增强版
 特点：
 - 内部统一用 CNY/h 做“基准成本维度”
 - 目标单位 unit 完全由调用方传入，不在代码里硬编码任何枚举或 if-else
-- 单位转换全部交给 LLM 在 prompt 里基于专业知识推理
+- LLM 只负责 CNY/h 成本拆分和加工速度、材料密度等物理量的估算；
+  CNY/h → 目标单位的换算由 unit_conversion.py 在本地确定性完成（同一结果可用 reprice 换成多个单位）
 - 对 KTL coating / Casting 仅在提示词层给出“拆分结构”和“给出网址”的要求，不写死任何数值
 """
 
 import os
+import asyncio
+import contextvars
+import hashlib
 import json
-import re
-from typing import Dict, Any
+import math
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+from typing import Dict, Any, List, Tuple
 
 import pandas as pd
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, field_validator
 from dotenv import load_dotenv
+from langchain_core.runnables import RunnableLambda
 from langchain_core.tools import StructuredTool
-from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.prompt_values import PromptValue
 from langchain_openai import AzureChatOpenAI
+from langchain_openai.chat_models.base import BaseChatOpenAI
 from langchain_tavily import TavilySearch
 
+from baseline_cache import load_baseline_table
+from baseline_index import BaselineIndex
+from baseline_reloader import BaselineReloader
+from baseline_store import open_baseline_store
+from baseline_timeline import to_day
+from cost_prompts import (
+    PROMPT_VERSION,
+    count_tokens,
+    detect_process_families,
+    get_cost_prompt_template,
+    omitted_section_tokens,
+    precompile_cost_prompt_templates,
+)
+from llm_output import parse_cost_result
+from part_costing import (
+    PART_TARGET_UNIT,
+    PartCostingError,
+    PartRouting,
+    classify_routing,
+    estimate_weight_kg,
+    rollup,
+)
+from persistent_cache import PersistentTTLCache
+from rate_limiter import RateLimiter, get_rate_limiter
+from resilience import RetryPolicy, acall_with_retry, call_with_retry, log_retry
+from run_metrics import (
+    RunMetrics,
+    collect,
+    record_llm_cache,
+    record_rate_limit_wait,
+    record_retry,
+    record_search,
+    record_tokens,
+    stage,
+)
+from tavily_client import get_shared_tavily_search, request_timeout, supports_request_timeout
+from traffic_replay import (
+    RecordingSearchClient,
+    ReplaySearchClient,
+    TrafficChatModel,
+    get_traffic_store,
+    traffic_mode_from_env,
+)
+from unit_conversion import UnitConversionError, converter_from_llm_result
+
 load_dotenv()
 
 
@@ -40,12 +94,89 @@ class ProcessRateFinderArgs(BaseModel):
             "例如：CNY/h, CNY/cm³, CNY/kg, CNY/pcs, EUR/h, USD/kg 等。"
         ),
     )
+    as_of: str | None = Field(
+        None,
+        description=(
+            "可选：CSV 基准费率的回溯日期（如 2025-09-02 或 9/2/2025），"
+            "只对比截至该日期最近一次生效的费率；不填时使用全部基准数据。"
+        ),
+    )
+
+    @field_validator("as_of")
+    @classmethod
+    def _normalize_as_of(cls, value: str | None) -> str | None:
+        """统一为 ISO 日期；无法解析时校验失败"""
+        return None if value is None or not str(value).strip() else str(to_day(value))
+
+
+class RealtimeDataContext:
+    """
+    一批成本查询共享的实时数据上下文：
+    - 人工 / 能源数据只与 location 有关，每个地区只查询一次
+    - 设备 / 能耗数据只与 process_name 有关，每个工艺只查询一次
+    一条完整工艺路线（同一地区 N 道工序）只需约 2 + 2N 次搜索，而不是 4N 次。
+    线程安全：多个线程同时请求同一个地区 / 工艺时，只有一个线程真正发起查询，其余等待结果。
+    """
+
+    def __init__(self) -> None:
+        self._entries: Dict[Tuple[str, str], Future] = {}
+        self._lock = threading.Lock()
+        self.searches = 0
+
+    @staticmethod
+    def scope_key(scope: str, value: str) -> Tuple[str, str]:
+        """规范化作用域键（折叠空白、统一大小写）"""
+        return scope, " ".join(str(value).split()).casefold()
+
+    def claim(self, keys: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+        """登记需要的作用域，返回调用方负责查询的那部分（其余已被查询或正在查询中）"""
+        owned = []
+        with self._lock:
+            for key in keys:
+                if key not in self._entries:
+                    self._entries[key] = Future()
+                    owned.append(key)
+        return owned
+
+    def resolve(self, key: Tuple[str, str], data: Dict[str, str], searches: int = 0) -> None:
+        """写入某个作用域的查询结果，并唤醒等待中的线程"""
+        with self._lock:
+            self.searches += searches
+        self._entries[key].set_result(data)
+
+    def get(self, key: Tuple[str, str]) -> Future:
+        with self._lock:
+            return self._entries[key]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "locations": sum(1 for scope, _ in self._entries if scope == "location"),
+                "processes": sum(1 for scope, _ in self._entries if scope == "process"),
+                "searches": self.searches,
+            }
 
 
 class ProcessRateFinderTool:
     """工艺成本查询工具 - 完全由 LLM 推理，单位逻辑不在代码中硬编码"""
 
-    def __init__(self, llm: AzureChatOpenAI | None = None, csv_path: str | None = None) -> None:
+    def __init__(
+        self,
+        llm: AzureChatOpenAI | None = None,
+        csv_path: str | None = None,
+        search_cache: PersistentTTLCache | None = None,
+        search_client: TavilySearch | None = None,
+        llm_cache: PersistentTTLCache | None = None,
+        concurrent_search: bool = True,
+        search_timeout: float | None = None,
+        gather_deadline: float | None = None,
+        llm_retry: RetryPolicy | None = None,
+        search_retry: RetryPolicy | None = None,
+        llm_limiter: RateLimiter | None = None,
+        search_limiter: RateLimiter | None = None,
+        include_metrics: bool | None = None,
+        traffic_mode: str | None = None,
+    ) -> None:
         self.name = "process_rate_finder"
         self.description = (
             "通过 Tavily 查询实时价格数据，由 GPT 模型基于 metallurgical knowledge "
@@ -53,6 +184,18 @@ class ProcessRateFinderTool:
             "内部统一在 CNY/h 维度上建模，再转换到调用方指定的任意目标单位。"
         )
 
+        # LLM 重试策略（429 / 超时 / 5xx），见 resilience.py；LLM_RETRY_* / LLM_ATTEMPT_TIMEOUT 可覆盖
+        self.llm_retry = llm_retry or RetryPolicy.from_env(
+            "LLM", max_attempts=4, base_delay=1.0, max_delay=30.0, attempt_timeout=120.0, deadline=300.0
+        )
+
+        # 流量录制 / 回放（off / record / replay，默认取 RATE_TOOL_TRAFFIC_MODE），见 traffic_replay.py
+        self.traffic_mode = traffic_mode or traffic_mode_from_env()
+        self.traffic_store = get_traffic_store() if self.traffic_mode != "off" else None
+        if llm is None and self.traffic_mode == "replay":
+            # 回放不访问 Azure，也就不需要凭据
+            llm = TrafficChatModel(store=self.traffic_store, mode="replay")
+
         # LLM：从环境变量读取 Azure OpenAI 配置
         self.llm = llm or AzureChatOpenAI(
             deployment_name=os.getenv("AZURE_OPENAI_DEPLOYMENT"),
@@ -60,116 +203,641 @@ class ProcessRateFinderTool:
             azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
             api_version=os.getenv("AZURE_OPENAI_API_VERSION"),
             temperature=1.0,
+            # 重试统一由 llm_retry 负责，避免与 openai 客户端内置重试叠加
+            max_retries=0,
+            timeout=self.llm_retry.attempt_timeout,
         )
 
+        # 客户端限流（RPM / TPM 令牌桶），默认按环境变量取进程级共享实例，未配置额度时为 None；
+        # 回放不消耗服务端配额，不限流
+        replaying = self.traffic_mode == "replay"
+        self.llm_limiter = None if replaying else llm_limiter or get_rate_limiter("LLM")
+        self.search_limiter = None if replaying else search_limiter or get_rate_limiter("TAVILY")
+
+        # 成本推理实际调用的 LLM（默认开启 JSON mode，见 _bind_output_mode）
+        self.reasoning_llm = self._bind_output_mode(self.llm)
+        if self.traffic_mode == "record":
+            self.reasoning_llm = TrafficChatModel(
+                store=self.traffic_store, mode="record", inner=self.reasoning_llm
+            )
+        elif replaying:
+            self.reasoning_llm = TrafficChatModel(store=self.traffic_store, mode="replay")
+
+        # LLM 推理结果缓存（按渲染后 prompt 的哈希寻址，命中时跳过 LLM 调用与 JSON 解析）
+        self.llm_cache = llm_cache if llm_cache is not None else self._create_llm_cache()
+
         # Tavily API key
         self.tavily_key = os.getenv("TAVILY_API_KEY")
 
+        # Tavily 客户端：默认使用进程内共享、带 keep-alive 连接池的实例
+        if search_client is not None:
+            self.search_client = search_client
+        elif self.tavily_key:
+            self.search_client = get_shared_tavily_search(self.tavily_key, max_results=5)
+        else:
+            self.search_client = None
+
+        if self.traffic_mode == "record" and self.search_client is not None:
+            self.search_client = RecordingSearchClient(self.search_client, self.traffic_store)
+        elif self.traffic_mode == "replay":
+            self.search_client = ReplaySearchClient(self.traffic_store)
+
+        # 同步调用的单次超时直接交给 HTTP 客户端（requests / openai 的 timeout），
+        # 不能接收 timeout 的客户端（测试替身、录制回放）才由重试层放进线程池等待
+        self.search_takes_timeout = supports_request_timeout(self.search_client)
+        self.llm_takes_timeout = self.traffic_mode == "off" and isinstance(self.llm, BaseChatOpenAI)
+
+        # Tavily 搜索结果的磁盘缓存（同一地区 / 工艺的查询只需真正请求一次）
+        self.search_cache = search_cache if search_cache is not None else self._create_search_cache()
+
+        # 实时数据并发收集：单条查询超时 + 整体截止时间（秒）
+        self.concurrent_search = concurrent_search
+        self.search_timeout = (
+            search_timeout if search_timeout is not None
+            else float(os.getenv("TAVILY_QUERY_TIMEOUT", "20"))
+        )
+        self.gather_deadline = (
+            gather_deadline if gather_deadline is not None
+            else float(os.getenv("REALTIME_GATHER_DEADLINE", "30"))
+        )
+        # 单条查询的重试都在 search_timeout 内完成；TAVILY_RETRY_* 可覆盖
+        self.search_retry = search_retry or RetryPolicy.from_env(
+            "TAVILY", max_attempts=3, base_delay=0.5, max_delay=8.0, deadline=self.search_timeout
+        )
+
+        # run / arun 输出中是否附带分阶段耗时 / token 统计（见 run_metrics.py；进程级汇总始终开启）
+        self.include_metrics = (
+            include_metrics if include_metrics is not None
+            else os.getenv("RUN_METRICS_IN_OUTPUT", "false").strip().lower() in ("1", "true", "yes")
+        )
+
         # CSV 基准数据（仅用于结果对比）
         self.csv_path = csv_path or os.path.join(
             os.path.dirname(__file__),
             "data",
             "process_rates.csv",
         )
-        self.base_data = self._load_csv_data()
+        self.baseline_index = self._load_baseline_index()
+        # 同一键有多行时汇总全部匹配行（aggregate，默认）还是只取第一行（first）
+        self.baseline_aggregate = os.getenv("CSV_BASELINE_MODE", "aggregate").strip().lower() != "first"
+
+        # 基准数据热加载（BASELINE_RELOAD_INTERVAL 秒轮询一次，默认 0 = 关闭），见 baseline_reloader.py
+        self.baseline_reloader: BaselineReloader | None = None
+        reload_interval = self._reload_interval_from_env()
+        if reload_interval > 0:
+            self.start_baseline_reloader(reload_interval)
+
+        # 成本推理模板在进程级注册表中只解析一次，之后每次查询直接复用
+        precompile_cost_prompt_templates()
 
     # --------------------------------------------------------------------- #
     # CSV 相关
     # --------------------------------------------------------------------- #
-    def _load_csv_data(self) -> pd.DataFrame:
-        """加载 CSV 基准数据（仅用于对比）"""
+    @staticmethod
+    def _reload_interval_from_env() -> float:
+        """BASELINE_RELOAD_INTERVAL（秒）；不是有限正数时视为关闭，格式错误只打印警告，不影响工具初始化"""
+        raw = os.getenv("BASELINE_RELOAD_INTERVAL", "0").strip() or "0"
+        try:
+            interval = float(raw)
+        except ValueError:
+            print(f"[WARN] ⚠️ BASELINE_RELOAD_INTERVAL={raw!r} 不是数字，基准数据热加载保持关闭")
+            return 0.0
+        return interval if math.isfinite(interval) else 0.0
+
+    @property
+    def base_data(self) -> pd.DataFrame:
+        """基准数据 DataFrame（内存映射模式下首次访问时才物化）"""
+        return self.baseline_index.df
+
+    def _load_baseline_index(self, strict: bool = False) -> BaselineIndex:
+        """
+        BASELINE_STORE=mmap（默认）：内存映射列式缓存（baseline_store.py），多个工作进程共享页缓存，
+        不解析、不构建 DataFrame；BASELINE_STORE=memory 或关闭列式缓存时加载为内存 DataFrame。
+        strict=True（热加载）时加载失败直接抛出，而不是返回空索引。
+        """
+        mode = os.getenv("BASELINE_STORE", "mmap").strip().lower()
+        cache_off = os.getenv("BASELINE_CACHE", "on").strip().lower() in ("off", "0", "false", "no")
+        if mode == "mmap" and not cache_off and os.path.exists(self.csv_path):
+            try:
+                store, origin = open_baseline_store(self.csv_path)
+                print(f"[INFO] ✅ 成功加载 CSV 数据：{len(store)} 行（{origin}，内存映射）")
+                return store
+            except Exception as e:
+                print(f"[WARN] ⚠️ 内存映射基准数据不可用（{e}），改为加载到内存")
+        return BaselineIndex(self._load_csv_data(strict))
+
+    def _load_csv_data(self, strict: bool = False) -> pd.DataFrame:
+        """
+        加载 CSV / XLSX 基准数据（仅用于对比）；
+        经 baseline_cache 的列式缓存读取，源文件未变化时不再解析
+        """
         try:
-            df = pd.read_csv(self.csv_path, encoding="utf-8-sig")
-            print(f"[INFO] ✅ 成功加载 CSV 数据：{len(df)} 行")
+            df, origin = load_baseline_table(self.csv_path)
+            print(f"[INFO] ✅ 成功加载 CSV 数据：{len(df)} 行（{origin}）")
             return df
         except Exception as e:
+            if strict:
+                raise
             print(f"[WARN] ⚠️ CSV 加载失败：{e}")
             return pd.DataFrame()
 
+    def _reload_baseline_index(self) -> BaselineIndex:
+        """热加载用：加载失败或新表没有可查询的行（缺少键列 / 空表）时抛出，保留旧索引"""
+        index = self._load_baseline_index(strict=True)
+        if index.empty:
+            raise ValueError(f"{self.csv_path} 中没有可查询的基准数据行（缺少 Location / 工序 / 材料列或为空表）")
+        return index
+
+    def _swap_baseline_index(self, index: BaselineIndex) -> None:
+        # 单次属性赋值：查询（批量 / 整件核算为整批）在开始时取一次 self.baseline_index，之后一直使用同一个索引对象
+        self.baseline_index = index
+
+    def reload_baseline(self) -> bool:
+        """立即重新加载基准数据（在调用线程中构建新索引后原子替换）；失败时保留旧索引并返回 False"""
+        reloader = self.baseline_reloader or BaselineReloader(
+            self.csv_path, self._reload_baseline_index, self._swap_baseline_index
+        )
+        return reloader.reload()
+
+    def start_baseline_reloader(self, interval: float = 5.0) -> BaselineReloader:
+        """开启后台轮询热加载：源文件变化并稳定后在后台重建索引，再原子替换"""
+        if self.baseline_reloader is None:
+            self.baseline_reloader = BaselineReloader(
+                self.csv_path,
+                self._reload_baseline_index,
+                self._swap_baseline_index,
+                interval=interval,
+            )
+        return self.baseline_reloader.start()
+
+    def stop_baseline_reloader(self) -> None:
+        if self.baseline_reloader is not None:
+            self.baseline_reloader.stop()
+
     def _query_csv_baseline(
         self,
         location: str,
         process_name: str,
         material_name: str,
+        aggregate: bool | None = None,
+        as_of: Any = None,
+        index: BaselineIndex | None = None,
     ) -> Dict[str, Any]:
-        """从 CSV 查询基准数据（仅用于对比，不参与计算）"""
-        if self.base_data.empty:
+        """
+        从 CSV 查询基准数据（仅用于对比，不参与计算）
+        依次走规范化后的精确索引（O(1)）→ 工序名 n-gram 模糊匹配 → 子串匹配。
+        aggregate（默认取 CSV_BASELINE_MODE）：
+        - True：汇总全部匹配行，low / high 为区间包络，另附 median / rows / latest_valid_time / suppliers
+          （键分组的统计在加载时预计算，见 baseline_aggregate.py）
+        - False：只取第一条匹配行（旧行为）
+        as_of（date / "2025-09-02" / "9/2/2025"）：只看截至该日期（含）最近一个 valid_time 生效的行，
+        在按键分组的时间索引上二分查找；不指定时使用全部匹配行。
+        index：批量 / 整件核算时由调用方在开始时取一次传入，保证同一批查询看到同一版本的基准数据。
+        """
+        index = self.baseline_index if index is None else index
+        if index.empty:
             return {}
 
-        df = self.base_data
-
-        filtered = df[
-            df["Location"].str.contains(location, case=False, na=False)
-            & df["sub_process step"].str.contains(process_name, case=False, na=False)
-            & df["material_name"].str.contains(material_name, case=False, na=False)
-        ]
-
-        if filtered.empty:
-            print(f"[WARN] CSV 中未找到匹配：{location} | {process_name} | {material_name}")
+        positions, method, score = index.lookup(location, process_name, material_name)
+        if method == "ambiguous":
+            candidates = index.ambiguous_steps(location, process_name, material_name)
+            print(
+                f"[WARN] ⚠️ 工序 {process_name} 同时匹配到只差编号的多道工序 {candidates}，"
+                f"请在工序名中指明编号（如 OP20）"
+            )
+            return {"source": "CSV基准数据", "match": method, "match_score": score, "candidates": candidates}
+        if not len(positions):
+            candidates = index.match_steps(process_name, limit=3)
+            print(
+                f"[WARN] CSV 中未找到匹配：{location} | {process_name} | {material_name}"
+                f"（相近工序：{candidates}）"
+            )
             return {}
 
-        row = filtered.iloc[0]
-        return {
+        if as_of is not None:
+            as_of = to_day(as_of)
+            positions = index.as_of(positions, method, as_of)
+            if not len(positions):
+                print(f"[WARN] CSV 中 {location} | {process_name} | {material_name} 在 {as_of} 之前没有生效的费率")
+                return {}
+
+        row = index.row(positions[0])
+        unit = row.get("Unit")
+        result = {
             "low": float(row.get("Low", 0)) if pd.notna(row.get("Low")) else None,
             "high": float(row.get("High", 0)) if pd.notna(row.get("High")) else None,
-            "unit": row.get("Unit", "UNKNOWN"),
+            "unit": unit if pd.notna(unit) else "UNKNOWN",
             "source": "CSV基准数据",
+            "match": method,
+            "match_score": score,
+            "matched_step": str(row.get("sub_process step", "")).strip(),
         }
+        if as_of is not None:
+            result["as_of"] = str(as_of)
+            result["valid_time"] = index.valid_time(positions[0])
+
+        aggregate = self.baseline_aggregate if aggregate is None else aggregate
+        if aggregate:
+            # 按 as_of 收窄后的行集合不再是完整的键分组，现场统计
+            summary = index.summarize(positions, method if as_of is None else "as_of")
+            result.update(
+                low=summary["low"],
+                high=summary["high"],
+                median=summary["median"],
+                rows=summary["rows"],
+                latest_valid_time=summary["latest_valid_time"],
+                suppliers=summary["suppliers"],
+            )
+        return result
+
+    # --------------------------------------------------------------------- #
+    # 缓存
+    # --------------------------------------------------------------------- #
+    @staticmethod
+    def _create_cache(
+        env_prefix: str,
+        namespace: str,
+        filename: str,
+        default_ttl: float,
+    ) -> PersistentTTLCache | None:
+        """
+        按环境变量创建磁盘缓存（env_prefix 例如 TAVILY_CACHE / LLM_CACHE）：
+        - {env_prefix}_PATH：缓存文件路径（默认 ./.cache/<filename>）
+        - {env_prefix}_TTL：过期秒数（设为 0 表示关闭缓存）
+        - {env_prefix}_MAX_ENTRIES：最大条目数，超出按 LRU 淘汰（默认 5000）
+        """
+        try:
+            ttl = float(os.getenv(f"{env_prefix}_TTL", str(default_ttl)))
+            if ttl <= 0:
+                return None
+
+            path = os.getenv(f"{env_prefix}_PATH") or os.path.join(
+                os.path.dirname(__file__),
+                ".cache",
+                filename,
+            )
+            return PersistentTTLCache(
+                path=path,
+                namespace=namespace,
+                ttl_seconds=ttl,
+                max_entries=int(os.getenv(f"{env_prefix}_MAX_ENTRIES", "5000")),
+            )
+        except Exception as e:
+            print(f"[WARN] ⚠️ {namespace} 缓存初始化失败，将不使用缓存：{e}")
+            return None
+
+    @classmethod
+    def _create_search_cache(cls) -> PersistentTTLCache | None:
+        """Tavily 搜索缓存：默认 1 天过期"""
+        return cls._create_cache("TAVILY_CACHE", "tavily", "tavily_search_cache.sqlite3", 86400)
+
+    @classmethod
+    def _create_llm_cache(cls) -> PersistentTTLCache | None:
+        """LLM 推理结果缓存：默认 7 天过期"""
+        return cls._create_cache("LLM_CACHE", "llm", "llm_response_cache.sqlite3", 7 * 86400)
+
+    @staticmethod
+    def _bind_output_mode(llm: Any) -> Any:
+        """
+        LLM_OUTPUT_MODE=json_mode（默认）：OpenAI / Azure OpenAI 模型绑定
+        response_format={"type": "json_object"}，由服务端保证输出是合法 JSON 对象；
+        LLM_OUTPUT_MODE=text：不绑定（部署或 API 版本不支持 JSON mode 时使用）。
+        两种模式下都由 llm_output.parse_cost_result 做修复与 schema 校验。
+        """
+        mode = os.getenv("LLM_OUTPUT_MODE", "json_mode").strip().lower()
+        if mode == "json_mode" and isinstance(llm, BaseChatOpenAI):
+            return llm.bind(response_format={"type": "json_object"})
+        return llm
+
+    def _llm_cache_key(self, prompt_text: str) -> str:
+        """以“模型标识 + 渲染后的完整 prompt”的 SHA-256 作为缓存键"""
+        model_id = (
+            getattr(self.llm, "deployment_name", None)
+            or getattr(self.llm, "model_name", None)
+            or type(self.llm).__name__
+        )
+        temperature = getattr(self.llm, "temperature", None)
+        digest = hashlib.sha256(
+            f"{model_id}|{temperature}\n{prompt_text}".encode("utf-8")
+        ).hexdigest()
+        return f"cost_reasoning:{digest}"
 
     # --------------------------------------------------------------------- #
     # Tavily 搜索
     # --------------------------------------------------------------------- #
+
     def _tavily_search(self, query: str) -> str:
         """Tavily 搜索封装（不做任何数值“兜底”，只返回原始文本）"""
-        if not self.tavily_key:
+        started = time.perf_counter()
+        shortcut = self._search_shortcut(query)
+        if shortcut is not None:
+            return shortcut
+
+        print(f"🔍 Tavily 查询: {query}")
+        try:
+            result = call_with_retry(
+                (lambda timeout: self._search_once(query, timeout)) if self.search_takes_timeout
+                else (lambda: self._search_once(query)),
+                self.search_retry,
+                label=f"Tavily 查询 [{query}]",
+                on_retry=self._retry_hook("tavily"),
+                before_attempt=self._acquire_search_budget if self.search_limiter else None,
+                pass_timeout=self.search_takes_timeout,
+            )
+        except Exception as e:
+            return self._search_failed(query, started, e)
+        return self._search_succeeded(query, started, result)
+
+    def _search_shortcut(self, query: str) -> str | None:
+        """不需要真正请求时直接给出结果：缓存命中返回缓存文本，未配置 API key 返回空串；否则返回 None"""
+        started = time.perf_counter()
+        if self.search_cache is not None:
+            cached = self.search_cache.get(query)
+            if cached is not None:
+                print(f"⚡ Tavily 缓存命中: {query}")
+                record_search(query, (time.perf_counter() - started) * 1000.0, "cache")
+                return cached
+
+        if self.search_client is None:
             print("[WARN] Tavily API key 未配置，跳过在线查询")
+            record_search(query, 0.0, "skipped")
             return ""
+        return None
 
-        try:
-            search = TavilySearch(api_key=self.tavily_key, max_results=5)
-            print(f"🔍 Tavily 查询: {query}")
-            result = search.invoke(query)
+    @staticmethod
+    def _search_failed(query: str, started: float, error: Exception) -> str:
+        print(f"[WARN] Tavily 查询失败: {error}")
+        record_search(query, (time.perf_counter() - started) * 1000.0, "error")
+        return ""
+
+    def _search_succeeded(self, query: str, started: float, result: Any) -> str:
+        """取出结果文本、记录耗时并写入缓存"""
+        # ToolMessage / AIMessage 等
+        if hasattr(result, "content"):
+            text = str(result.content or "")
+        # 其他类型（str / dict 等）
+        else:
+            text = "" if result is None else str(result)
+
+        record_search(query, (time.perf_counter() - started) * 1000.0, "tavily")
+        # 只缓存有效结果，失败 / 空结果下次仍会重新查询
+        if text and self.search_cache is not None:
+            self.search_cache.set(query, text)
+        return text
+
+    def _search_once(self, query: str, timeout: float | None = None) -> Any:
+        """一次 Tavily 请求；timeout 作为 requests 的超时（None 时用客户端默认值）"""
+        with request_timeout(timeout):
+            return self._raise_search_error(self.search_client.invoke(query))
+
+    @staticmethod
+    def _raise_search_error(result: Any) -> Any:
+        """TavilySearch 出错时不抛异常而是返回 {"error": e}，这里转成异常交给重试层判断"""
+        if isinstance(result, dict) and "error" in result:
+            error = result["error"]
+            raise error if isinstance(error, Exception) else RuntimeError(str(error))
+        return result
 
-            # ToolMessage / AIMessage 等
-            if hasattr(result, "content"):
-                return str(result.content or "")
+    @staticmethod
+    def _retry_hook(kind: str):
+        """重试回调：记录到本次查询的 metrics 并打印日志"""
+        def hook(label: str, attempt: int, error: BaseException, delay: float) -> None:
+            record_retry(kind)
+            log_retry(label, attempt, error, delay)
+        return hook
 
-            # 其他类型（str / dict 等）
-            return "" if result is None else str(result)
+    def _acquire_search_budget(self) -> None:
+        record_rate_limit_wait("tavily", self.search_limiter.acquire())
+
+    async def _aacquire_search_budget(self) -> None:
+        record_rate_limit_wait("tavily", await self.search_limiter.aacquire())
+
+    async def _atavily_search(self, query: str) -> str:
+        """_tavily_search 的异步版本（await search_client.ainvoke）"""
+        started = time.perf_counter()
+        shortcut = self._search_shortcut(query)
+        if shortcut is not None:
+            return shortcut
+
+        async def search_once() -> Any:
+            return self._raise_search_error(await self.search_client.ainvoke(query))
+
+        print(f"🔍 Tavily 查询(async): {query}")
+        try:
+            result = await acall_with_retry(
+                search_once,
+                self.search_retry,
+                label=f"Tavily 查询 [{query}]",
+                on_retry=self._retry_hook("tavily"),
+                before_attempt=self._aacquire_search_budget if self.search_limiter else None,
+            )
         except Exception as e:
-            print(f"[WARN] Tavily 查询失败: {e}")
-            return ""
+            return self._search_failed(query, started, e)
+        return self._search_succeeded(query, started, result)
 
     # --------------------------------------------------------------------- #
     # 实时数据收集
     # --------------------------------------------------------------------- #
-    def _gather_realtime_data(self, location: str, process_name: str) -> Dict[str, str]:
-        """收集所有实时数据（人工、能源、设备、工艺信息）"""
+    @staticmethod
+    def _location_queries(location: str) -> Dict[str, str]:
+        """只与地区相关的查询：人工、能源价格"""
+        return {
+            "labor_data": f"China {location} manufacturing labor cost per hour 2025 CNY",
+            "energy_data": f"China {location} industrial electricity water natural gas price 2025",
+        }
+
+    @staticmethod
+    def _process_queries(process_name: str) -> Dict[str, str]:
+        """只与工艺相关的查询：设备折旧、工艺能耗"""
+        return {
+            "equipment_data": f"{process_name} process equipment cost depreciation manufacturing",
+            "consumption_data": f"{process_name} process energy consumption electricity water gas",
+        }
+
+    def _search_queries(self, queries: Dict[str, str]) -> Dict[str, str]:
+        """按配置并发或串行执行一组查询"""
+        if not queries:
+            return {}
+        if self.concurrent_search:
+            return self._run_searches_concurrently(queries)
+        return {key: self._tavily_search(query) for key, query in queries.items()}
+
+    def _claim_realtime_queries(
+        self,
+        location: str,
+        process_name: str,
+        context: RealtimeDataContext | None,
+    ) -> Tuple[Dict[str, str], List[Tuple[Tuple[str, str], Dict[str, str]]]]:
+        """
+        返回 (本次需要执行的查询, 由本次负责 resolve 的 (作用域键, 查询))。
+        没有 context 时四条查询都由本次执行；有 context 时只执行本次认领到的地区 / 工艺数据。
+        """
+        scopes = [
+            (("location", location), self._location_queries(location)),
+            (("process", process_name), self._process_queries(process_name)),
+        ]
+        if context is None:
+            return {key: query for _, queries in scopes for key, query in queries.items()}, []
+
+        scopes = [(context.scope_key(*scope), queries) for scope, queries in scopes]
+        owned = context.claim([key for key, _ in scopes])
+        claimed = [(key, queries) for key, queries in scopes if key in owned]
+        pending = {key: query for _, queries in claimed for key, query in queries.items()}
+        return pending, claimed
+
+    @staticmethod
+    def _resolve_realtime(
+        context: RealtimeDataContext | None,
+        claimed: List[Tuple[Tuple[str, str], Dict[str, str]]],
+        fetched: Dict[str, str],
+    ) -> None:
+        """把本次认领的数据交给 context（查询失败时为空串），等待同一数据的其他查询随之继续"""
+        for key, queries in claimed:
+            context.resolve(key, {name: fetched.get(name, "") for name in queries}, searches=len(queries))
+
+    @staticmethod
+    def _realtime_futures(context: RealtimeDataContext, location: str, process_name: str) -> List[Future]:
+        return [
+            context.get(context.scope_key("location", location)),
+            context.get(context.scope_key("process", process_name)),
+        ]
+
+    def _gather_realtime_data(
+        self,
+        location: str,
+        process_name: str,
+        context: RealtimeDataContext | None = None,
+    ) -> Dict[str, str]:
+        """
+        收集所有实时数据（人工、能源、设备、工艺信息）
+        传入 context 时，地区数据与工艺数据分别在整个批次内只查询一次。
+        """
         print("\n[INFO] 📡 开始收集实时数据...")
 
-        labor_query = f"China {location} manufacturing labor cost per hour 2025 CNY"
-        energy_query = f"China {location} industrial electricity water natural gas price 2025"
-        equipment_query = f"{process_name} process equipment cost depreciation manufacturing"
-        consumption_query = f"{process_name} process energy consumption electricity water gas"
+        pending, claimed = self._claim_realtime_queries(location, process_name, context)
+        results: Dict[str, str] = {}
+        try:
+            results = self._search_queries(pending)
+        finally:
+            # 无论成功与否都要 resolve，避免其他线程永久等待
+            self._resolve_realtime(context, claimed, results)
+
+        if context is not None:
+            for future in self._realtime_futures(context, location, process_name):
+                results.update(future.result())
+
+        print("[INFO] ✅ 实时数据收集完成\n")
+        return self._with_fallback_text(results)
+
+    async def _agather_realtime_data(
+        self,
+        location: str,
+        process_name: str,
+        context: RealtimeDataContext | None = None,
+    ) -> Dict[str, str]:
+        """_gather_realtime_data 的异步版本：四条查询在同一个事件循环内并发执行"""
+        print("\n[INFO] 📡 开始收集实时数据（async）...")
+
+        pending, claimed = self._claim_realtime_queries(location, process_name, context)
+        results: Dict[str, str] = {}
+        try:
+            results = await self._asearch_queries(pending)
+        finally:
+            self._resolve_realtime(context, claimed, results)
 
-        labor_data = self._tavily_search(labor_query)
-        energy_data = self._tavily_search(energy_query)
-        equipment_data = self._tavily_search(equipment_query)
-        consumption_data = self._tavily_search(consumption_query)
+        if context is not None:
+            for future in self._realtime_futures(context, location, process_name):
+                results.update(await asyncio.wrap_future(future))
 
         print("[INFO] ✅ 实时数据收集完成\n")
+        return self._with_fallback_text(results)
 
+    @staticmethod
+    def _with_fallback_text(results: Dict[str, str]) -> Dict[str, str]:
+        """没有查到的数据用说明文字占位，让 LLM 知道需要自行假设"""
         return {
-            "labor_data": labor_data or "未查询到人工成本数据",
-            "energy_data": energy_data or "未查询到能源价格数据",
-            "equipment_data": equipment_data or "未查询到设备信息",
-            "consumption_data": consumption_data or "未查询到工艺能耗数据",
+            "labor_data": results["labor_data"] or "未查询到人工成本数据",
+            "energy_data": results["energy_data"] or "未查询到能源价格数据",
+            "equipment_data": results["equipment_data"] or "未查询到设备信息",
+            "consumption_data": results["consumption_data"] or "未查询到工艺能耗数据",
         }
 
+    async def _asearch_queries(self, queries: Dict[str, str]) -> Dict[str, str]:
+        """
+        异步并发执行多条查询，超时规则与 _run_searches_concurrently 一致：
+        单条查询 search_timeout 秒，整体 gather_deadline 秒。
+        """
+        if not queries:
+            return {}
+
+        async def search_one(query: str) -> str:
+            try:
+                return await asyncio.wait_for(self._atavily_search(query), timeout=self.search_timeout)
+            except asyncio.TimeoutError:
+                print(f"[WARN] ⏱️ Tavily 查询超时，跳过: {query}")
+                return ""
+
+        tasks = {
+            key: asyncio.ensure_future(search_one(query))
+            for key, query in queries.items()
+        }
+        done, pending = await asyncio.wait(tasks.values(), timeout=self.gather_deadline)
+        for task in pending:
+            task.cancel()
+
+        results: Dict[str, str] = {}
+        for key, task in tasks.items():
+            if task in done and not task.cancelled() and task.exception() is None:
+                results[key] = task.result()
+            else:
+                if task in pending:
+                    print(f"[WARN] ⏱️ 超过整体截止时间，跳过: {queries[key]}")
+                results[key] = ""
+        return results
+
+    def _run_searches_concurrently(self, queries: Dict[str, str]) -> Dict[str, str]:
+        """
+        用线程池并发执行多条 Tavily 查询：
+        - 每条查询最多等待 search_timeout 秒
+        - 全部查询共享 gather_deadline 秒的整体截止时间
+        超时的查询按“未查询到”处理；后台线程完成后仍会写入搜索缓存，供下次复用。
+        """
+        results: Dict[str, str] = {}
+        executor = ThreadPoolExecutor(
+            max_workers=max(1, len(queries)),
+            thread_name_prefix="tavily-search",
+        )
+
+        start = time.monotonic()
+        deadline_at = start + self.gather_deadline
+        futures = {
+            # 每个任务复制一份当前 context，查询耗时才能记到本次 run 的 metrics 上
+            key: executor.submit(contextvars.copy_context().run, self._tavily_search, query)
+            for key, query in queries.items()
+        }
+
+        try:
+            for key, future in futures.items():
+                limit_at = min(start + self.search_timeout, deadline_at)
+                remaining = max(0.0, limit_at - time.monotonic())
+                try:
+                    results[key] = future.result(timeout=remaining)
+                except FuturesTimeoutError:
+                    print(f"[WARN] ⏱️ Tavily 查询超时，跳过: {queries[key]}")
+                    results[key] = ""
+                except Exception as e:
+                    print(f"[WARN] Tavily 查询失败: {e}")
+                    results[key] = ""
+        finally:
+            # 不等待超时线程，避免拖慢整体耗时
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        return results
+
     # --------------------------------------------------------------------- #
-    # LLM 推理（单位逻辑统一从 prompt 层处理）
+    # LLM 推理（只推理 CNY/h 与加工速度，目标单位在 _build_output 中本地换算）
     # --------------------------------------------------------------------- #
-    def _llm_cost_reasoning(
+    def _render_cost_prompt(
         self,
         location: str,
         process_name: str,
@@ -177,203 +845,286 @@ class ProcessRateFinderTool:
         surface_area: float,
         volume: float,
         annual_volume: int,
-        target_unit: str,
         realtime_data: Dict[str, str],
-    ) -> Dict[str, Any]:
+    ) -> PromptValue:
         """
-        让 LLM 基于实时数据推理工艺成本：
-        - 内部始终先在 CNY/h 维度拆成本（labor / energy / depreciation）
-        - 然后再根据 target_unit 做单位转换
-        - target_unit 可以是任何字符串，LLM 需要自己判断如何从 CNY/h 转到目标单位
-        """
-
-        prompt_template = ChatPromptTemplate.from_template(
-            """
-你是一位资深的制造业成本工程师，精通 metallurgical processes 和 cost estimation。
-
-你的任务：
-1. 结合实时数据（人工、能源、设备折旧、工艺能耗）和专业知识，估算 {process_name} 工艺的成本。
-2. 内部请统一先在 CNY/h 维度上建模和拆分成本（labor + energy + depreciation）。
-3. 然后将 CNY/h 转换为用户指定的最终计费单位："{target_unit}"。
-   - 这个单位是完全自由字符串，可能是 CNY/h, CNY/cm³, CNY/kg, CNY/pcs, EUR/h, USD/kg, CNY/m² 等。
-   - 你需要根据这个单位的含义，推理出合理的转换方式。
-   - 如果目标单位与 CNY/h 无法直接通过物理量（体积、质量、表面积、件数、时间等）转换，请在 reasoning 中说明你的假设并给出一个清晰的转换逻辑。
-4. 所有推理必须有物理和经济上的合理性，不能凭空拍脑袋。
-
--------------------------
-【工艺参数】
-- 地区：{location}
-- 工艺：{process_name}
-- 材料：{material_name}
-- 表面积：{surface_area} cm²
-- 体积：{volume} cm³
-- 年产量：{annual_volume} 件/年
-- 目标计费单位（完全自由字符串）：{target_unit}
-
-【实时数据（原始文本，仅供你理解和提取数值）】
-- 人工成本数据：
-{labor_data}
-
-- 能源价格数据：
-{energy_data}
-
-- 设备成本 / 折旧数据：
-{equipment_data}
-
-- 工艺能耗数据：
-{consumption_data}
--------------------------
-【语言要求】
-- 所有 reasoning 字段（包括 processing_speed.reasoning、base_hourly_cost.reasoning、
-  unit_conversion.reasoning、detailed_reasoning）必须全部使用中文撰写。
-- JSON 的字段名保持英文（如 processing_speed、final_cost），但所有描述性文字必须输出中文。
--------------------------
-
--------------------------
-【推理与单位转换要求】
-
-1. 先在 CNY/h 维度上建立 cost model，将成本拆解为：
-   - labor_CNY_per_hour
-   - energy_CNY_per_hour
-   - depreciation_CNY_per_hour
-   - total_CNY_per_hour
-
-2. 如果工艺名称包含 "KTL"（例如 "KTL coating"），请参考典型 KTL 产线在实际商务 Workshop 中的拆分结构来构建成本模型（但不要照搬任何具体项目的数值，只学习结构和思路），可包括但不限于：
-   - 管理与间接人工：
-     - 如 workshop manager、shift leader、assistant、quality controller 等。
-     - 用“人数 × RMB/小时 × 小时/天 / 产量（housing/天）”的方式先折算到单件，再统一折算到 CNY/h。
-   - 直接操作工人工：
-     - 根据操作工人数、工资水平（RMB/小时）、每天工作小时数和产量，计算每件人工成本，并统一到 CNY/h。
-   - 设备折旧（KTL 线投资）：
-     - 基于整条 KTL 线的投资金额，采用长期折旧思路（例如按 10 年、每年工作天数、每天工作小时数等逻辑）；
-     - 不把折旧只摊在单一客户项目上，而是考虑多项目、多年的综合利用。
-   - 厂房/空间成本：
-     - 参考“面积 m² × RMB/m² / 月或天 / 产量”这种结构；
-     - 注意如果只部分时间给某个客户生产，应按实际利用时间分摊，而不是 100% 全部摊给该客户。
-   - 能源成本：
-     - 以总功率 kW、利用率（0~1）、每日运行小时数以及当地电价（RMB/kWh）为基础；
-     - 必要时可补充压缩空气、天然气、水处理等能耗成本。
-   - 维护与治具成本：
-     - 如 racks、plastic caps、passivation line、water treatment 等；
-     - 以“每月/每天维护或更换费用 / 产量”的结构折算到每件，再统一折算到 CNY/h。
-   - 质量检测与实验成本：
-     - 如盐雾试验、清洁测试、水测试、拉拔测试等；
-     - 将年度或每日测试费用按频次和产量分摊到单件，再统一到 CNY/h。
-   - 其他间接费用 / RMOC / Overhead：
-     - 在“直接成本小计”基础上施加合理的百分比（例如管理附加、风险附加等），
-     - 但必须在 reasoning 中写清楚采用的百分比区间与依据，仅作为假设。
-   - Scrap 报废成本：
-     - 采用合理的 Scrap Rate（%）区间；
-     - 将 Scrap 视为“合格件成本 × Scrap Rate”的附加成本。
-   在 detailed_reasoning 中，请像商务 Workshop 一样，清晰列出各项假设（人数、工时、功率、面积、Scrap 率等）和每一项的计算逻辑，最终仍需汇总为 CNY/h 维度的 base_hourly_cost。
-
-3. 如果工艺与高压压铸 / Die casting / HPDC 相关（例如 process_name 包含 "Casting"），请在设备折旧部分显式考虑压铸机投资，并遵守以下要求：
-   - 你可以通过实时数据搜索，获取类似“1250t Toshiba die casting machine / 东芝 1250t 压铸机”的市场公开报价或投资金额，用于估算折旧成本。
-   - 当你在推理中实际采用了某个公开网页上的设备价格（尤其是 1250t 东芝压铸机的价格）时：
-     - 必须在 detailed_reasoning 或 base_hourly_cost.reasoning 文本中，写出你引用该价格的公开网页 URL，
-       例如增加一行 `"source_url": "https://......"` 或 类似 “设备价格参考来源：https://......” 的说明。
-     - URL 必须是真实可访问的网页地址，而不是随意编造的字符串。
-     - 同时注明“该价格仅为公开市场参考价，用于折旧估算，并非合同价或最终报价”。
-   - 如果在线搜索没有获得可靠或明确的设备报价网页：
-     - 请在 detailed_reasoning 中明确写出“未找到可靠的 1250t 东芝压铸机公开报价 URL”的情况；
-     - 根据同吨位压铸机的一般价格区间或行业常识，给出一个合理的假设投资金额；
-     - 解释你假设的依据（例如行业报告、类似机型价格区间），但不要伪造 URL。
-   - 压铸机折旧思路仍应采用长期折旧 + 产能分摊（例如按年工作小时数、利用率、小时产能等），
-     避免把设备投资只摊在单一项目的总量上。
-
-4. 完成上述工艺成本建模（包括 KTL 或 Casting 等特殊要求，如果适用）后，再根据 {target_unit} 的含义，设计一个合理的单位转换逻辑，例如：
-   - 如果 {target_unit} 是 "CNY/cm³"：
-     - 说明你如何估算单位时间内可加工体积（cm³/h），并将 CNY/h 换算为 CNY/cm³。
-   - 如果 {target_unit} 是 "CNY/kg"：
-     - 估算材料密度（g/cm³），计算单件重量（kg），推理单位时间可加工质量（kg/h），再完成转换。
-   - 如果 {target_unit} 是 "CNY/pcs"：
-     - 估算单位时间内可加工件数（pcs/h），从而转换为 CNY/pcs。
-   - 如果 {target_unit} 是其它自定义单位（例如货币不同、包含多个物理量）：
-     - 在 reasoning 中清楚解释你是如何从 CNY/h 映射到该单位的，并确保逻辑自洽。
-
-5. 如果缺少某项数据，可以根据中国或全球制造业的典型区间给出一个合理区间，并在 reasoning 中明确标注为“假设”。
-
-6. 最终输出必须是 **纯 JSON**，不能包含任何 markdown 语法或 ```json 包裹。
-
--------------------------
-【输出 JSON 模板（示例结构）】
-
-请严格按以下结构输出（字段可以根据需要扩展，但不要删除已有字段）：
-
-{{
-  "target_unit": "{target_unit}",
-  "material_density_g_per_cm3": <如果需要按质量相关单位，则给出估算的材料密度，否则可以为 null>,
-  "calculated_weight_kg": <如果需要按质量相关单位，则给出单件估算重量，否则可以为 null>,
-  "processing_speed": {{
-    "value": <数值>,
-    "unit": "<例如 cm³/h 或 kg/h 或 pcs/h 等>",
-    "reasoning": "<你是如何估算加工速度的>"
-  }},
-  "base_hourly_cost": {{
-    "labor_CNY_per_hour": <数值>,
-    "energy_CNY_per_hour": <数值>,
-    "depreciation_CNY_per_hour": <数值>,
-    "total_CNY_per_hour": <数值>,
-    "reasoning": "<成本拆分的详细推理过程>"
-  }},
-  "unit_conversion": {{
-    "from_unit": "CNY/h",
-    "to_unit": "{target_unit}",
-    "conversion_factor": <数值>,
-    "reasoning": "<单位转换的推理过程，尤其是如何从 CNY/h 得到目标单位的>"
-  }},
-  "final_cost": <数值>,
-  "final_unit": "{target_unit}",
-  "cost_breakdown": {{
-    "labor": <数值>,
-    "energy": <数值>,
-    "depreciation": <数值>
-  }},
-  "detailed_reasoning": "<完整推理过程，包括所有关键假设和中间步骤>"
-}}
-
-注意：
-- 你可以根据目标单位自由设计转换逻辑，但必须保证物理和经济上合理。
-- 如果目标单位过于奇怪或信息不足，无法给出可靠转换，请在 detailed_reasoning 里解释局限性。
-- 必须输出纯 JSON，不能有 ```json 或 ``` 包裹。
-"""
+        渲染成本推理 prompt：
+        - LLM 在 CNY/h 维度拆成本（labor / energy / depreciation），并估算加工速度与材料密度
+        - prompt 不含目标单位：同一工艺换不同单位查询渲染出同一个 prompt，共用 LLM 缓存
+        """
+
+        # KTL / Casting 等工艺段落只在工艺名称命中对应工艺族时加入（见 cost_prompts.py）；
+        # 模板已预编译，format_prompt 直接渲染，省去 Runnable.invoke 的回调与配置开销
+        prompt_template = get_cost_prompt_template(process_name)
+
+        return prompt_template.format_prompt(
+            location=location,
+            process_name=process_name,
+            material_name=material_name,
+            surface_area=surface_area,
+            volume=volume,
+            annual_volume=annual_volume,
+            **realtime_data,
+        )
+
+    @staticmethod
+    def _prompt_stats(process_name: str, prompt_value: PromptValue) -> Dict[str, Any]:
+        """统计本次 prompt 的 token 数，以及因工艺族不匹配而省略的段落"""
+        families = detect_process_families(process_name)
+        prompt_tokens, counter = count_tokens(prompt_value.to_string())
+        omitted, omitted_tokens = omitted_section_tokens(families)
+        stats = {
+            "prompt_version": PROMPT_VERSION,
+            "process_families": list(families),
+            "omitted_sections": omitted,
+            "prompt_tokens": prompt_tokens,
+            "omitted_tokens": omitted_tokens,
+            "token_counter": counter,
+        }
+        print(
+            f"[INFO] 📏 Prompt tokens: {prompt_tokens}（{counter}），"
+            f"省略段落 {omitted or '无'} 约 {omitted_tokens} tokens"
         )
+        return stats
+
+    @staticmethod
+    def _llm_usage(response: Any) -> Dict[str, Any]:
+        """
+        从 LLM 响应中提取 token 用量，包括 Azure OpenAI prompt 前缀缓存命中的 token 数：
+        优先读 usage_metadata.input_token_details.cache_read，
+        否则读 response_metadata.token_usage.prompt_tokens_details.cached_tokens
+        """
+        usage = getattr(response, "usage_metadata", None) or {}
+        token_usage = (getattr(response, "response_metadata", None) or {}).get("token_usage") or {}
+
+        input_tokens = usage.get("input_tokens", token_usage.get("prompt_tokens"))
+        output_tokens = usage.get("output_tokens", token_usage.get("completion_tokens"))
+        cached_tokens = (usage.get("input_token_details") or {}).get("cache_read")
+        if cached_tokens is None:
+            cached_tokens = (token_usage.get("prompt_tokens_details") or {}).get("cached_tokens")
+
+        return {
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "cached_tokens": cached_tokens or 0,
+            "cached_ratio": round((cached_tokens or 0) / input_tokens, 4) if input_tokens else 0.0,
+        }
+
+    def _lookup_llm_cache(
+        self,
+        prompt_value: PromptValue,
+        use_cache: bool,
+        refresh_cache: bool,
+    ) -> Tuple[PersistentTTLCache | None, str, Dict[str, Any] | None]:
+        """
+        返回 (cache, cache_key, cached_result)：
+        - use_cache=False：完全绕过缓存（不读也不写）
+        - refresh_cache=True：忽略已有缓存，重新调用 LLM 并覆盖缓存
+        """
+        cache = self.llm_cache if use_cache else None
+        if cache is None:
+            return None, "", None
+
+        cache_key = self._llm_cache_key(prompt_value.to_string())
+        cached = None if refresh_cache else cache.get(cache_key)
+        record_llm_cache(cached is not None)
+        return cache, cache_key, cached
+
+    def _estimate_llm_tokens(self, prompt_value: PromptValue) -> int:
+        """TPM 限流的预估用量：prompt token 数 + 预留的输出 token 数（LLM_RATE_LIMIT_OUTPUT_TOKENS）"""
+        if self.llm_limiter is None or "tokens" not in self.llm_limiter.rates:
+            return 0
+        prompt_tokens, _ = count_tokens(prompt_value.to_string())
+        return prompt_tokens + int(os.getenv("LLM_RATE_LIMIT_OUTPUT_TOKENS", "1500"))
+
+    def _token_correction(self, response: Any, estimated: int) -> int:
+        """实际 token 用量与预估之差（用于校正 TPM 令牌桶）；未预估或无用量信息时为 0"""
+        if not estimated:
+            return 0
+        usage = self._llm_usage(response)
+        if usage["input_tokens"] is None:
+            return 0
+        return usage["input_tokens"] + (usage["output_tokens"] or 0) - estimated
+
+    def _settle_llm_tokens(self, response: Any, estimated: int) -> None:
+        """调用完成后用实际 token 用量校正 TPM 令牌桶"""
+        correction = self._token_correction(response, estimated)
+        if correction:
+            self.llm_limiter.adjust(correction)
+
+    async def _asettle_llm_tokens(self, response: Any, estimated: int) -> None:
+        correction = self._token_correction(response, estimated)
+        if correction:
+            await self.llm_limiter.aadjust(correction)
+
+    def _llm_once(self, prompt_value: PromptValue, timeout: float | None = None) -> Any:
+        """一次 LLM 请求；timeout 作为 openai 客户端的单次请求超时（None 时用构造时的 timeout）"""
+        if timeout is None:
+            return self.reasoning_llm.invoke(prompt_value)
+        return self.reasoning_llm.invoke(prompt_value, timeout=timeout)
+
+    def _invoke_llm(self, prompt_value: PromptValue) -> Any:
+        """带限流与重试的 LLM 调用（429 时遵守 Retry-After，受单次超时与总截止时间约束）"""
+        estimated = self._estimate_llm_tokens(prompt_value)
+        with stage("llm"):
+            response = call_with_retry(
+                (lambda timeout: self._llm_once(prompt_value, timeout)) if self.llm_takes_timeout
+                else (lambda: self._llm_once(prompt_value)),
+                self.llm_retry,
+                label="LLM 推理",
+                on_retry=self._retry_hook("llm"),
+                before_attempt=(
+                    (lambda: record_rate_limit_wait("llm", self.llm_limiter.acquire(estimated)))
+                    if self.llm_limiter else None
+                ),
+                pass_timeout=self.llm_takes_timeout,
+            )
+        record_tokens(self._llm_usage(response))
+        self._settle_llm_tokens(response, estimated)
+        return response
+
+    async def _ainvoke_llm(self, prompt_value: PromptValue) -> Any:
+        estimated = self._estimate_llm_tokens(prompt_value)
+
+        async def acquire_budget() -> None:
+            record_rate_limit_wait("llm", await self.llm_limiter.aacquire(estimated))
+
+        with stage("llm"):
+            response = await acall_with_retry(
+                lambda: self.reasoning_llm.ainvoke(prompt_value),
+                self.llm_retry,
+                label="LLM 推理",
+                on_retry=self._retry_hook("llm"),
+                before_attempt=acquire_budget if self.llm_limiter else None,
+            )
+        record_tokens(self._llm_usage(response))
+        await self._asettle_llm_tokens(response, estimated)
+        return response
+
+    def _llm_batch_runnable(self) -> RunnableLambda:
+        """批量调用时每个 prompt 独立重试，某条退避等待不会阻塞同批其他 prompt"""
+        return RunnableLambda(self._invoke_llm, afunc=self._ainvoke_llm, name="cost_reasoning_llm")
+
+    @staticmethod
+    def _parse_llm_content(content: str) -> Dict[str, Any]:
+        """
+        解析 LLM 输出：标准 JSON 解析失败时增量修复（截断、```json 包裹、尾随逗号等），
+        再按 CostReasoningResult 校验并规范数值字段；无法修复时抛出异常
+        """
+        result, repaired, problems = parse_cost_result(content)
+        if repaired:
+            print("[WARN] ⚠️ LLM 输出不是合法 JSON，已自动修复（被截断的最后一个字段会被丢弃）")
+            result["json_repaired"] = True
+        if problems:
+            print(f"[WARN] ⚠️ LLM 输出与 schema 不一致，保留原始结构: {problems[:3]}")
+        return result
 
+    @staticmethod
+    def _llm_error_result(error: Exception) -> Dict[str, Any]:
+        print(f"[ERROR] ❌ LLM 推理失败: {error}")
+        return {
+            "error": f"LLM推理失败: {str(error)}",
+            "base_hourly_cost": {},
+        }
+
+    def _prepare_llm_reasoning(
+        self,
+        location: str,
+        process_name: str,
+        material_name: str,
+        surface_area: float,
+        volume: float,
+        annual_volume: int,
+        realtime_data: Dict[str, str],
+        use_cache: bool,
+        refresh_cache: bool,
+    ) -> Tuple[PromptValue, Dict[str, Any], PersistentTTLCache | None, str, Dict[str, Any] | None]:
+        """
+        渲染 prompt 并查询 LLM 缓存，返回 (prompt, prompt 统计, 缓存, 缓存键, 命中时的结果)；
+        命中结果已附上本次的 prompt 统计，调用方直接返回即可
+        """
+        with stage("prompt_render"):
+            prompt_value = self._render_cost_prompt(
+                location, process_name, material_name, surface_area,
+                volume, annual_volume, realtime_data,
+            )
+            # prompt 统计随结果返回，但不写入缓存
+            prompt_stats = self._prompt_stats(process_name, prompt_value)
+        cache, cache_key, cached = self._lookup_llm_cache(prompt_value, use_cache, refresh_cache)
+        if cached is not None:
+            print("[INFO] ⚡ LLM 缓存命中，跳过推理\n")
+            cached = dict(cached, prompt_stats=prompt_stats)
+        return prompt_value, prompt_stats, cache, cache_key, cached
+
+    def _finish_llm_reasoning(
+        self,
+        response: Any,
+        prompt_stats: Dict[str, Any],
+        cache: PersistentTTLCache | None,
+        cache_key: str,
+    ) -> Dict[str, Any]:
+        """解析 LLM 响应、写缓存，附上 prompt 统计与 token 用量"""
+        result = self._parse_llm_content(response.content)
+        llm_usage = self._llm_usage(response)
+        print(f"[INFO] ✅ LLM 推理完成（输入 {llm_usage['input_tokens']} tokens，前缀缓存命中 {llm_usage['cached_tokens']}）\n")
+
+        if cache is not None:
+            cache.set(cache_key, result)
+        return dict(result, prompt_stats=prompt_stats, llm_usage=llm_usage)
+
+    def _llm_cost_reasoning(
+        self,
+        location: str,
+        process_name: str,
+        material_name: str,
+        surface_area: float,
+        volume: float,
+        annual_volume: int,
+        realtime_data: Dict[str, str],
+        use_cache: bool = True,
+        refresh_cache: bool = False,
+    ) -> Dict[str, Any]:
+        """让 LLM 基于实时数据推理工艺成本（use_cache / refresh_cache 见 _lookup_llm_cache）"""
         print("[INFO] 🧠 LLM 开始推理成本...")
 
         try:
-            chain = prompt_template | self.llm
-            response = chain.invoke(
-                {
-                    "location": location,
-                    "process_name": process_name,
-                    "material_name": material_name,
-                    "surface_area": surface_area,
-                    "volume": volume,
-                    "annual_volume": annual_volume,
-                    "target_unit": target_unit,
-                    **realtime_data,
-                }
+            prompt_value, prompt_stats, cache, cache_key, cached = self._prepare_llm_reasoning(
+                location, process_name, material_name, surface_area, volume, annual_volume,
+                realtime_data, use_cache, refresh_cache,
             )
+            if cached is not None:
+                return cached
+            response = self._invoke_llm(prompt_value)
+            return self._finish_llm_reasoning(response, prompt_stats, cache, cache_key)
+        except Exception as e:
+            return self._llm_error_result(e)
 
-            content = response.content.strip()
-            # 防止 LLM 用 ```json 包裹
-            content = re.sub(r"```json\s*", "", content)
-            content = re.sub(r"```\s*", "", content)
-            content = content.strip()
-
-            result = json.loads(content)
-            print("[INFO] ✅ LLM 推理完成\n")
-            return result
+    async def _allm_cost_reasoning(
+        self,
+        location: str,
+        process_name: str,
+        material_name: str,
+        surface_area: float,
+        volume: float,
+        annual_volume: int,
+        realtime_data: Dict[str, str],
+        use_cache: bool = True,
+        refresh_cache: bool = False,
+    ) -> Dict[str, Any]:
+        """_llm_cost_reasoning 的异步版本（await llm.ainvoke）"""
+        print("[INFO] 🧠 LLM 开始推理成本（async）...")
 
+        try:
+            prompt_value, prompt_stats, cache, cache_key, cached = self._prepare_llm_reasoning(
+                location, process_name, material_name, surface_area, volume, annual_volume,
+                realtime_data, use_cache, refresh_cache,
+            )
+            if cached is not None:
+                return cached
+            response = await self._ainvoke_llm(prompt_value)
+            return self._finish_llm_reasoning(response, prompt_stats, cache, cache_key)
         except Exception as e:
-            print(f"[ERROR] ❌ LLM 推理失败: {e}")
-            return {
-                "error": f"LLM推理失败: {str(e)}",
-                "final_cost": None,
-                "final_unit": target_unit,
-                "base_hourly_cost": {},
-            }
+            return self._llm_error_result(e)
 
     # --------------------------------------------------------------------- #
     # 对外主入口
@@ -387,9 +1138,123 @@ class ProcessRateFinderTool:
         volume: float,
         annual_volume: int,
         unit: str,
+        realtime_context: RealtimeDataContext | None = None,
+        use_cache: bool = True,
+        refresh_cache: bool = False,
+        include_metrics: bool | None = None,
+        as_of: Any = None,
     ) -> str:
-        """主执行函数：负责串联 CSV 对比、实时数据和 LLM 推理"""
+        """
+        主执行函数：负责串联 CSV 对比、实时数据和 LLM 推理
+        多道工序共用同一个 realtime_context 时，地区 / 工艺数据只会查询一次。
+        use_cache / refresh_cache 控制 LLM 结果缓存（绕过 / 强制刷新）。
+        include_metrics 为 True 时输出附带 metrics（分阶段耗时 / token / 缓存命中 / 重试），默认取实例设置。
+        as_of 只影响 CSV 基准对比：取截至该日期最近一次生效的费率（见 _query_csv_baseline）。
+        """
 
+        self._print_query_banner(
+            location, process_name, material_name, surface_area, volume, annual_volume, unit, as_of
+        )
+
+        with collect("run") as metrics:
+            # 1. CSV 基准（仅用于对比）
+            with stage("csv_lookup"):
+                csv_baseline = self._query_csv_baseline(location, process_name, material_name, as_of=as_of)
+
+            # 2. 实时数据
+            with stage("realtime_data"):
+                realtime_data = self._gather_realtime_data(location, process_name, realtime_context)
+
+            # 3. LLM 推理成本
+            llm_result = self._llm_cost_reasoning(
+                location=location,
+                process_name=process_name,
+                material_name=material_name,
+                surface_area=surface_area,
+                volume=volume,
+                annual_volume=annual_volume,
+                realtime_data=realtime_data,
+                use_cache=use_cache,
+                refresh_cache=refresh_cache,
+            )
+
+            output = self._build_output(
+                location, process_name, material_name, surface_area, volume, annual_volume, unit,
+                csv_baseline, llm_result,
+            )
+        self._attach_metrics(output, metrics, include_metrics)
+        return json.dumps(output, ensure_ascii=False, indent=2)
+
+    async def arun(
+        self,
+        location: str,
+        process_name: str,
+        material_name: str,
+        surface_area: float,
+        volume: float,
+        annual_volume: int,
+        unit: str,
+        realtime_context: RealtimeDataContext | None = None,
+        use_cache: bool = True,
+        refresh_cache: bool = False,
+        include_metrics: bool | None = None,
+        as_of: Any = None,
+    ) -> str:
+        """run 的异步版本：搜索与 LLM 调用都在事件循环内 await，不占用线程"""
+        self._print_query_banner(
+            location, process_name, material_name, surface_area, volume, annual_volume, unit, as_of
+        )
+
+        with collect("run") as metrics:
+            # 1. CSV 基准（内存查询，直接同步执行）
+            with stage("csv_lookup"):
+                csv_baseline = self._query_csv_baseline(location, process_name, material_name, as_of=as_of)
+
+            # 2. 实时数据
+            with stage("realtime_data"):
+                realtime_data = await self._agather_realtime_data(location, process_name, realtime_context)
+
+            # 3. LLM 推理成本
+            llm_result = await self._allm_cost_reasoning(
+                location=location,
+                process_name=process_name,
+                material_name=material_name,
+                surface_area=surface_area,
+                volume=volume,
+                annual_volume=annual_volume,
+                realtime_data=realtime_data,
+                use_cache=use_cache,
+                refresh_cache=refresh_cache,
+            )
+
+            output = self._build_output(
+                location, process_name, material_name, surface_area, volume, annual_volume, unit,
+                csv_baseline, llm_result,
+            )
+        self._attach_metrics(output, metrics, include_metrics)
+        return json.dumps(output, ensure_ascii=False, indent=2)
+
+    def _attach_metrics(
+        self,
+        output: Dict[str, Any],
+        metrics: RunMetrics,
+        include_metrics: bool | None,
+    ) -> None:
+        """按需把本次查询的统计放进输出（总耗时在 collect 退出时才确定，所以在 with 之后调用）"""
+        if include_metrics if include_metrics is not None else self.include_metrics:
+            output["metrics"] = metrics.to_dict()
+
+    @staticmethod
+    def _print_query_banner(
+        location: str,
+        process_name: str,
+        material_name: str,
+        surface_area: float,
+        volume: float,
+        annual_volume: int,
+        unit: str,
+        as_of: Any = None,
+    ) -> None:
         print("\n" + "=" * 80)
         print("🚀 工艺成本查询 - 完全由 LLM 推理")
         print("=" * 80)
@@ -400,26 +1265,27 @@ class ProcessRateFinderTool:
         print(f"📊 体积: {volume} cm³")
         print(f"📦 年产量: {annual_volume:,} 件")
         print(f"💰 目标单位: {unit}（自由字符串，无硬编码枚举）")
+        if as_of is not None:
+            print(f"🗓️ 基准回溯日期: {as_of}")
         print("=" * 80 + "\n")
 
-        # 1. CSV 基准（仅用于对比）
-        csv_baseline = self._query_csv_baseline(location, process_name, material_name)
-
-        # 2. 实时数据
-        realtime_data = self._gather_realtime_data(location, process_name)
-
-        # 3. LLM 推理成本
-        llm_result = self._llm_cost_reasoning(
-            location=location,
-            process_name=process_name,
-            material_name=material_name,
-            surface_area=surface_area,
-            volume=volume,
-            annual_volume=annual_volume,
-            target_unit=unit,
-            realtime_data=realtime_data,
-        )
-
+    @staticmethod
+    def _build_output(
+        location: str,
+        process_name: str,
+        material_name: str,
+        surface_area: float,
+        volume: float,
+        annual_volume: int,
+        unit: str,
+        csv_baseline: Dict[str, Any],
+        llm_result: Dict[str, Any],
+    ) -> Dict[str, Any]:
+        """组装 run / arun / run_batch 的输出结构"""
+        # prompt_stats / llm_usage 描述的是本次调用，提到输出顶层，不混在 LLM 推理结果里
+        llm_result = dict(llm_result)
+        prompt_stats = llm_result.pop("prompt_stats", None)
+        llm_usage = llm_result.pop("llm_usage", None)
         output: Dict[str, Any] = {
             "query": {
                 "location": location,
@@ -432,19 +1298,457 @@ class ProcessRateFinderTool:
             },
             "csv_baseline": csv_baseline,
             "llm_reasoning": llm_result,
-            "final_cost": llm_result.get("final_cost"),
-            "final_unit": llm_result.get("final_unit", unit),
+            "final_cost": None,
+            "final_unit": unit,
             "base_hourly_cost": (
                 llm_result.get("base_hourly_cost", {}) or {}
             ).get("total_CNY_per_hour"),
+            "final_cost_source": None,
         }
+        if prompt_stats is not None:
+            output["prompt_stats"] = prompt_stats
+        if llm_usage is not None:
+            output["llm_usage"] = llm_usage
 
-        return json.dumps(output, ensure_ascii=False, indent=2)
+        # 目标单位只在本地换算（CNY/h + 加工速度 + 几何 / 密度 / 汇率）；无法换算时 final_cost 为 None
+        if "error" not in llm_result:
+            try:
+                conversion = converter_from_llm_result(
+                    llm_result, volume, surface_area, material_name
+                ).convert(unit)
+                output["final_cost"] = round(conversion["final_cost"], 6)
+                output["final_cost_source"] = "local_conversion"
+                output["local_unit_conversion"] = conversion
+                output["cost_breakdown"] = ProcessRateFinderTool._cost_breakdown(
+                    llm_result, conversion["conversion_factor"]
+                )
+            except UnitConversionError as e:
+                output["local_unit_conversion"] = {"error": str(e)}
+        return output
+
+    @staticmethod
+    def _cost_breakdown(llm_result: Dict[str, Any], factor: float | None) -> Dict[str, Any]:
+        """CNY/h 下的人工 / 能源 / 折旧按同一换算系数折算到目标单位"""
+        hourly = llm_result.get("base_hourly_cost") or {}
+        breakdown: Dict[str, Any] = {}
+        for name in ("labor", "energy", "depreciation"):
+            value = hourly.get(f"{name}_CNY_per_hour")
+            breakdown[name] = (
+                round(float(value) * factor, 6)
+                if isinstance(value, (int, float)) and factor is not None else None
+            )
+        return breakdown
+
+    def reprice(self, result: str | Dict[str, Any], units: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        把一次 run() 的结果在本地换算成多个目标单位（不再调用 LLM）：
+        tool.reprice(result_json, ["CNY/h", "CNY/kg", "CNY/cm³", "CNY/pcs", "USD/h"])
+        """
+        data = json.loads(result) if isinstance(result, str) else result
+        query = data.get("query", {})
+        try:
+            converter = converter_from_llm_result(
+                data.get("llm_reasoning", {}),
+                query.get("volume_cm3"),
+                query.get("surface_area_cm2"),
+                query.get("material_name"),
+            )
+        except UnitConversionError as e:
+            return {unit: {"error": str(e)} for unit in units}
+        return converter.convert_many(units)
+
+    # --------------------------------------------------------------------- #
+    # 批量入口
+    # --------------------------------------------------------------------- #
+    def _prepare_batch(
+        self,
+        queries: List[Dict[str, Any]],
+    ) -> Tuple[List[Dict[str, Any]], List[ProcessRateFinderArgs | None]]:
+        """校验每条查询；非法查询直接记为该条的错误，不影响其他条目"""
+        items: List[Dict[str, Any]] = []
+        parsed: List[ProcessRateFinderArgs | None] = []
+        for index, query in enumerate(queries):
+            try:
+                args = ProcessRateFinderArgs(**query)
+                items.append({"index": index, "ok": True, "output": None, "error": None})
+                parsed.append(args)
+            except Exception as e:
+                items.append({"index": index, "ok": False, "output": None, "error": f"参数校验失败: {e}"})
+                parsed.append(None)
+        return items, parsed
+
+    def _render_batch_prompts(
+        self,
+        parsed: List[ProcessRateFinderArgs | None],
+        realtime: Dict[int, Dict[str, str]],
+        use_cache: bool,
+        refresh_cache: bool,
+    ) -> Tuple[Dict[int, Dict[str, Any]], Dict[str, PromptValue], Dict[int, str], Dict[str, Tuple[PersistentTTLCache | None, str]], Dict[int, Dict[str, Any]]]:
+        """
+        渲染所有 prompt 并查询 LLM 缓存。
+        返回 (已命中缓存的结果, 需要调用 LLM 的去重 prompt, 条目 → prompt 键, prompt 键 → 缓存写入信息, 条目 → prompt 统计)
+        """
+        llm_results: Dict[int, Dict[str, Any]] = {}
+        prompt_stats: Dict[int, Dict[str, Any]] = {}
+        pending: Dict[str, PromptValue] = {}
+        item_keys: Dict[int, str] = {}
+        cache_slots: Dict[str, Tuple[PersistentTTLCache | None, str]] = {}
+
+        for index, args in enumerate(parsed):
+            if args is None:
+                continue
+            try:
+                prompt_value = self._render_cost_prompt(
+                    args.location, args.process_name, args.material_name, args.surface_area,
+                    args.volume, args.annual_volume, realtime[index],
+                )
+            except Exception as e:
+                llm_results[index] = self._llm_error_result(e)
+                continue
+
+            prompt_stats[index] = self._prompt_stats(args.process_name, prompt_value)
+            cache, cache_key, cached = self._lookup_llm_cache(prompt_value, use_cache, refresh_cache)
+            if cached is not None:
+                llm_results[index] = dict(cached, prompt_stats=prompt_stats[index])
+                continue
+
+            # 批次内完全相同的 prompt 只调用一次 LLM（只是目标单位不同的查询也属于这种情况）
+            prompt_key = hashlib.sha256(prompt_value.to_string().encode("utf-8")).hexdigest()
+            pending.setdefault(prompt_key, prompt_value)
+            cache_slots.setdefault(prompt_key, (cache, cache_key))
+            item_keys[index] = prompt_key
+
+        return llm_results, pending, item_keys, cache_slots, prompt_stats
+
+    def _finish_batch(
+        self,
+        items: List[Dict[str, Any]],
+        parsed: List[ProcessRateFinderArgs | None],
+        baselines: Dict[int, Dict[str, Any]],
+        llm_results: Dict[int, Dict[str, Any]],
+        pending: Dict[str, PromptValue],
+        item_keys: Dict[int, str],
+        cache_slots: Dict[str, Tuple[PersistentTTLCache | None, str]],
+        prompt_stats: Dict[int, Dict[str, Any]],
+        responses: List[Any],
+    ) -> List[Dict[str, Any]]:
+        """解析 LLM 批量响应、写缓存，并按输入顺序组装结果"""
+        parsed_by_key: Dict[str, Dict[str, Any] | Exception] = {}
+        usage_by_key: Dict[str, Dict[str, Any]] = {}
+        for prompt_key, response in zip(pending, responses):
+            if isinstance(response, Exception):
+                parsed_by_key[prompt_key] = response
+                continue
+            try:
+                result = self._parse_llm_content(response.content)
+            except Exception as e:
+                parsed_by_key[prompt_key] = e
+                continue
+            parsed_by_key[prompt_key] = result
+            usage_by_key[prompt_key] = self._llm_usage(response)
+            cache, cache_key = cache_slots[prompt_key]
+            if cache is not None:
+                cache.set(cache_key, result)
+
+        for index, args in enumerate(parsed):
+            if args is None:
+                continue
+            if index not in llm_results:
+                result = parsed_by_key[item_keys[index]]
+                llm_results[index] = (
+                    self._llm_error_result(result)
+                    if isinstance(result, Exception)
+                    else dict(
+                        result,
+                        prompt_stats=prompt_stats[index],
+                        llm_usage=usage_by_key[item_keys[index]],
+                    )
+                )
+
+            llm_result = llm_results[index]
+            items[index]["output"] = self._build_output(
+                args.location, args.process_name, args.material_name, args.surface_area,
+                args.volume, args.annual_volume, args.unit, baselines[index], llm_result,
+            )
+            if "error" in llm_result:
+                items[index]["ok"] = False
+                items[index]["error"] = llm_result["error"]
+
+        return items
+
+    def run_batch(
+        self,
+        queries: List[Dict[str, Any]],
+        max_concurrency: int = 8,
+        use_cache: bool = True,
+        refresh_cache: bool = False,
+        baseline_index: BaselineIndex | None = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        批量成本查询：
+        - queries：每项是 run() 的关键字参数（location / process_name / ... / unit，可选 as_of）
+        - 实时数据通过共享的 RealtimeDataContext 去重（每个地区、每个工艺只查一次）
+        - 未命中缓存的 prompt 通过 llm.batch 以 max_concurrency 的并发度一次性发送
+        - baseline_index：整批使用的基准索引（默认在开始时取一次 self.baseline_index）
+        返回与输入顺序一致的列表，每项为
+        {"index": i, "ok": bool, "output": <与 run() 相同结构的 dict>, "error": <错误信息或 None>}
+        """
+        print("\n" + "=" * 80)
+        print(f"🚀 批量工艺成本查询：{len(queries)} 条，最大并发 {max_concurrency}")
+        print("=" * 80 + "\n")
+
+        with collect("batch"):
+            items, parsed = self._prepare_batch(queries)
+            valid = [(index, args) for index, args in enumerate(parsed) if args is not None]
+
+            # 整批只取一次索引：批量进行中发生热加载也不会混用新旧两版基准数据
+            baseline = self.baseline_index if baseline_index is None else baseline_index
+            with stage("csv_lookup"):
+                baselines = {
+                    index: self._query_csv_baseline(
+                        args.location, args.process_name, args.material_name,
+                        as_of=args.as_of, index=baseline,
+                    )
+                    for index, args in valid
+                }
+
+            context = RealtimeDataContext()
+            with stage("realtime_data"), ThreadPoolExecutor(
+                max_workers=max(1, max_concurrency),
+                thread_name_prefix="batch-realtime",
+            ) as executor:
+                futures = {
+                    index: executor.submit(
+                        contextvars.copy_context().run,
+                        self._gather_realtime_data, args.location, args.process_name, context,
+                    )
+                    for index, args in valid
+                }
+                realtime = {index: future.result() for index, future in futures.items()}
+            print(f"[INFO] 📡 实时数据去重：{context.stats()}")
+
+            with stage("prompt_render"):
+                llm_results, pending, item_keys, cache_slots, prompt_stats = self._render_batch_prompts(
+                    parsed, realtime, use_cache, refresh_cache
+                )
+            print(f"[INFO] 🧠 LLM 批量推理：{len(pending)} 个 prompt（缓存命中 {len(llm_results)} 条）")
+
+            # 批量内各次 LLM 调用的耗时累加在 "llm" 阶段，"llm_batch" 为整批的墙钟时间
+            with stage("llm_batch"):
+                responses = (
+                    self._llm_batch_runnable().batch(
+                        list(pending.values()),
+                        config={"max_concurrency": max_concurrency},
+                        return_exceptions=True,
+                    )
+                    if pending else []
+                )
+
+            return self._finish_batch(
+                items, parsed, baselines, llm_results, pending, item_keys, cache_slots,
+                prompt_stats, responses,
+            )
+
+    async def arun_batch(
+        self,
+        queries: List[Dict[str, Any]],
+        max_concurrency: int = 8,
+        use_cache: bool = True,
+        refresh_cache: bool = False,
+        baseline_index: BaselineIndex | None = None,
+    ) -> List[Dict[str, Any]]:
+        """run_batch 的异步版本（实时数据用 asyncio 并发收集，LLM 走 llm.abatch）"""
+        print("\n" + "=" * 80)
+        print(f"🚀 批量工艺成本查询（async）：{len(queries)} 条，最大并发 {max_concurrency}")
+        print("=" * 80 + "\n")
+
+        with collect("batch"):
+            items, parsed = self._prepare_batch(queries)
+            valid = [(index, args) for index, args in enumerate(parsed) if args is not None]
+
+            # 整批只取一次索引：批量进行中发生热加载也不会混用新旧两版基准数据
+            baseline = self.baseline_index if baseline_index is None else baseline_index
+            with stage("csv_lookup"):
+                baselines = {
+                    index: self._query_csv_baseline(
+                        args.location, args.process_name, args.material_name,
+                        as_of=args.as_of, index=baseline,
+                    )
+                    for index, args in valid
+                }
+
+            context = RealtimeDataContext()
+            semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+            async def gather_one(args: ProcessRateFinderArgs) -> Dict[str, str]:
+                async with semaphore:
+                    return await self._agather_realtime_data(args.location, args.process_name, context)
+
+            with stage("realtime_data"):
+                gathered = await asyncio.gather(*(gather_one(args) for _, args in valid))
+            realtime = {index: data for (index, _), data in zip(valid, gathered)}
+            print(f"[INFO] 📡 实时数据去重：{context.stats()}")
+
+            with stage("prompt_render"):
+                llm_results, pending, item_keys, cache_slots, prompt_stats = self._render_batch_prompts(
+                    parsed, realtime, use_cache, refresh_cache
+                )
+            print(f"[INFO] 🧠 LLM 批量推理：{len(pending)} 个 prompt（缓存命中 {len(llm_results)} 条）")
+
+            # 批量内各次 LLM 调用的耗时累加在 "llm" 阶段，"llm_batch" 为整批的墙钟时间
+            with stage("llm_batch"):
+                responses = (
+                    await self._llm_batch_runnable().abatch(
+                        list(pending.values()),
+                        config={"max_concurrency": max_concurrency},
+                        return_exceptions=True,
+                    )
+                    if pending else []
+                )
+
+            return self._finish_batch(
+                items, parsed, baselines, llm_results, pending, item_keys, cache_slots,
+                prompt_stats, responses,
+            )
+
+    # --------------------------------------------------------------------- #
+    # 整件核算：按零件号汇总整条工艺路线
+    # --------------------------------------------------------------------- #
+    def _prepare_part(
+        self,
+        part_number: str,
+        surface_area: float,
+        volume: float,
+        annual_volume: int,
+        location: str | None,
+        material_name: str | None,
+        weight_kg: float | None,
+        index: BaselineIndex,
+        as_of: Any = None,
+    ) -> Tuple[PartRouting, float | None, List[Dict[str, Any]]]:
+        """读取零件路线并生成每道增值工序的查询（统一按 CNY/pcs 计价）"""
+        routing_rows = index.routing(part_number)
+        if routing_rows.empty:
+            raise PartCostingError(
+                f"CSV 中没有零件号 {part_number}（已知零件号：{index.part_numbers}）"
+            )
+        routing = classify_routing(routing_rows, material_name)
+        if location:
+            routing.location = location
+        if weight_kg is None:
+            weight_kg = estimate_weight_kg(routing.material_name, volume)
+
+        queries = [
+            {
+                "location": routing.location,
+                "process_name": step,
+                "material_name": routing.material_name,
+                "surface_area": surface_area,
+                "volume": volume,
+                "annual_volume": annual_volume,
+                "unit": PART_TARGET_UNIT,
+                "as_of": None if as_of is None else str(to_day(as_of)),
+            }
+            for step in routing.steps
+        ]
+        print(
+            f"[INFO] 🧩 零件 {routing.part_number}：{len(routing.steps)} 道增值工序，"
+            f"主材料 {routing.material_name}，重量 {weight_kg if weight_kg is not None else '未知'} kg"
+        )
+        return routing, weight_kg, queries
+
+    @staticmethod
+    def _part_step_results(routing: PartRouting, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """把 run_batch 的条目转成 rollup 需要的工序结果"""
+        results = []
+        for step, item in zip(routing.steps, items):
+            output = item.get("output") or {}
+            cost, error = output.get("final_cost"), item.get("error")
+            if item["ok"] and output.get("final_unit") != PART_TARGET_UNIT:
+                cost, error = None, f"未能换算到 {PART_TARGET_UNIT}（{output.get('final_unit')}）"
+            results.append({
+                "step": step,
+                "ok": item["ok"] and cost is not None,
+                "cost": cost,
+                "final_cost_source": output.get("final_cost_source"),
+                "base_hourly_cost": output.get("base_hourly_cost"),
+                "csv_baseline": output.get("csv_baseline"),
+                "error": error,
+            })
+        return results
+
+    def cost_part(
+        self,
+        part_number: str,
+        surface_area: float,
+        volume: float,
+        annual_volume: int,
+        location: str | None = None,
+        material_name: str | None = None,
+        weight_kg: float | None = None,
+        component_quantities: Dict[str, float] | None = None,
+        secondary_weights_kg: Dict[str, float] | None = None,
+        max_concurrency: int = 8,
+        use_cache: bool = True,
+        refresh_cache: bool = False,
+        as_of: Any = None,
+    ) -> Dict[str, Any]:
+        """
+        整件成本核算（CNY/pcs）：
+        - 从 CSV 读取零件号的工艺路线（地区 / 主材料默认取自路线本身）
+        - 所有增值工序通过 run_batch 并发推理，共享地区 / 工艺实时数据，总耗时约等于最慢的一道工序
+        - 材料成本 = CSV 单价 × 重量（默认 体积 × 密度）×（1 + 损耗率），加外购件与各工序成本后
+          按 SG&A + Profit 比例加成，得到单件总成本（见 part_costing.rollup）
+        - as_of：各工序的 CSV 基准对比只看截至该日期最近一次生效的费率
+        """
+        # 路线与各工序的 CSV 基准来自同一个索引（核算期间热加载不影响本次结果）
+        index = self.baseline_index
+        routing, weight_kg, queries = self._prepare_part(
+            part_number, surface_area, volume, annual_volume, location, material_name, weight_kg, index,
+            as_of,
+        )
+        items = self.run_batch(queries, max_concurrency, use_cache, refresh_cache, index) if queries else []
+        return rollup(
+            routing, weight_kg, self._part_step_results(routing, items),
+            component_quantities, secondary_weights_kg,
+        )
+
+    async def acost_part(
+        self,
+        part_number: str,
+        surface_area: float,
+        volume: float,
+        annual_volume: int,
+        location: str | None = None,
+        material_name: str | None = None,
+        weight_kg: float | None = None,
+        component_quantities: Dict[str, float] | None = None,
+        secondary_weights_kg: Dict[str, float] | None = None,
+        max_concurrency: int = 8,
+        use_cache: bool = True,
+        refresh_cache: bool = False,
+        as_of: Any = None,
+    ) -> Dict[str, Any]:
+        """cost_part 的异步版本（工序推理走 arun_batch）"""
+        index = self.baseline_index
+        routing, weight_kg, queries = self._prepare_part(
+            part_number, surface_area, volume, annual_volume, location, material_name, weight_kg, index,
+            as_of,
+        )
+        items = (
+            await self.arun_batch(queries, max_concurrency, use_cache, refresh_cache, index)
+            if queries else []
+        )
+        return rollup(
+            routing, weight_kg, self._part_step_results(routing, items),
+            component_quantities, secondary_weights_kg,
+        )
 
     def as_tool(self) -> StructuredTool:
-        """将当前类暴露为 LangChain 的 StructuredTool"""
+        """将当前类暴露为 LangChain 的 StructuredTool（同时提供同步 run 与异步 arun）"""
         return StructuredTool.from_function(
             func=self.run,
+            coroutine=self.arun,
             name=self.name,
             description=self.description,
             args_schema=ProcessRateFinderArgs,
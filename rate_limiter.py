@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+"""
+rate_limiter.py — 客户端令牌桶限流（RPM / TPM）
+功能：
+- 每个限流器有两个令牌桶：requests（每分钟请求数）与 tokens（每分钟 token 数），按速率连续补充
+- 桶容量 = 速率 × burst_seconds（默认 10 秒的额度），把突发削平到配额以内
+  （Azure OpenAI 的 RPM / TPM 实际按 1~10 秒的短窗口评估）
+- 进程级共享：同一进程内所有 ProcessRateFinderTool 实例共用 get_rate_limiter 返回的同一个限流器
+- 跨进程共享（可选）：设置 RATE_LIMIT_STATE_DIR 后，桶状态存放在该目录下的 JSON 文件中，
+  每次取令牌时加文件锁（POSIX 用 fcntl，Windows 用 msvcrt），并行运行的多个脚本共享同一份配额
+- LLM 调用前按估算 token 数扣减，返回后用实际用量 adjust 校正
+环境变量：<前缀>_RATE_LIMIT_RPM、<前缀>_RATE_LIMIT_TPM（如 LLM_RATE_LIMIT_TPM=80000、TAVILY_RATE_LIMIT_RPM=100），
+RATE_LIMIT_BURST_SECONDS、RATE_LIMIT_STATE_DIR。未配置任何额度时不限流。
+"""
+
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Windows 文件锁被其他进程持有时的重试间隔（秒）：指数退避，上限 _LOCK_RETRY_MAX_DELAY
+_LOCK_RETRY_DELAY = 0.005
+_LOCK_RETRY_MAX_DELAY = 0.1
+
+
+@contextmanager
+def _locked_file(path: str) -> Iterator[int]:
+    """以独占锁打开状态文件，返回文件描述符"""
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        else:
+            os.lseek(fd, 0, os.SEEK_SET)
+            delay = _LOCK_RETRY_DELAY
+            while True:
+                try:
+                    msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+                    break
+                except OSError:
+                    # 其他进程持有锁：短暂退避（带抖动）后再试，不空转占满 CPU
+                    time.sleep(delay + random.uniform(0, delay))
+                    delay = min(delay * 2, _LOCK_RETRY_MAX_DELAY)
+        yield fd
+    finally:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        else:
+            os.lseek(fd, 0, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+        os.close(fd)
+
+
+class RateLimiter:
+    """
+    RPM + TPM 双令牌桶限流器（线程安全；配置 state_dir 时跨进程共享）。
+    clock / sleep 默认为 time.time / time.sleep，测试时可替换为假时钟；
+    跨进程共享时各进程按 clock 的时间戳补充桶，须使用墙钟。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        burst_seconds: float = 10.0,
+        state_dir: Optional[str] = None,
+        clock: Callable[[], float] = time.time,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        self.name = name
+        self._clock = clock
+        self._sleep = sleep
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+
+        # 每秒补充速率与桶容量
+        self.rates: Dict[str, float] = {}
+        if requests_per_minute:
+            self.rates["requests"] = requests_per_minute / 60.0
+        if tokens_per_minute:
+            self.rates["tokens"] = tokens_per_minute / 60.0
+        self.capacity = {
+            bucket: max(rate * burst_seconds, 1.0) for bucket, rate in self.rates.items()
+        }
+
+        self.state_path = None
+        if state_dir:
+            os.makedirs(state_dir, exist_ok=True)
+            self.state_path = os.path.join(state_dir, f"{name}.bucket.json")
+
+        self._lock = threading.Lock()
+        self._levels: Dict[str, float] = dict(self.capacity)
+        self._updated = self._clock()
+
+        self.acquired = 0
+        self.throttled = 0
+        self.waited_seconds = 0.0
+
+    # ------------------------------------------------------------------ #
+    # 桶状态（进程内 / 文件）
+    # ------------------------------------------------------------------ #
+    @contextmanager
+    def _state(self) -> Iterator[Dict[str, float]]:
+        """在锁内读出桶水位（已按经过时间补充），退出时写回"""
+        with self._lock:
+            if self.state_path is None:
+                levels, updated = self._levels, self._updated
+                self._refill(levels, updated)
+                yield levels
+                self._updated = self._clock()
+                return
+
+            with _locked_file(self.state_path) as fd:
+                raw = b""
+                while chunk := os.read(fd, 4096):
+                    raw += chunk
+                try:
+                    saved = json.loads(raw or b"{}")
+                except ValueError:
+                    saved = {}
+                levels = {
+                    bucket: float(saved.get("levels", {}).get(bucket, capacity))
+                    for bucket, capacity in self.capacity.items()
+                }
+                self._refill(levels, float(saved.get("updated", self._clock())))
+                yield levels
+
+                payload = json.dumps({"levels": levels, "updated": self._clock()}).encode("utf-8")
+                os.lseek(fd, 0, os.SEEK_SET)
+                os.ftruncate(fd, 0)
+                os.write(fd, payload)
+
+    def _refill(self, levels: Dict[str, float], updated: float) -> None:
+        elapsed = max(0.0, self._clock() - updated)
+        for bucket, rate in self.rates.items():
+            levels[bucket] = min(self.capacity[bucket], levels[bucket] + elapsed * rate)
+
+    def _try_acquire(self, tokens: float) -> float:
+        """尝试扣减 1 个请求与 tokens 个 token；成功返回 0，否则返回需要等待的秒数"""
+        cost = {"requests": 1.0, "tokens": float(tokens)}
+        with self._state() as levels:
+            # 单次需求超过桶容量时按容量计，否则永远无法满足
+            need = {
+                bucket: min(cost[bucket], self.capacity[bucket])
+                for bucket in self.rates
+                if cost[bucket] > 0
+            }
+            wait = max(
+                ((need[bucket] - levels[bucket]) / self.rates[bucket]
+                 for bucket in need if levels[bucket] < need[bucket]),
+                default=0.0,
+            )
+            if wait <= 0:
+                for bucket, amount in need.items():
+                    levels[bucket] -= amount
+            return wait
+
+    # ------------------------------------------------------------------ #
+    # 对外接口
+    # ------------------------------------------------------------------ #
+    def acquire(self, tokens: float = 0) -> float:
+        """阻塞直到额度足够，返回等待的总秒数"""
+        waited = 0.0
+        while (wait := self._try_acquire(tokens)) > 0:
+            # 加一点抖动，避免多个等待者同时醒来再次争抢
+            delay = wait + random.uniform(0, 0.05)
+            if waited == 0.0 and delay >= 1.0:
+                print(f"[INFO] ⏳ {self.name} 限流：等待约 {delay:.1f}s")
+            self._sleep(delay)
+            waited += delay
+        self._record(waited)
+        return waited
+
+    async def _atry_acquire(self, tokens: float) -> float:
+        """
+        _try_acquire 的异步入口：跨进程共享时要拿阻塞的文件锁（其他进程可能长时间持有），
+        放到线程中执行；进程内状态的锁只保护几次浮点运算，直接调用
+        """
+        if self.state_path is None:
+            return self._try_acquire(tokens)
+        return await asyncio.to_thread(self._try_acquire, tokens)
+
+    async def aacquire(self, tokens: float = 0) -> float:
+        """acquire 的异步版本（等待与文件锁都不占用事件循环）"""
+        waited = 0.0
+        while (wait := await self._atry_acquire(tokens)) > 0:
+            delay = wait + random.uniform(0, 0.05)
+            if waited == 0.0 and delay >= 1.0:
+                print(f"[INFO] ⏳ {self.name} 限流：等待约 {delay:.1f}s")
+            await asyncio.sleep(delay)
+            waited += delay
+        self._record(waited)
+        return waited
+
+    def adjust(self, tokens: float) -> None:
+        """
+        用实际 token 用量校正：tokens > 0 表示实际比预估多用（追加扣减，可扣成负数），
+        tokens < 0 表示预估偏多（退回额度）
+        """
+        if "tokens" not in self.rates or not tokens:
+            return
+        with self._state() as levels:
+            levels["tokens"] = min(self.capacity["tokens"], levels["tokens"] - tokens)
+
+    async def aadjust(self, tokens: float) -> None:
+        """adjust 的异步版本（跨进程共享时文件锁在线程中获取）"""
+        if "tokens" not in self.rates or not tokens:
+            return
+        if self.state_path is None:
+            self.adjust(tokens)
+        else:
+            await asyncio.to_thread(self.adjust, tokens)
+
+    def _record(self, waited: float) -> None:
+        with self._lock:
+            self.acquired += 1
+            if waited > 0:
+                self.throttled += 1
+                self.waited_seconds += waited
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "name": self.name,
+            "requests_per_minute": self.requests_per_minute,
+            "tokens_per_minute": self.tokens_per_minute,
+            "shared_across_processes": self.state_path is not None,
+            "acquired": self.acquired,
+            "throttled": self.throttled,
+            "waited_seconds": round(self.waited_seconds, 3),
+        }
+
+
+# --------------------------------------------------------------------------- #
+# 进程级共享
+# --------------------------------------------------------------------------- #
+_LIMITERS: Dict[str, Optional[RateLimiter]] = {}
+_LIMITERS_LOCK = threading.Lock()
+
+
+def _env_float(name: str) -> Optional[float]:
+    raw = os.getenv(name, "").strip()
+    try:
+        value = float(raw) if raw else None
+    except ValueError:
+        return None
+    return value if value and value > 0 else None
+
+
+def get_rate_limiter(prefix: str) -> Optional[RateLimiter]:
+    """
+    按前缀（"LLM" / "TAVILY"）返回进程内唯一的限流器；
+    <前缀>_RATE_LIMIT_RPM 与 <前缀>_RATE_LIMIT_TPM 都未配置时返回 None（不限流）
+    """
+    with _LIMITERS_LOCK:
+        if prefix not in _LIMITERS:
+            rpm = _env_float(f"{prefix}_RATE_LIMIT_RPM")
+            tpm = _env_float(f"{prefix}_RATE_LIMIT_TPM")
+            _LIMITERS[prefix] = (
+                RateLimiter(
+                    name=prefix.lower(),
+                    requests_per_minute=rpm,
+                    tokens_per_minute=tpm,
+                    burst_seconds=_env_float("RATE_LIMIT_BURST_SECONDS") or 10.0,
+                    state_dir=os.getenv("RATE_LIMIT_STATE_DIR") or None,
+                )
+                if rpm or tpm else None
+            )
+        return _LIMITERS[prefix]
@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+"""
+resilience.py — LLM 与 Tavily 调用共用的重试层
+功能：
+- RetryPolicy：最大尝试次数、指数退避 + 随机抖动（full jitter）、单次尝试超时、总截止时间
+- 识别可重试错误：429 / 408 / 5xx、超时、连接错误（openai、requests、aiohttp 与 Tavily 封装的异常）
+- 服务端返回 Retry-After / retry-after-ms 时按其要求等待（仍受 max_delay 与总截止时间约束）
+- call_with_retry / acall_with_retry：同步 / 异步两个版本，语义一致
+- 同步版本的单次超时优先交给 HTTP 客户端（pass_timeout=True 时把剩余预算作为 timeout 传给 fn），
+  只有无法接收 timeout 的调用才放进线程池等待
+说明：各参数可通过 "<前缀>_RETRY_MAX_ATTEMPTS" 等环境变量覆盖（见 RetryPolicy.from_env）。
+"""
+
+import asyncio
+import os
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+from dataclasses import dataclass, replace
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Optional, TypeVar
+
+T = TypeVar("T")
+
+# 可重试的 HTTP 状态码
+RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
+
+_STATUS_IN_MESSAGE = re.compile(r"\b(?:Error|status(?: code)?)[ :]+(\d{3})\b", re.IGNORECASE)
+
+
+class RetryError(Exception):
+    """重试次数或总截止时间用尽；last_error 为最后一次失败的异常"""
+
+    def __init__(self, label: str, attempts: int, last_error: BaseException) -> None:
+        super().__init__(f"{label} 重试 {attempts} 次后仍失败: {last_error}")
+        self.label = label
+        self.attempts = attempts
+        self.last_error = last_error
+
+
+class AttemptTimeout(TimeoutError):
+    """单次尝试超过 attempt_timeout"""
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """重试策略；attempt_timeout / deadline 为 None 表示不限制"""
+
+    max_attempts: int = 4
+    base_delay: float = 0.5
+    max_delay: float = 20.0
+    multiplier: float = 2.0
+    attempt_timeout: Optional[float] = None
+    deadline: Optional[float] = None
+
+    @classmethod
+    def from_env(cls, prefix: str, **defaults: Any) -> "RetryPolicy":
+        """
+        读取 <prefix>_RETRY_MAX_ATTEMPTS / _RETRY_BASE_DELAY / _RETRY_MAX_DELAY /
+        _ATTEMPT_TIMEOUT / _RETRY_DEADLINE，未设置时使用 defaults 或类默认值
+        """
+        policy = cls(**defaults)
+        env_fields = {
+            "max_attempts": (f"{prefix}_RETRY_MAX_ATTEMPTS", int),
+            "base_delay": (f"{prefix}_RETRY_BASE_DELAY", float),
+            "max_delay": (f"{prefix}_RETRY_MAX_DELAY", float),
+            "attempt_timeout": (f"{prefix}_ATTEMPT_TIMEOUT", float),
+            "deadline": (f"{prefix}_RETRY_DEADLINE", float),
+        }
+        overrides = {}
+        for field, (name, cast) in env_fields.items():
+            raw = os.getenv(name, "").strip()
+            if raw:
+                try:
+                    value = cast(raw)
+                except ValueError:
+                    continue
+                # 超时 / 截止时间填 0 表示不限制
+                overrides[field] = None if field in ("attempt_timeout", "deadline") and value <= 0 else value
+        return replace(policy, **overrides) if overrides else policy
+
+    def backoff(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """第 attempt 次失败后的等待时间：full jitter；服务端给了 Retry-After 时以其为下限"""
+        ceiling = min(self.max_delay, self.base_delay * self.multiplier ** (attempt - 1))
+        delay = random.uniform(0, ceiling)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_delay))
+        return delay
+
+
+# --------------------------------------------------------------------------- #
+# 错误分类
+# --------------------------------------------------------------------------- #
+def _headers_of(error: BaseException) -> Any:
+    headers = getattr(error, "headers", None)
+    if headers is None:
+        headers = getattr(getattr(error, "response", None), "headers", None)
+    return headers
+
+
+def retry_after_seconds(error: BaseException) -> Optional[float]:
+    """从异常携带的响应头中读取 retry-after-ms / Retry-After（秒数或 HTTP 日期）"""
+    headers = _headers_of(error)
+    if not headers:
+        return None
+    try:
+        millis = headers.get("retry-after-ms")
+        if millis is not None:
+            return max(0.0, float(millis) / 1000.0)
+        value = headers.get("retry-after")
+        if value is None:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except Exception:
+        return None
+
+
+def status_code_of(error: BaseException) -> Optional[int]:
+    """尽量取出异常对应的 HTTP 状态码"""
+    for candidate in (
+        getattr(error, "status_code", None),
+        getattr(error, "status", None),
+        getattr(getattr(error, "response", None), "status_code", None),
+    ):
+        if isinstance(candidate, int):
+            return candidate
+    match = _STATUS_IN_MESSAGE.search(str(error))
+    return int(match.group(1)) if match else None
+
+
+def is_retryable(error: BaseException) -> bool:
+    """429 / 5xx / 超时 / 连接错误可重试；4xx 参数错误、解析错误等不重试"""
+    if isinstance(error, (TimeoutError, asyncio.TimeoutError, FuturesTimeoutError, ConnectionError)):
+        return True
+
+    # 按类名判断，避免在这里强依赖 openai / requests / aiohttp
+    names = {cls.__name__ for cls in type(error).__mro__}
+    if names & {
+        "APITimeoutError", "APIConnectionError", "RateLimitError", "InternalServerError",
+        "Timeout", "ConnectTimeout", "ReadTimeout", "ChunkedEncodingError",
+        "ClientConnectionError", "ServerTimeoutError", "ServerDisconnectedError",
+    }:
+        return True
+    if "ConnectionError" in names and type(error).__module__.startswith("requests"):
+        return True
+
+    status = status_code_of(error)
+    return status in RETRYABLE_STATUS
+
+
+# --------------------------------------------------------------------------- #
+# 重试执行
+# --------------------------------------------------------------------------- #
+_ATTEMPT_POOL: ThreadPoolExecutor | None = None
+_ATTEMPT_POOL_LOCK = threading.Lock()
+
+
+def _attempt_pool() -> ThreadPoolExecutor:
+    """
+    无法接收 timeout 的同步调用，单次超时通过线程执行实现；超时的尝试在后台自行结束，结果被丢弃。
+    能接收 timeout 的调用（requests / openai 客户端）请用 pass_timeout=True，不经过这里。
+    """
+    global _ATTEMPT_POOL
+    if _ATTEMPT_POOL is None:
+        with _ATTEMPT_POOL_LOCK:
+            if _ATTEMPT_POOL is None:
+                _ATTEMPT_POOL = ThreadPoolExecutor(
+                    max_workers=int(os.getenv("RETRY_ATTEMPT_WORKERS", "64")),
+                    thread_name_prefix="retry-attempt",
+                )
+    return _ATTEMPT_POOL
+
+
+def log_retry(label: str, attempt: int, error: BaseException, delay: float) -> None:
+    print(f"[WARN] 🔁 {label} 第 {attempt} 次尝试失败（{error}），{delay:.1f}s 后重试")
+
+
+def _attempt_budget(policy: RetryPolicy, started: float) -> Optional[float]:
+    """本次尝试可用的时间：attempt_timeout 与剩余总时间取小"""
+    budgets = []
+    if policy.attempt_timeout is not None:
+        budgets.append(policy.attempt_timeout)
+    if policy.deadline is not None:
+        budgets.append(policy.deadline - (time.monotonic() - started))
+    return max(0.0, min(budgets)) if budgets else None
+
+
+def _next_delay(
+    policy: RetryPolicy,
+    attempt: int,
+    error: BaseException,
+    started: float,
+) -> Optional[float]:
+    """返回下一次重试前的等待时间；次数或总时间用尽时返回 None"""
+    if attempt >= policy.max_attempts:
+        return None
+    delay = policy.backoff(attempt, retry_after_seconds(error))
+    if policy.deadline is not None and time.monotonic() - started + delay >= policy.deadline:
+        return None
+    return delay
+
+
+def call_with_retry(
+    fn: Callable[..., T],
+    policy: RetryPolicy,
+    label: str = "调用",
+    retryable: Callable[[BaseException], bool] = is_retryable,
+    on_retry: Callable[[str, int, BaseException, float], None] = log_retry,
+    before_attempt: Optional[Callable[[], Any]] = None,
+    pass_timeout: bool = False,
+) -> T:
+    """
+    按 policy 执行 fn：可重试错误按退避等待后重试，不可重试错误直接抛出原异常；
+    重试用尽或超过总截止时间时抛出 RetryError（last_error 为最后一次的异常）。
+    before_attempt 在每次尝试前调用（如限流器取令牌），其耗时不计入单次尝试超时。
+    pass_timeout=True 时在当前线程调用 fn(timeout=本次预算)，由 HTTP 客户端自己执行超时；
+    否则有预算时 fn() 放进线程池，超时后放弃等待（该线程会一直占用到 fn 自行返回）。
+    """
+    started = time.monotonic()
+    attempt = 0
+    while True:
+        attempt += 1
+        if before_attempt is not None:
+            before_attempt()
+        budget = _attempt_budget(policy, started)
+        try:
+            if pass_timeout:
+                if budget is not None and budget <= 0:
+                    raise AttemptTimeout(f"{label} 已超过总截止时间")
+                return fn(timeout=budget)
+            if budget is None:
+                return fn()
+            future = _attempt_pool().submit(fn)
+            try:
+                return future.result(timeout=budget)
+            except FuturesTimeoutError:
+                future.cancel()
+                raise AttemptTimeout(f"{label} 单次尝试超过 {budget:.1f}s")
+        except Exception as error:
+            if not retryable(error):
+                raise
+            delay = _next_delay(policy, attempt, error, started)
+            if delay is None:
+                raise RetryError(label, attempt, error) from error
+            on_retry(label, attempt, error, delay)
+            time.sleep(delay)
+
+
+async def acall_with_retry(
+    fn: Callable[[], Awaitable[T]],
+    policy: RetryPolicy,
+    label: str = "调用",
+    retryable: Callable[[BaseException], bool] = is_retryable,
+    on_retry: Callable[[str, int, BaseException, float], None] = log_retry,
+    before_attempt: Optional[Callable[[], Awaitable[Any]]] = None,
+) -> T:
+    """call_with_retry 的异步版本：单次超时用 asyncio.wait_for，等待用 asyncio.sleep"""
+    started = time.monotonic()
+    attempt = 0
+    while True:
+        attempt += 1
+        if before_attempt is not None:
+            await before_attempt()
+        budget = _attempt_budget(policy, started)
+        try:
+            if budget is None:
+                return await fn()
+            try:
+                return await asyncio.wait_for(fn(), timeout=budget)
+            except asyncio.TimeoutError:
+                raise AttemptTimeout(f"{label} 单次尝试超过 {budget:.1f}s")
+        except Exception as error:
+            if not retryable(error):
+                raise
+            delay = _next_delay(policy, attempt, error, started)
+            if delay is None:
+                raise RetryError(label, attempt, error) from error
+            on_retry(label, attempt, error, delay)
+            await asyncio.sleep(delay)
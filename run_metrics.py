@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+"""
+run_metrics.py — 单次查询的分阶段耗时 / token / 缓存 / 重试统计，以及进程级汇总
+功能：
+- RunMetrics：一次 run / arun / run_batch 的明细（CSV 查询、每条 Tavily 查询、prompt 渲染、LLM 调用耗时，
+  prompt / completion / cached token 数，搜索与 LLM 缓存命中，重试次数，限流等待时间）
+- 通过 contextvars 关联到当前查询：各处只需调用 record_* / stage，不必层层传参；
+  没有正在统计的查询时这些函数什么也不做
+- PROCESS_METRICS：进程级累计计数（按 run / batch 分类），用于在真实流量上找出最慢的阶段
+说明：线程池中执行的任务需要用 contextvars.copy_context().run 提交，统计才能归到对应的查询上。
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+
+_CURRENT: ContextVar[Optional["RunMetrics"]] = ContextVar("process_rate_run_metrics", default=None)
+
+
+class RunMetrics:
+    """一次查询的统计明细（线程安全：并发的 Tavily 查询会同时写入）"""
+
+    def __init__(self, kind: str = "run") -> None:
+        self.kind = kind
+        self._started = time.perf_counter()
+        self._lock = threading.Lock()
+
+        self.total_ms: Optional[float] = None
+        self.stages_ms: Dict[str, float] = {}
+        self.searches: List[Dict[str, Any]] = []
+        self.tokens = {"prompt": 0, "completion": 0, "cached": 0}
+        self.cache = {"search_hits": 0, "search_misses": 0, "llm_hits": 0, "llm_misses": 0}
+        self.retries = {"llm": 0, "tavily": 0}
+        self.rate_limit_wait_ms = {"llm": 0.0, "tavily": 0.0}
+
+    def add_stage(self, name: str, elapsed_ms: float) -> None:
+        with self._lock:
+            self.stages_ms[name] = self.stages_ms.get(name, 0.0) + elapsed_ms
+
+    def finish(self) -> None:
+        self.total_ms = (time.perf_counter() - self._started) * 1000.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "total_ms": round(self.total_ms, 2) if self.total_ms is not None else None,
+                "stages_ms": {name: round(ms, 2) for name, ms in self.stages_ms.items()},
+                "searches": [dict(item) for item in self.searches],
+                "tokens": dict(self.tokens),
+                "cache": dict(self.cache),
+                "retries": dict(self.retries),
+                "rate_limit_wait_ms": {k: round(v, 2) for k, v in self.rate_limit_wait_ms.items()},
+            }
+
+
+def current() -> Optional[RunMetrics]:
+    return _CURRENT.get()
+
+
+@contextmanager
+def collect(kind: str = "run") -> Iterator[RunMetrics]:
+    """开始统计一次查询；退出时记录总耗时并汇总到 PROCESS_METRICS"""
+    metrics = RunMetrics(kind)
+    token = _CURRENT.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _CURRENT.reset(token)
+        metrics.finish()
+        PROCESS_METRICS.add(metrics)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """统计一个阶段的耗时（同名阶段累加）"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics = _CURRENT.get()
+        if metrics is not None:
+            metrics.add_stage(name, (time.perf_counter() - started) * 1000.0)
+
+
+# --------------------------------------------------------------------------- #
+# 记录函数（没有正在统计的查询时不做任何事）
+# --------------------------------------------------------------------------- #
+def record_search(query: str, elapsed_ms: float, source: str) -> None:
+    """source: cache / tavily / error / skipped"""
+    metrics = _CURRENT.get()
+    if metrics is None:
+        return
+    with metrics._lock:
+        metrics.searches.append({"query": query, "ms": round(elapsed_ms, 2), "source": source})
+        if source == "cache":
+            metrics.cache["search_hits"] += 1
+        elif source != "skipped":
+            metrics.cache["search_misses"] += 1
+
+
+def record_llm_cache(hit: bool) -> None:
+    metrics = _CURRENT.get()
+    if metrics is not None:
+        with metrics._lock:
+            metrics.cache["llm_hits" if hit else "llm_misses"] += 1
+
+
+def record_tokens(usage: Optional[Dict[str, Any]]) -> None:
+    """usage 为 ProcessRateFinderTool._llm_usage 的结构"""
+    metrics = _CURRENT.get()
+    if metrics is None or not usage:
+        return
+    with metrics._lock:
+        metrics.tokens["prompt"] += usage.get("input_tokens") or 0
+        metrics.tokens["completion"] += usage.get("output_tokens") or 0
+        metrics.tokens["cached"] += usage.get("cached_tokens") or 0
+
+
+def record_retry(kind: str) -> None:
+    metrics = _CURRENT.get()
+    if metrics is not None:
+        with metrics._lock:
+            metrics.retries[kind] = metrics.retries.get(kind, 0) + 1
+
+
+def record_rate_limit_wait(kind: str, waited_seconds: float) -> None:
+    metrics = _CURRENT.get()
+    if metrics is not None and waited_seconds:
+        with metrics._lock:
+            metrics.rate_limit_wait_ms[kind] = (
+                metrics.rate_limit_wait_ms.get(kind, 0.0) + waited_seconds * 1000.0
+            )
+
+
+# --------------------------------------------------------------------------- #
+# 进程级汇总
+# --------------------------------------------------------------------------- #
+class MetricsAggregator:
+    """累计所有已完成查询的统计，snapshot() 给出每个阶段的次数 / 平均 / 最大耗时"""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.runs: Dict[str, int] = {}
+            self.total_ms: Dict[str, float] = {}
+            self.stages: Dict[str, Dict[str, float]] = {}
+            self.searches = {"count": 0, "total_ms": 0.0, "max_ms": 0.0}
+            self.tokens = {"prompt": 0, "completion": 0, "cached": 0}
+            self.cache = {"search_hits": 0, "search_misses": 0, "llm_hits": 0, "llm_misses": 0}
+            self.retries: Dict[str, int] = {}
+            self.rate_limit_wait_ms: Dict[str, float] = {}
+
+    def add(self, metrics: RunMetrics) -> None:
+        data = metrics.to_dict()
+        with self._lock:
+            self.runs[metrics.kind] = self.runs.get(metrics.kind, 0) + 1
+            self.total_ms[metrics.kind] = self.total_ms.get(metrics.kind, 0.0) + (data["total_ms"] or 0.0)
+
+            for name, ms in data["stages_ms"].items():
+                entry = self.stages.setdefault(name, {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+                entry["count"] += 1
+                entry["total_ms"] += ms
+                entry["max_ms"] = max(entry["max_ms"], ms)
+
+            for search in data["searches"]:
+                self.searches["count"] += 1
+                self.searches["total_ms"] += search["ms"]
+                self.searches["max_ms"] = max(self.searches["max_ms"], search["ms"])
+
+            for bucket in ("tokens", "cache"):
+                totals = getattr(self, bucket)
+                for key, value in data[bucket].items():
+                    totals[key] = totals.get(key, 0) + value
+            for key, value in data["retries"].items():
+                self.retries[key] = self.retries.get(key, 0) + value
+            for key, value in data["rate_limit_wait_ms"].items():
+                self.rate_limit_wait_ms[key] = self.rate_limit_wait_ms.get(key, 0.0) + value
+
+    def snapshot(self) -> Dict[str, Any]:
+        def average(entry: Dict[str, float]) -> float:
+            return round(entry["total_ms"] / entry["count"], 2) if entry["count"] else 0.0
+
+        with self._lock:
+            stages = {
+                name: {
+                    "count": entry["count"],
+                    "avg_ms": average(entry),
+                    "max_ms": round(entry["max_ms"], 2),
+                    "total_ms": round(entry["total_ms"], 2),
+                }
+                for name, entry in self.stages.items()
+            }
+            return {
+                "runs": dict(self.runs),
+                "avg_total_ms": {
+                    kind: round(self.total_ms[kind] / count, 2) for kind, count in self.runs.items()
+                },
+                "stages": dict(sorted(stages.items(), key=lambda item: -item[1]["total_ms"])),
+                "searches": {
+                    "count": self.searches["count"],
+                    "avg_ms": average(self.searches),
+                    "max_ms": round(self.searches["max_ms"], 2),
+                },
+                "tokens": dict(self.tokens),
+                "cache": dict(self.cache),
+                "retries": dict(self.retries),
+                "rate_limit_wait_ms": {k: round(v, 2) for k, v in self.rate_limit_wait_ms.items()},
+            }
+
+
+PROCESS_METRICS = MetricsAggregator()
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""
+tavily_client.py — 进程级共享、带连接池的 Tavily 搜索客户端
+功能：
+- 官方 TavilySearchAPIWrapper 每次请求都调用 requests.post，会新建 TCP / TLS 连接
+- 这里改为复用同一个 requests.Session（HTTP keep-alive + 连接池）
+- 异步路径按事件循环复用 aiohttp.ClientSession（官方实现每次请求都新建 session）
+- 同一进程内相同 (api_key, max_results) 的 ProcessRateFinderTool 共享同一个客户端
+- request_timeout(seconds)：在当前上下文内覆盖单次请求的 HTTP 超时（重试层把剩余预算传进来）
+"""
+
+import asyncio
+import contextlib
+import contextvars
+import json
+import threading
+import weakref
+from typing import Any, Dict, Iterator, Tuple
+
+import aiohttp
+import requests
+from pydantic import PrivateAttr
+from requests.adapters import HTTPAdapter
+from langchain_tavily import TavilySearch
+from langchain_tavily._utilities import TAVILY_API_URL, TavilySearchAPIWrapper
+
+
+# 当前上下文的请求超时（秒）；None 表示使用封装上的 request_timeout
+_REQUEST_TIMEOUT: contextvars.ContextVar[float | None] = contextvars.ContextVar(
+    "tavily_request_timeout", default=None
+)
+
+
+@contextlib.contextmanager
+def request_timeout(seconds: float | None) -> Iterator[None]:
+    """with 块内同步请求使用 seconds 作为 requests 的 timeout（TavilySearch.invoke 会复制当前上下文）"""
+    token = _REQUEST_TIMEOUT.set(seconds)
+    try:
+        yield
+    finally:
+        _REQUEST_TIMEOUT.reset(token)
+
+
+class TavilyHTTPError(ValueError):
+    """Tavily 返回非 200 状态码；携带 status_code 与响应头，供重试层判断与读取 Retry-After"""
+
+    def __init__(self, message: str, status_code: int, headers: Dict[str, str] | None = None) -> None:
+        super().__init__(message)
+        self.status_code = status_code
+        self.headers = dict(headers or {})
+
+
+class PooledTavilySearchAPIWrapper(TavilySearchAPIWrapper):
+    """复用 requests.Session 的 Tavily API 封装（线程安全，连接池大小可配置）"""
+
+    pool_maxsize: int = 16
+    async_pool_limit: int = 100
+    request_timeout: float = 30.0
+
+    _session: requests.Session | None = PrivateAttr(default=None)
+    _session_lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _async_sessions: weakref.WeakKeyDictionary = PrivateAttr(
+        default_factory=weakref.WeakKeyDictionary
+    )
+
+    def _headers(self) -> Dict[str, str]:
+        return {
+            "Authorization": f"Bearer {self.tavily_api_key.get_secret_value()}",
+            "Content-Type": "application/json",
+            "X-Client-Source": "langchain-tavily",
+        }
+
+    def _get_session(self) -> requests.Session:
+        """惰性创建 Session；urllib3 连接池本身是线程安全的"""
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(
+                        pool_connections=4,
+                        pool_maxsize=self.pool_maxsize,
+                    )
+                    session.mount("https://", adapter)
+                    session.mount("http://", adapter)
+                    session.headers.update(self._headers())
+                    self._session = session
+        return self._session
+
+    def raw_results(self, query: str, **kwargs: Any) -> Dict[str, Any]:  # type: ignore[override]
+        """与父类参数一致，只是通过共享 Session 发送请求"""
+        params = {"query": query, **kwargs}
+        # 与官方实现一致：去掉值为 None 的参数
+        params = {k: v for k, v in params.items() if v is not None}
+
+        base_url = self.api_base_url or TAVILY_API_URL
+        timeout = _REQUEST_TIMEOUT.get()
+        response = self._get_session().post(
+            f"{base_url}/search",
+            json=params,
+            timeout=self.request_timeout if timeout is None else timeout,
+        )
+        if response.status_code != 200:
+            try:
+                detail = response.json().get("detail", {})
+            except ValueError:
+                # 网关返回的 502 / 504 等可能不是 JSON
+                detail = {}
+            error_message = (
+                detail.get("error") if isinstance(detail, dict) else None
+            ) or response.reason or "Unknown error"
+            raise TavilyHTTPError(
+                f"Error {response.status_code}: {error_message}",
+                response.status_code,
+                {key.lower(): value for key, value in response.headers.items()},
+            )
+        return response.json()
+
+    def _get_async_session(self) -> aiohttp.ClientSession:
+        """aiohttp session 与事件循环绑定，因此按当前运行的事件循环各自复用一个"""
+        loop = asyncio.get_running_loop()
+        session = self._async_sessions.get(loop)
+        if session is None or session.closed:
+            session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.async_pool_limit),
+                headers=self._headers(),
+                timeout=aiohttp.ClientTimeout(total=self.request_timeout),
+            )
+            self._async_sessions[loop] = session
+        return session
+
+    async def raw_results_async(self, query: str, **kwargs: Any) -> Dict[str, Any]:  # type: ignore[override]
+        """异步版本：通过当前事件循环的共享 aiohttp session 发送请求"""
+        params = {"query": query, **kwargs}
+        params = {k: v for k, v in params.items() if v is not None}
+
+        base_url = self.api_base_url or TAVILY_API_URL
+        session = self._get_async_session()
+        async with session.post(f"{base_url}/search", json=params) as res:
+            if res.status != 200:
+                raise TavilyHTTPError(
+                    f"Error {res.status}: {res.reason}",
+                    res.status,
+                    {key.lower(): value for key, value in res.headers.items()},
+                )
+            return json.loads(await res.text())
+
+    def close(self) -> None:
+        with self._session_lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+    async def aclose(self) -> None:
+        """关闭当前事件循环上的 aiohttp session（事件循环结束前调用，避免 Unclosed session 警告）"""
+        session = self._async_sessions.pop(asyncio.get_running_loop(), None)
+        if session is not None and not session.closed:
+            await session.close()
+
+
+def supports_request_timeout(client: Any) -> bool:
+    """client（可被 RecordingSearchClient 等包装）最终是否走 PooledTavilySearchAPIWrapper"""
+    while hasattr(client, "inner"):
+        client = client.inner
+    return isinstance(getattr(client, "api_wrapper", None), PooledTavilySearchAPIWrapper)
+
+
+# ------------------------------------------------------------------------- #
+# 进程级共享
+# ------------------------------------------------------------------------- #
+_SHARED_CLIENTS: Dict[Tuple[str, int], TavilySearch] = {}
+_SHARED_LOCK = threading.Lock()
+
+
+def get_shared_tavily_search(
+    api_key: str,
+    max_results: int = 5,
+    pool_maxsize: int = 16,
+) -> TavilySearch:
+    """按 (api_key, max_results) 返回进程内唯一的 TavilySearch 实例"""
+    key = (api_key, max_results)
+    with _SHARED_LOCK:
+        client = _SHARED_CLIENTS.get(key)
+        if client is None:
+            wrapper = PooledTavilySearchAPIWrapper(
+                tavily_api_key=api_key,
+                pool_maxsize=pool_maxsize,
+            )
+            client = TavilySearch(api_wrapper=wrapper, max_results=max_results)
+            _SHARED_CLIENTS[key] = client
+        return client
+
+
+def close_shared_tavily_clients() -> None:
+    """关闭并清空所有共享客户端（一般只在进程退出或测试时使用）"""
+    with _SHARED_LOCK:
+        for client in _SHARED_CLIENTS.values():
+            wrapper = client.api_wrapper
+            if isinstance(wrapper, PooledTavilySearchAPIWrapper):
+                wrapper.close()
+        _SHARED_CLIENTS.clear()
+
+
+async def aclose_shared_tavily_clients() -> None:
+    """关闭所有共享客户端在当前事件循环上的异步 session"""
+    with _SHARED_LOCK:
+        wrappers = [client.api_wrapper for client in _SHARED_CLIENTS.values()]
+    for wrapper in wrappers:
+        if isinstance(wrapper, PooledTavilySearchAPIWrapper):
+            await wrapper.aclose()
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+test_baseline_aggregate.py — 预计算的键分组汇总（baseline_aggregate.py）与同一份数据上的 pandas groupby 对照
+覆盖 _query_csv_baseline(aggregate=True) 的精确 / 子串路径、供应商拆分，内存索引与内存映射存储两种模式
+（离线，python -m pytest -q）
+"""
+
+import pandas as pd
+import pytest
+
+from benchmark_suite import FakeCostLLM, FakeTavilySearch, LatencyProfile
+from process_rate_finder_tool import ProcessRateFinderTool
+
+HEADER = "Location,supplier_code,part_number,sub_process step,material_name,process_type,Low,High,Unit,valid_time"
+ROWS = [
+    '"Ningbo, Zhejiang",111,P1,Casting,AlSi9Mn ,value_add,600,650,/h,9/2/2025',
+    '"Ningbo, Zhejiang",111,P2,Casting,AlSi9Mn,value_add,580,640,/h,1/1/2025',
+    '"Ningbo, Zhejiang",222,P3,casting ,alsi9mn,value_add,700,,/h,3/1/2025',
+    '"Ningbo, Zhejiang",222,P4,Casting,AlSi9Mn,value_add,,720,/h,',
+    '"Ningbo, Zhejiang",111,P1,Trimming,AlSi9Mn,value_add,60,80,/h,9/2/2025',
+    'Nanjing,333,P5,Casting,AlSi9Mn,value_add,500,550,/h,6/30/2025',
+    '"Ningbo, Zhejiang",111,P1,Final inspection,Nan,value_add,40,40,/h,9/2/2025',
+    '"Ningbo, Zhejiang",222,P3,Final inspection,Nan,value_add,45,50,/h,2/1/2025',
+]
+KEYS = ["Location", "sub_process step", "material_name"]
+
+
+def expected_groups(df: pd.DataFrame, by) -> pd.DataFrame:
+    """直接用 pandas 在原始数据上按规范化后的键 groupby，作为对照"""
+    frame = df.copy()
+    for column in KEYS:
+        normalized = frame[column].astype(str).str.strip().str.casefold()
+        frame[column] = normalized.where(normalized != "nan", "")
+    frame["lo"] = frame["Low"].fillna(frame["High"])
+    frame["hi"] = frame["High"].fillna(frame["Low"])
+    frame["mid"] = (frame["lo"] + frame["hi"]) / 2
+    frame["vt"] = pd.to_datetime(frame["valid_time"], format="%m/%d/%Y")
+    return frame.groupby(by).agg(
+        rows=("mid", "size"), low=("lo", "min"), median=("mid", "median"), high=("hi", "max"), latest=("vt", "max"),
+    )
+
+
+def assert_matches(result, expected) -> None:
+    assert result["rows"] == expected["rows"]
+    assert result["low"] == pytest.approx(expected["low"])
+    assert result["median"] == pytest.approx(expected["median"])
+    assert result["high"] == pytest.approx(expected["high"])
+    latest = None if pd.isna(expected["latest"]) else expected["latest"].strftime("%Y-%m-%d")
+    assert result["latest_valid_time"] == latest
+
+
+@pytest.fixture
+def source(tmp_path) -> pd.DataFrame:
+    path = tmp_path / "rates.csv"
+    path.write_text("\n".join([HEADER, *ROWS]) + "\n", encoding="utf-8")
+    return path
+
+
+@pytest.fixture(params=["memory", "mmap"])
+def tool(request, source, tmp_path, monkeypatch) -> ProcessRateFinderTool:
+    for name, value in {
+        "BASELINE_STORE": request.param,
+        "BASELINE_CACHE_DIR": str(tmp_path / "baseline_cache"),
+        "TAVILY_CACHE_TTL": "0",
+        "LLM_CACHE_TTL": "0",
+        "BASELINE_RELOAD_INTERVAL": "0",
+    }.items():
+        monkeypatch.setenv(name, value)
+    return ProcessRateFinderTool(
+        llm=FakeCostLLM(profile=LatencyProfile(0, 0, 0, 1), recorded=[]),
+        csv_path=str(source),
+        search_client=FakeTavilySearch(LatencyProfile(0, 0, 0, 2), payload_chars=200),
+        traffic_mode="off",
+    )
+
+
+@pytest.mark.parametrize(
+    "location, step, material",
+    [
+        ("Ningbo, Zhejiang", "Casting", "AlSi9Mn"),
+        ("Ningbo, Zhejiang", "Trimming", "AlSi9Mn"),
+        ("Nanjing", "Casting", "AlSi9Mn"),
+        # 材料无关行：任意材料命中空材料分组
+        ("Ningbo, Zhejiang", "Final inspection", "AlSi9Mn"),
+    ],
+)
+def test_exact_group_matches_pandas_groupby(tool, source, location, step, material):
+    df = pd.read_csv(source)
+    groups = expected_groups(df, KEYS)
+    key = tuple(value.casefold() for value in (location, step, "" if "inspection" in step else material))
+
+    result = tool._query_csv_baseline(location, step, material, aggregate=True)
+    assert result["match"] == "exact"
+    assert_matches(result, groups.loc[key])
+
+
+def test_supplier_split_matches_pandas_groupby(tool, source):
+    df = pd.read_csv(source)
+    per_supplier = expected_groups(df, KEYS + ["supplier_code"])
+    key = ("ningbo, zhejiang", "casting", "alsi9mn")
+
+    suppliers = tool._query_csv_baseline("Ningbo, Zhejiang", "Casting", "AlSi9Mn", aggregate=True)["suppliers"]
+    assert [entry["supplier_code"] for entry in suppliers] == ["111", "222"]
+    for entry in suppliers:
+        assert_matches(entry, per_supplier.loc[key + (int(entry["supplier_code"]),)])
+
+
+def test_substring_rows_are_summarized_on_the_fly(tool, source):
+    """子串匹配（"Ningbo" → "Ningbo, Zhejiang"，"Cast" → "Casting"）没有预计算分组，现场统计"""
+    df = pd.read_csv(source)
+    rows = df[df["Location"].str.startswith("Ningbo") & (df["sub_process step"].str.strip().str.casefold() == "casting")]
+    expected = expected_groups(rows.assign(Location="x", **{"sub_process step": "x", "material_name": "x"}), KEYS).iloc[0]
+
+    result = tool._query_csv_baseline("Ningbo", "Cast", "AlSi9Mn", aggregate=True)
+    assert result["match"] == "substring"
+    assert_matches(result, expected)
+
+
+def test_first_mode_keeps_single_row(tool):
+    result = tool._query_csv_baseline("Ningbo, Zhejiang", "Casting", "AlSi9Mn", aggregate=False)
+    assert (result["low"], result["high"]) == (600.0, 650.0)
+    assert "median" not in result
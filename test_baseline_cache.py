@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+"""
+test_baseline_cache.py — 基准数据列式 .npy 缓存（baseline_cache.py）与内存映射存储（baseline_store.py）的单元测试
+首次构建、内存映射重载、源文件变化后重建、dtype 往返以及与 pd.read_csv 的结果一致性（离线，python -m pytest -q）
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from baseline_cache import cache_dir_for, frame_from_columns, load_baseline_table, load_columns, read_manifest
+from baseline_index import BaselineIndex
+from baseline_store import open_baseline_store
+
+HEADER = "Location,supplier_code,part_number,sub_process step,material_name,process_type,Low,High,Unit,valid_time,approved,note"
+ROWS = [
+    '"Ningbo, Zhejiang",97036203,044220003G,AlSi9Mn ,AlSi9Mn ,raw_material,21.079,23,/kg,9/2/2025,True,',
+    '"Ningbo, Zhejiang",97036203,044220003G,Casting,AlSi9Mn ,value_add,600,650,/h,9/2/2025,False,铸造',
+    '"Ningbo, Zhejiang",97036203,044220003G,Air leakage test,Nan,value_add,40,,/h,9/2/2025,True,',
+    'Nanjing Chervon Auto Precision,97157043,4044220014M,OP10,AlSi9MnMoZr,value_add,,,/h,,False,',
+]
+
+
+def write_csv(path, rows) -> None:
+    path.write_text("\n".join([HEADER, *rows]) + "\n", encoding="utf-8-sig")
+
+
+def bump_mtime(path, seconds: int = 10) -> None:
+    """保证 mtime 一定变化（部分文件系统的 mtime 精度只有 1 秒）"""
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + seconds * 1_000_000_000))
+
+
+def as_plain(df: pd.DataFrame) -> pd.DataFrame:
+    """缓存里的字符串列是 Categorical，转回 object 后再与 read_csv 的结果比较"""
+    return df.apply(lambda column: column.astype(object) if isinstance(column.dtype, pd.CategoricalDtype) else column)
+
+
+@pytest.fixture
+def csv_path(tmp_path):
+    path = tmp_path / "rates.csv"
+    write_csv(path, ROWS)
+    return path
+
+
+@pytest.fixture
+def cache_root(tmp_path, monkeypatch):
+    monkeypatch.delenv("BASELINE_CACHE", raising=False)
+    monkeypatch.delenv("BASELINE_CACHE_KEEP_VERSIONS", raising=False)
+    return str(tmp_path / "cache")
+
+
+# --------------------------------------------------------------------------- #
+# 构建 / 重载
+# --------------------------------------------------------------------------- #
+def test_first_load_builds_cache_then_reuses_it(csv_path, cache_root):
+    df, origin = load_baseline_table(str(csv_path), cache_root)
+    assert origin == "parsed"
+    directory = cache_dir_for(str(csv_path), cache_root)
+    manifest = read_manifest(directory)
+    assert manifest["rows"] == len(ROWS)
+    version_dir = os.path.join(directory, manifest["version"])
+    assert all(name.endswith(".npy") for name in os.listdir(version_dir))
+
+    cached, origin = load_baseline_table(str(csv_path), cache_root)
+    assert origin == "cache"
+    pd.testing.assert_frame_equal(as_plain(cached), as_plain(df))
+
+
+def test_reload_is_memory_mapped(csv_path, cache_root):
+    load_baseline_table(str(csv_path), cache_root)
+    directory = cache_dir_for(str(csv_path), cache_root)
+    manifest = read_manifest(directory)
+    arrays = load_columns(directory, manifest, mmap_mode="r")
+    assert isinstance(arrays["Low"]["values"], np.memmap)
+    assert isinstance(arrays["Location"]["codes"], np.memmap)
+    assert not arrays["Low"]["values"].flags.writeable
+
+
+def test_touched_source_is_not_reparsed(csv_path, cache_root):
+    load_baseline_table(str(csv_path), cache_root)
+    bump_mtime(csv_path)
+    _, origin = load_baseline_table(str(csv_path), cache_root)
+    assert origin == "cache-touched"
+    _, origin = load_baseline_table(str(csv_path), cache_root)
+    assert origin == "cache"
+
+
+def test_changed_source_is_rebuilt_and_previous_version_kept(csv_path, cache_root):
+    directory = cache_dir_for(str(csv_path), cache_root)
+    load_baseline_table(str(csv_path), cache_root)
+    first = read_manifest(directory)["version"]
+
+    write_csv(csv_path, [row.replace(",600,650,", ",610,660,") for row in ROWS])
+    bump_mtime(csv_path)
+    df, origin = load_baseline_table(str(csv_path), cache_root)
+    assert origin == "parsed"
+    second = read_manifest(directory)["version"]
+    assert second != first
+    assert df.loc[df["sub_process step"] == "Casting", "Low"].tolist() == [610]
+
+    # 默认保留紧邻的上一个版本，更早的版本被清理
+    write_csv(csv_path, [row.replace(",600,650,", ",620,670,") for row in ROWS])
+    bump_mtime(csv_path, 20)
+    load_baseline_table(str(csv_path), cache_root)
+    versions = {name for name in os.listdir(directory) if not name.startswith(".") and name != "manifest.json"}
+    assert versions == {second, read_manifest(directory)["version"]}
+
+
+def test_cache_off_reads_source(csv_path, cache_root, monkeypatch):
+    monkeypatch.setenv("BASELINE_CACHE", "off")
+    _, origin = load_baseline_table(str(csv_path), cache_root)
+    assert origin == "source"
+    assert not os.path.exists(cache_dir_for(str(csv_path), cache_root))
+
+
+# --------------------------------------------------------------------------- #
+# dtype 往返与结果一致性
+# --------------------------------------------------------------------------- #
+def test_round_trip_matches_read_csv(csv_path, cache_root):
+    expected = pd.read_csv(csv_path, encoding="utf-8-sig")
+    load_baseline_table(str(csv_path), cache_root)
+    cached, origin = load_baseline_table(str(csv_path), cache_root)
+    assert origin == "cache"
+
+    assert list(cached.columns) == list(expected.columns)
+    pd.testing.assert_frame_equal(as_plain(cached), expected)
+
+
+def test_dtypes_round_trip(csv_path, cache_root):
+    expected = pd.read_csv(csv_path, encoding="utf-8-sig")
+    load_baseline_table(str(csv_path), cache_root)
+    cached, _ = load_baseline_table(str(csv_path), cache_root)
+
+    for column in ("supplier_code", "Low", "High", "approved"):
+        assert cached[column].dtype == expected[column].dtype
+    assert cached["supplier_code"].dtype == np.int64
+    assert cached["High"].dtype == np.float64
+    assert cached["approved"].dtype == bool
+    # 字符串列字典编码为 Categorical，缺失值仍是 NaN
+    assert isinstance(cached["Location"].dtype, pd.CategoricalDtype)
+    assert cached["note"].isna().tolist() == expected["note"].isna().tolist()
+    assert cached["material_name"].iloc[0] == "AlSi9Mn "
+
+
+# --------------------------------------------------------------------------- #
+# 内存映射存储
+# --------------------------------------------------------------------------- #
+def test_mapped_store_matches_in_memory_index(csv_path, cache_root):
+    store, origin = open_baseline_store(str(csv_path), cache_root)
+    assert origin == "parsed"
+    index = BaselineIndex(pd.read_csv(csv_path, encoding="utf-8-sig"))
+
+    for query in [
+        ("Ningbo, Zhejiang", "Casting", "AlSi9Mn"),
+        ("Ningbo", "cast", "AlSi9Mn"),
+        ("Ningbo, Zhejiang", "Air leakage test", "AlSi9Mn"),
+        ("Nanjing", "OP10", "AlSi9MnMoZr"),
+        ("Shanghai", "Casting", "AlSi9Mn"),
+    ]:
+        positions, method, score = store.lookup(*query)
+        expected_positions, expected_method, expected_score = index.lookup(*query)
+        assert (method, score) == (expected_method, expected_score)
+        assert np.array_equal(positions, expected_positions)
+
+    pd.testing.assert_frame_equal(as_plain(store.df), pd.read_csv(csv_path, encoding="utf-8-sig"))
+
+
+def test_mapped_store_reopens_after_source_change(csv_path, cache_root):
+    old_store, _ = open_baseline_store(str(csv_path), cache_root)
+    assert open_baseline_store(str(csv_path), cache_root)[0] is old_store
+
+    write_csv(csv_path, [row.replace(",600,650,", ",610,660,") for row in ROWS])
+    bump_mtime(csv_path)
+    new_store, origin = open_baseline_store(str(csv_path), cache_root)
+    assert origin == "parsed"
+    assert new_store is not old_store
+
+    positions, _, _ = new_store.lookup("Ningbo, Zhejiang", "Casting", "AlSi9Mn")
+    assert new_store.row(positions[0])["Low"] == 610
+    # 仍持有旧存储的读取者继续看到旧数据
+    positions, _, _ = old_store.lookup("Ningbo, Zhejiang", "Casting", "AlSi9Mn")
+    assert old_store.row(positions[0])["Low"] == 600
+
+
+def test_frame_from_columns_without_mmap(csv_path, cache_root):
+    load_baseline_table(str(csv_path), cache_root)
+    directory = cache_dir_for(str(csv_path), cache_root)
+    manifest = read_manifest(directory)
+    arrays = load_columns(directory, manifest)
+    assert not isinstance(arrays["Low"]["values"], np.memmap)
+    assert len(frame_from_columns(manifest, arrays)) == len(ROWS)
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+test_baseline_index.py — BaselineIndex 精确 / 子串 / 未命中查询，以及与旧版 pandas 过滤的一致性
+（离线，读取仓库内的 process_rates 6 -fixed.csv，python -m pytest -q）
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from baseline_index import BaselineIndex, normalize_text
+
+CSV_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "process_rates 6 -fixed.csv")
+
+
+@pytest.fixture(scope="module")
+def df() -> pd.DataFrame:
+    return pd.read_csv(CSV_PATH, encoding="utf-8-sig")
+
+
+@pytest.fixture(scope="module")
+def index(df) -> BaselineIndex:
+    return BaselineIndex(df)
+
+
+def old_filter(df: pd.DataFrame, location: str, step: str, material: str) -> np.ndarray:
+    """旧实现（逐行 str.contains 扫描整张表）的行号；regex=False 与新实现的“不解析正则”一致"""
+    mask = (
+        df["Location"].str.contains(location, case=False, na=False, regex=False)
+        & df["sub_process step"].str.contains(step, case=False, na=False, regex=False)
+        & df["material_name"].str.contains(material, case=False, na=False, regex=False)
+    )
+    return np.flatnonzero(mask.to_numpy())
+
+
+# --------------------------------------------------------------------------- #
+# 精确命中
+# --------------------------------------------------------------------------- #
+def test_exact_hit_ignores_case_and_whitespace(index):
+    positions, method, score = index.lookup("  ningbo,   ZHEJIANG ", "casting", "alsi9mn")
+    assert (method, score) == ("exact", 1.0)
+    # 044220003G / 044220003H 两个零件各有一行 Casting
+    assert len(positions) == 2
+    assert {index.row(p)["part_number"] for p in positions} == {"044220003G", "044220003H"}
+
+
+def test_exact_hit_does_not_pick_longer_step(index, df):
+    """旧实现按“包含”取第一行，"Polishing" 会先命中 "Manual polishing"；精确索引只返回同名工序"""
+    positions, method, _ = index.lookup("Ningbo, Zhejiang", "Polishing", "AlSi9Mn")
+    assert method == "exact"
+    assert {index.row(p)["sub_process step"] for p in positions} == {"Polishing"}
+    assert df.iloc[old_filter(df, "Ningbo, Zhejiang", "Polishing", "AlSi9Mn")[0]]["sub_process step"] == "Manual polishing"
+
+
+def test_material_agnostic_rows_match_any_material(index):
+    """材料为 Nan / 空的行（检测、包装类工序）可被任意材料命中"""
+    positions, method, _ = index.lookup("Ningbo, Zhejiang", "Helium leakage test", "AlSi9Mn")
+    assert method == "exact"
+    assert [index.row(p)["Low"] for p in positions] == [90, 90]
+
+
+def test_every_row_is_reachable_by_its_own_key(index, df):
+    for position, row in df.iterrows():
+        found = index.lookup_exact(row["Location"], row["sub_process step"], row["material_name"])
+        assert position in found
+
+
+def test_exact_rows_are_a_subset_of_old_filter(index, df):
+    for _, row in df.iterrows():
+        location, step, material = (str(row[c]).strip() for c in ("Location", "sub_process step", "material_name"))
+        if not normalize_text(material):
+            continue
+        exact = index.lookup_exact(location, step, material)
+        assert set(exact) <= set(old_filter(df, location, step, material))
+
+
+# --------------------------------------------------------------------------- #
+# 子串兜底
+# --------------------------------------------------------------------------- #
+def test_substring_fallback_for_abbreviated_location(index):
+    positions, method, score = index.lookup("Ningbo", "Sand", "AlSi9Mn")
+    assert (method, score) == ("substring", 0.0)
+    assert {index.row(p)["sub_process step"] for p in positions} == {"Sand blasting"}
+
+
+def test_substring_falls_back_to_material_agnostic_rows(index):
+    positions = index.lookup_substring("Nanjing", "inspection", "AlSi9MnMoZr")
+    assert {index.row(p)["sub_process step"] for p in positions} == {"Before KTL inspection", "Inspection"}
+
+
+@pytest.mark.parametrize(
+    "location, step, material",
+    [
+        ("Ningbo", "washing", "AlSi9Mn"),
+        ("ningbo", "OP", "alsi9mn"),
+        ("Nanjing", "ing", "AlSi9MnMoZr"),
+        ("Zhejiang", "Al plate <6082>", "<6082>"),
+        ("Chervon", "KTL", "MoZr"),
+    ],
+)
+def test_substring_matches_old_pandas_filter(index, df, location, step, material):
+    expected = old_filter(df, location, step, material)
+    assert len(expected)
+    assert np.array_equal(index.lookup_substring(location, step, material), expected)
+
+
+def test_substring_does_not_parse_regex(index):
+    """"SG&A+Profit" 中的 "+" 按字面匹配，不当作正则量词"""
+    positions = index.lookup_substring("Ningbo", "A+Profit", "")
+    assert [index.row(p)["sub_process step"] for p in positions] == ["SG&A+Profit"]
+
+
+# --------------------------------------------------------------------------- #
+# 未命中
+# --------------------------------------------------------------------------- #
+@pytest.mark.parametrize(
+    "location, step, material",
+    [
+        ("Shanghai", "Casting", "AlSi9Mn"),
+        ("Ningbo, Zhejiang", "Laser welding", "AlSi9Mn"),
+        ("Ningbo, Zhejiang", "Casting", "Ti6Al4V"),
+    ],
+)
+def test_miss(index, location, step, material):
+    positions, method, score = index.lookup(location, step, material)
+    assert (len(positions), method, score) == (0, "none", 0.0)
+
+
+def test_empty_or_incomplete_frame_is_empty_index():
+    assert BaselineIndex().empty
+    assert BaselineIndex(pd.DataFrame({"Location": ["Ningbo"]})).empty
+    positions, method, _ = BaselineIndex().lookup("Ningbo", "Casting", "AlSi9Mn")
+    assert (len(positions), method) == (0, "none")
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+test_baseline_reloader.py — 基准数据热加载：改写 tmp_path 中的 CSV 后工具返回新费率，
+已经开始的查询（持有旧索引）继续使用旧快照；加载失败时保留旧索引
+（离线：LLM 与 Tavily 使用 benchmark_suite 的替身，python -m pytest -q）
+"""
+
+import os
+import threading
+import time
+
+import pytest
+
+from baseline_reloader import BaselineReloader
+from benchmark_suite import FakeCostLLM, FakeTavilySearch, LatencyProfile
+from process_rate_finder_tool import ProcessRateFinderTool
+
+HEADER = "Location,supplier_code,part_number,sub_process step,material_name,process_type,Low,High,Unit,valid_time"
+ROWS = [
+    '"Ningbo, Zhejiang",97036203,044220003G,AlSi9Mn,AlSi9Mn,raw_material,21,23,/kg,9/2/2025',
+    '"Ningbo, Zhejiang",97036203,044220003G,Casting,AlSi9Mn,value_add,600,650,/h,9/2/2025',
+    '"Ningbo, Zhejiang",97036203,044220003G,Trimming,AlSi9Mn,value_add,60,70,/h,9/2/2025',
+]
+
+
+def write_rates(path, casting_low: int, bump_seconds: int = 10) -> None:
+    """改写 Casting 的费率，并保证 mtime 一定变化（部分文件系统的 mtime 精度只有 1 秒）"""
+    rows = [row.replace(",600,650,", f",{casting_low},650,") for row in ROWS]
+    path.write_text("\n".join([HEADER, *rows]) + "\n", encoding="utf-8")
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + bump_seconds * 1_000_000_000))
+
+
+def casting_low(tool: ProcessRateFinderTool, index=None) -> float | None:
+    return tool._query_csv_baseline("Ningbo, Zhejiang", "Casting", "AlSi9Mn", index=index).get("low")
+
+
+class BlockingSearch(FakeTavilySearch):
+    """第一次搜索时通知测试并阻塞，直到测试放行（模拟查询进行到一半）"""
+
+    def __init__(self) -> None:
+        super().__init__(LatencyProfile(0, 0, 0, 2), payload_chars=200)
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def invoke(self, query: str):
+        self.started.set()
+        assert self.release.wait(10)
+        return super().invoke(query)
+
+
+@pytest.fixture
+def csv_path(tmp_path):
+    path = tmp_path / "rates.csv"
+    write_rates(path, 600, bump_seconds=0)
+    return path
+
+
+@pytest.fixture(params=["memory", "mmap"])
+def make_tool(request, csv_path, tmp_path, monkeypatch):
+    for name, value in {
+        "BASELINE_STORE": request.param,
+        "BASELINE_CACHE_DIR": str(tmp_path / "baseline_cache"),
+        "TAVILY_CACHE_TTL": "0",
+        "LLM_CACHE_TTL": "0",
+        "CSV_BASELINE_MODE": "first",
+        "BASELINE_RELOAD_INTERVAL": "0",
+    }.items():
+        monkeypatch.setenv(name, value)
+    tools = []
+
+    def make(search_client=None) -> ProcessRateFinderTool:
+        tool = ProcessRateFinderTool(
+            llm=FakeCostLLM(profile=LatencyProfile(0, 0, 0, 1), recorded=[]),
+            csv_path=str(csv_path),
+            search_client=search_client or FakeTavilySearch(LatencyProfile(0, 0, 0, 2), payload_chars=200),
+            search_timeout=30,
+            gather_deadline=30,
+            traffic_mode="off",
+        )
+        tools.append(tool)
+        return tool
+
+    yield make
+    for tool in tools:
+        tool.stop_baseline_reloader()
+
+
+def test_reload_serves_new_rates_and_keeps_old_snapshot(make_tool, csv_path):
+    tool = make_tool()
+    snapshot = tool.baseline_index
+    assert casting_low(tool) == 600.0
+
+    write_rates(csv_path, 610)
+    assert tool.reload_baseline()
+    assert tool.baseline_index is not snapshot
+    assert casting_low(tool) == 610.0
+    # 之前取到的索引对象不受替换影响
+    assert casting_low(tool, snapshot) == 600.0
+
+
+def test_in_flight_part_costing_keeps_old_snapshot(make_tool, csv_path):
+    search = BlockingSearch()
+    tool = make_tool(search)
+    results = []
+    worker = threading.Thread(
+        target=lambda: results.append(tool.cost_part("044220003G", 3110.0, 195.6, 1_100_000, max_concurrency=2))
+    )
+    worker.start()
+    try:
+        # 整件核算已读完路线与基准、正在收集实时数据时替换索引
+        assert search.started.wait(10)
+        write_rates(csv_path, 610)
+        assert tool.reload_baseline()
+        assert casting_low(tool) == 610.0
+    finally:
+        search.release.set()
+        worker.join(30)
+
+    steps = {step["step"]: step for step in results[0]["value_add"]}
+    assert steps["Casting"]["csv_baseline"]["low"] == 600.0
+
+    # 替换之后开始的查询看到新费率
+    items = tool.run_batch([{
+        "location": "Ningbo, Zhejiang", "process_name": "Casting", "material_name": "AlSi9Mn",
+        "surface_area": 3110.0, "volume": 195.6, "annual_volume": 1_100_000, "unit": "CNY/h",
+    }])
+    assert items[0]["output"]["csv_baseline"]["low"] == 610.0
+
+
+def test_background_reloader_picks_up_change(make_tool, csv_path):
+    tool = make_tool()
+    reloader = tool.start_baseline_reloader(interval=0.02)
+    assert reloader.running
+
+    write_rates(csv_path, 620)
+    deadline = time.monotonic() + 10
+    while casting_low(tool) != 620.0 and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert casting_low(tool) == 620.0
+    assert reloader.reloads == 1
+
+    tool.stop_baseline_reloader()
+    assert not reloader.running
+
+
+def test_failed_reload_keeps_old_index(make_tool, csv_path):
+    tool = make_tool()
+    snapshot = tool.baseline_index
+    csv_path.write_text("Location,Low\nNingbo,1\n", encoding="utf-8")
+    stat = os.stat(csv_path)
+    os.utime(csv_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10_000_000_000))
+
+    assert not tool.reload_baseline()
+    assert tool.baseline_index is snapshot
+    assert casting_low(tool) == 600.0
+
+
+def test_check_waits_until_file_is_stable(csv_path):
+    loaded = []
+    reloader = BaselineReloader(str(csv_path), load=lambda: "index", apply=loaded.append)
+    assert not reloader.check()
+
+    write_rates(csv_path, 610)
+    # 第一次看到新签名只记录，下一轮签名不变才重新加载
+    assert not reloader.check()
+    assert reloader.check()
+    assert loaded == ["index"]
+    assert not reloader.check()
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+test_baseline_timeline.py — as_of 回溯查询：从 run / arun / run_batch / cost_part / StructuredTool 一路传到 CSV 基准对比
+（离线：LLM 与 Tavily 使用 benchmark_suite 的替身，python -m pytest -q）
+"""
+
+import asyncio
+import json
+
+import pytest
+
+from benchmark_suite import FakeCostLLM, FakeTavilySearch, LatencyProfile
+from process_rate_finder_tool import ProcessRateFinderArgs, ProcessRateFinderTool
+
+HEADER = "Location,supplier_code,part_number,sub_process step,material_name,process_type,Low,High,Unit,valid_time"
+ROWS = [
+    '"Ningbo, Zhejiang",97036203,044220003G,AlSi9Mn,AlSi9Mn,raw_material,21,23,/kg,1/1/2025',
+    '"Ningbo, Zhejiang",97036203,044220003G,Casting,AlSi9Mn,value_add,500,550,/h,1/1/2025',
+    '"Ningbo, Zhejiang",97036203,044220003G,Casting,AlSi9Mn,value_add,600,650,/h,9/2/2025',
+    '"Ningbo, Zhejiang",97036203,044220003G,Trimming,AlSi9Mn,value_add,60,70,/h,9/2/2025',
+]
+
+QUERY = {
+    "location": "Ningbo, Zhejiang",
+    "process_name": "Casting",
+    "material_name": "AlSi9Mn",
+    "surface_area": 3110.0,
+    "volume": 195.6,
+    "annual_volume": 1_100_000,
+    "unit": "CNY/h",
+}
+
+
+@pytest.fixture
+def tool(tmp_path, monkeypatch) -> ProcessRateFinderTool:
+    for name, value in {
+        "BASELINE_CACHE_DIR": str(tmp_path / "baseline_cache"),
+        "TAVILY_CACHE_TTL": "0",
+        "LLM_CACHE_TTL": "0",
+        "PROMPT_TOKEN_COUNTER": "estimate",
+        "CSV_BASELINE_MODE": "aggregate",
+        "BASELINE_RELOAD_INTERVAL": "0",
+    }.items():
+        monkeypatch.setenv(name, value)
+    csv_path = tmp_path / "rates.csv"
+    csv_path.write_text("\n".join([HEADER, *ROWS]) + "\n", encoding="utf-8")
+    return ProcessRateFinderTool(
+        llm=FakeCostLLM(profile=LatencyProfile(0, 0, 0, 1), recorded=[]),
+        csv_path=str(csv_path),
+        search_client=FakeTavilySearch(LatencyProfile(0, 0, 0, 2), payload_chars=200),
+        traffic_mode="off",
+    )
+
+
+def test_args_schema_accepts_and_normalizes_as_of():
+    assert ProcessRateFinderArgs(**QUERY).as_of is None
+    assert ProcessRateFinderArgs(**QUERY, as_of="6/1/2025").as_of == "2025-06-01"
+    with pytest.raises(ValueError):
+        ProcessRateFinderArgs(**QUERY, as_of="not a date")
+
+
+def test_run_with_as_of_uses_rates_effective_on_that_day(tool):
+    baseline = json.loads(tool.run(**QUERY, as_of="2025-06-01"))["csv_baseline"]
+    assert (baseline["low"], baseline["high"]) == (500.0, 550.0)
+    assert (baseline["as_of"], baseline["valid_time"]) == ("2025-06-01", "2025-01-01")
+
+    # 不指定 as_of：汇总全部版本
+    baseline = json.loads(tool.run(**QUERY))["csv_baseline"]
+    assert (baseline["low"], baseline["high"]) == (500.0, 650.0)
+    assert "as_of" not in baseline
+
+
+def test_as_of_before_first_valid_time_has_no_baseline(tool):
+    assert json.loads(tool.run(**QUERY, as_of="2024-12-31"))["csv_baseline"] == {}
+
+
+def test_arun_forwards_as_of(tool):
+    baseline = json.loads(asyncio.run(tool.arun(**QUERY, as_of="2025-09-02")))["csv_baseline"]
+    assert (baseline["low"], baseline["valid_time"]) == (600.0, "2025-09-02")
+
+
+def test_batches_take_as_of_per_query(tool):
+    queries = [dict(QUERY, as_of="2025-06-01"), dict(QUERY, as_of="2025-09-30"), dict(QUERY, as_of="bogus")]
+    for items in (tool.run_batch(queries), asyncio.run(tool.arun_batch(queries))):
+        assert [item["output"]["csv_baseline"]["low"] for item in items[:2]] == [500.0, 600.0]
+        assert not items[2]["ok"]
+        assert "参数校验失败" in items[2]["error"]
+
+
+def test_cost_part_forwards_as_of(tool):
+    result = tool.cost_part("044220003G", surface_area=3110.0, volume=195.6, annual_volume=1_100_000, as_of="2025-06-01")
+    steps = {step["step"]: step for step in result["value_add"]}
+    assert steps["Casting"]["csv_baseline"]["low"] == 500.0
+    # Trimming 在 2025-06-01 之前还没有生效的费率
+    assert steps["Trimming"]["csv_baseline"] == {}
+
+
+def test_structured_tool_exposes_as_of(tool):
+    structured = tool.as_tool()
+    assert "as_of" in structured.args
+    baseline = json.loads(structured.invoke(dict(QUERY, as_of="9/2/2025")))["csv_baseline"]
+    assert baseline["as_of"] == "2025-09-02"
+    assert baseline["low"] == 600.0
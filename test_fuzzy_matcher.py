@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+test_fuzzy_matcher.py — NGramMatcher 打分（含工序编号降分）与 BaselineIndex 歧义判定的单元测试
+（离线，python -m pytest -q）
+"""
+
+import pandas as pd
+import pytest
+
+from baseline_index import BaselineIndex
+from fuzzy_matcher import DIGIT_MISMATCH_PENALTY, NGramMatcher, char_ngrams, same_numbering_family
+
+STEPS = ["Maching OP10", "Machining OP20", "Machining OP30", "KTL coating", "Washing", "OP10"]
+
+
+@pytest.fixture
+def matcher() -> NGramMatcher:
+    return NGramMatcher(STEPS)
+
+
+def dice(a: str, b: str) -> float:
+    grams_a, grams_b = char_ngrams(a), char_ngrams(b)
+    return 2.0 * len(grams_a & grams_b) / (len(grams_a) + len(grams_b))
+
+
+# --------------------------------------------------------------------------- #
+# 打分
+# --------------------------------------------------------------------------- #
+def test_identical_term_scores_one(matcher):
+    assert matcher.search("Machining OP20", limit=1) == [("machining op20", 1.0)]
+
+
+def test_scores_are_dice_coefficients(matcher):
+    scores = dict(matcher.search("coating", limit=10))
+    assert scores["ktl coating"] == pytest.approx(dice("coating", "ktl coating"), abs=1e-4)
+
+
+def test_normalization_ignores_case_and_spacing(matcher):
+    assert matcher.search("  machining   op20 ", limit=1)[0] == ("machining op20", 1.0)
+
+
+def test_digit_mismatch_is_penalized(matcher):
+    """查询 OP30 的拼写变体：OP20 的 n-gram 重合度相近，但编号不同被降分"""
+    scores = dict(matcher.search("Machinning OP30", limit=10))
+    assert scores["machining op30"] > 0.8
+    raw = dice("machinning op30", "machining op20")
+    assert scores["machining op20"] == pytest.approx(raw * DIGIT_MISMATCH_PENALTY, abs=1e-4)
+
+
+def test_typo_still_matches_same_number(matcher):
+    best, score = matcher.search("Machining OP10", limit=1)[0]
+    assert best == "maching op10"
+    assert score > 0.6
+
+
+def test_terms_without_digits_are_not_penalized(matcher):
+    scores = dict(matcher.search("Washing 2", limit=10))
+    assert scores["washing"] == pytest.approx(dice("washing 2", "washing"), abs=1e-4)
+
+
+def test_query_without_digits_scores_numbered_variants_equally(matcher):
+    scores = dict(matcher.search("Machining", limit=10))
+    assert scores["machining op20"] == scores["machining op30"]
+
+
+def test_min_score_and_limit(matcher):
+    results = matcher.search("Machining", limit=2, min_score=0.5)
+    assert len(results) == 2
+    assert all(score >= 0.5 for _, score in results)
+    assert matcher.search("zzzz") == []
+    assert matcher.search("") == []
+
+
+def test_same_numbering_family():
+    assert same_numbering_family("Machining OP20", "machining op30")
+    assert not same_numbering_family("Machining OP20", "Machining OP20")
+    assert not same_numbering_family("Maching OP10", "Machining OP20")
+
+
+# --------------------------------------------------------------------------- #
+# BaselineIndex：只差编号的候选判为歧义
+# --------------------------------------------------------------------------- #
+@pytest.fixture
+def index() -> BaselineIndex:
+    rows = [
+        ("Ningbo, Zhejiang", "Machining OP20", "AlSi9Mn", 10.0, 12.0),
+        ("Ningbo, Zhejiang", "Machining OP30", "AlSi9Mn", 20.0, 22.0),
+        ("Ningbo, Zhejiang", "Maching OP10", "AlSi9Mn", 5.0, 6.0),
+        ("Nanjing", "Machining OP20", "AlSi9Mn", 11.0, 13.0),
+    ]
+    frame = pd.DataFrame(rows, columns=["Location", "sub_process step", "material_name", "Low", "High"])
+    return BaselineIndex(frame)
+
+
+def test_unnumbered_query_is_ambiguous(index):
+    positions, method, score = index.lookup("Ningbo, Zhejiang", "Machining", "AlSi9Mn")
+    assert method == "ambiguous"
+    assert len(positions) == 0
+    assert score > 0.6
+    assert index.ambiguous_steps("Ningbo, Zhejiang", "Machining", "AlSi9Mn") == [
+        "machining op20", "machining op30",
+    ]
+
+
+def test_numbered_typo_resolves(index):
+    positions, method, _ = index.lookup("Ningbo", "Machinning OP30", "AlSi9Mn")
+    assert method == "fuzzy"
+    assert index.row(positions[0])["Low"] == 20.0
+
+
+def test_single_variant_at_location_is_not_ambiguous(index):
+    """该地区只有 OP20 有数据时不算歧义"""
+    positions, method, _ = index.lookup("Nanjing", "Machining", "AlSi9Mn")
+    assert method == "fuzzy"
+    assert index.row(positions[0])["Low"] == 11.0
+    assert index.ambiguous_steps("Nanjing", "Machining", "AlSi9Mn") == []
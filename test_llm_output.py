@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+test_llm_output.py — llm_output.repair_json / parse_cost_result 的单元测试（离线，python -m pytest -q）
+"""
+
+import json
+
+import pytest
+
+from llm_output import RETIRED_FIELDS, CostReasoningResult, loads_lenient, parse_cost_result, repair_json
+
+
+# --------------------------------------------------------------------------- #
+# 截断
+# --------------------------------------------------------------------------- #
+def test_truncated_string_value_is_dropped():
+    """截断在字符串值中间：不完整的最后一个字段被丢弃，之前的字段保留"""
+    text = '{"calculated_weight_kg": 12.5, "detailed_reasoning": "先估算人工'
+    assert json.loads(repair_json(text)) == {"calculated_weight_kg": 12.5, "detailed_reasoning": "先估算人工"}
+
+
+def test_truncated_after_key_drops_dangling_key():
+    text = '{"labor": 40, "energy":'
+    assert json.loads(repair_json(text)) == {"labor": 40}
+
+
+def test_truncated_nested_object_closes_all_brackets():
+    text = '{"base_hourly_cost": {"labor_CNY_per_hour": 40, "energy_CNY_per_hour": 12'
+    assert json.loads(repair_json(text)) == {
+        "base_hourly_cost": {"labor_CNY_per_hour": 40, "energy_CNY_per_hour": 12}
+    }
+
+
+def test_truncated_inside_array():
+    text = '{"suppliers": [{"code": "A"}, {"code": "B"}, {"co'
+    assert json.loads(repair_json(text)) == {"suppliers": [{"code": "A"}, {"code": "B"}, {}]}
+
+
+def test_truncated_after_comma():
+    text = '{"a": 1, "b": [1, 2,'
+    assert json.loads(repair_json(text)) == {"a": 1, "b": [1, 2]}
+
+
+# --------------------------------------------------------------------------- #
+# 字面量与轻微不合法
+# --------------------------------------------------------------------------- #
+@pytest.mark.parametrize(
+    "literal, expected",
+    [("True", True), ("False", False), ("None", None), ("NaN", None), ("nan", None)],
+)
+def test_python_literals_become_json(literal, expected):
+    assert json.loads(repair_json(f'{{"value": {literal}}}')) == {"value": expected}
+
+
+def test_literals_inside_strings_are_untouched():
+    text = '{"reasoning": "None of the True costs", "ok": True}'
+    assert json.loads(repair_json(text)) == {"reasoning": "None of the True costs", "ok": True}
+
+
+def test_code_fence_and_trailing_commas():
+    text = '```json\n{"a": [1, 2,], "b": {"c": 3,},}\n```'
+    assert json.loads(repair_json(text)) == {"a": [1, 2], "b": {"c": 3}}
+
+
+def test_raw_newline_in_string_is_escaped():
+    text = '{"reasoning": "第一行\n第二行"}'
+    assert json.loads(repair_json(text)) == {"reasoning": "第一行\n第二行"}
+
+
+def test_escaped_quote_does_not_end_string():
+    text = '{"reasoning": "he said \\"ok\\", then'
+    assert json.loads(repair_json(text)) == {"reasoning": 'he said "ok", then'}
+
+
+def test_text_before_json_is_skipped():
+    assert json.loads(repair_json('结果如下：{"a": 1}')) == {"a": 1}
+
+
+def test_no_json_raises():
+    with pytest.raises(ValueError):
+        repair_json("抱歉，我无法回答")
+
+
+# --------------------------------------------------------------------------- #
+# 解析入口
+# --------------------------------------------------------------------------- #
+def test_loads_lenient_reports_repair():
+    assert loads_lenient('{"a": 1}') == ({"a": 1}, False)
+    assert loads_lenient('{"a": 1,') == ({"a": 1}, True)
+
+
+def test_parse_cost_result_normalizes_numbers():
+    text = '{"base_hourly_cost": {"total_CNY_per_hour": "120 CNY/h"}, "processing_speed": {"value": "60"'
+    result, repaired, problems = parse_cost_result(text)
+    assert repaired
+    assert problems == []
+    assert result["base_hourly_cost"]["total_CNY_per_hour"] == 120.0
+    assert result["processing_speed"]["value"] == 60.0
+
+
+def test_parse_cost_result_rejects_non_object():
+    with pytest.raises(ValueError):
+        parse_cost_result("[1, 2, 3]")
+
+
+def test_schema_matches_prompt_template():
+    """schema 字段与 cost_prompts.OUTPUT_SCHEMA_SECTION 的顶层字段一致"""
+    from cost_prompts import OUTPUT_SCHEMA_SECTION
+
+    for field in CostReasoningResult.model_fields:
+        assert f'"{field}"' in OUTPUT_SCHEMA_SECTION
+    for field in RETIRED_FIELDS:
+        assert field not in CostReasoningResult.model_fields
+        assert f'"{field}"' not in OUTPUT_SCHEMA_SECTION
+
+
+def test_retired_fields_are_dropped():
+    """LLM 自行换算出的 final_cost 等字段不进入结果，目标单位成本只来自本地换算"""
+    text = (
+        '{"base_hourly_cost": {"total_CNY_per_hour": 120}, "target_unit": "CNY/pcs", '
+        '"unit_conversion": {"conversion_factor": 0.5}, "final_cost": 60, "final_unit": "CNY/pcs", '
+        '"cost_breakdown": {"labor": 30}, "supplier_notes": "extra"}'
+    )
+    result, repaired, problems = parse_cost_result(text)
+    assert not repaired
+    assert problems == []
+    assert result == {"base_hourly_cost": {"total_CNY_per_hour": 120.0}, "supplier_notes": "extra"}
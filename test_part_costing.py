@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+test_part_costing.py — 整件核算：路线分类（原料 / 外购件 / 增值工序 / SG&A）、rollup 汇总与缺价项的报告
+（基于仓库内的 process_rates 6 -fixed.csv；端到端部分 LLM 与 Tavily 使用 benchmark_suite 的替身；离线，python -m pytest -q）
+"""
+
+import os
+
+import pandas as pd
+import pytest
+
+from baseline_index import BaselineIndex
+from benchmark_suite import FakeCostLLM, FakeTavilySearch, LatencyProfile
+from part_costing import PartCostingError, classify_routing, estimate_weight_kg, midpoint, rollup
+from process_rate_finder_tool import ProcessRateFinderTool
+
+CSV_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "process_rates 6 -fixed.csv")
+
+G_STEPS = [
+    "Melting", "Casting", "Trimming", "Deburring", "Sand blasting", "Manual polishing", "Maching OP10",
+    "Washing", "FSW", "Polishing", "Machining OP20", "Ultrasonic washing",
+    "Before KTL visual inspection & deburring", "KTL coating", "After KTL visual inspection",
+    "Machining OP30", "Inner washing", "outer washing", "Air leakage test", "Helium leakage test",
+    "Final inspection", "Protective cap assembly & packaging",
+]
+
+
+@pytest.fixture(scope="module")
+def index() -> BaselineIndex:
+    return BaselineIndex(pd.read_csv(CSV_PATH, encoding="utf-8-sig"))
+
+
+def step_results(steps, cost: float = 2.0, failed=()):
+    return [
+        {"step": step, "ok": step not in failed, "cost": None if step in failed else cost,
+         "error": "LLM 调用失败" if step in failed else None}
+        for step in steps
+    ]
+
+
+# --------------------------------------------------------------------------- #
+# 路线分类
+# --------------------------------------------------------------------------- #
+def test_classify_044220003G(index):
+    routing = classify_routing(index.routing("044220003G"))
+    assert (routing.part_number, routing.location, routing.material_name) == ("044220003G", "Ningbo, Zhejiang", "AlSi9Mn")
+    assert routing.material_price_per_kg == pytest.approx(22.0395)
+    # "Material scrap + overhead"（% of metal）→ 损耗率；"SG&A+Profit"（%）→ 加成比例，都不是增值工序
+    assert routing.scrap_pct == 3.0
+    assert routing.sga_profit_pct == 26.0
+    assert routing.components == [{"name": "Protective cap", "price_CNY": pytest.approx(1.3), "unit": "/bag"}]
+    assert routing.secondary_materials == [{"name": "Al plate <6082>", "price_CNY_per_kg": 29.0}]
+    assert routing.steps == G_STEPS
+
+
+def test_classify_part_without_sga_row(index):
+    routing = classify_routing(index.routing("044220003H"))
+    assert routing.sga_profit_pct == 0.0
+    assert routing.scrap_pct == 2.0
+    assert len(routing.steps) == 17
+    # 路线里排在原料之前的增值工序同样计入
+    assert routing.steps[0] == "Sharping"
+    assert routing.components == [{"name": "Plate cover", "price_CNY": 1.0, "unit": "/bag"}]
+
+
+def test_classify_material_agnostic_steps_and_default_material(index):
+    routing = classify_routing(index.routing("4044220014M"))
+    assert routing.material_name == "AlSi9MnMoZr"
+    assert routing.material_price_per_kg == 23.0
+    assert "Inspection" in routing.steps and "Packaging" in routing.steps
+    assert len(routing.steps) == 14
+
+
+def test_classify_with_explicit_material(index):
+    """指定的主材料与路线中的 /kg 原料都不一致时，所有原料都算作其他材料"""
+    routing = classify_routing(index.routing("044220003G"), material_name="6082")
+    assert routing.material_price_per_kg is None
+    assert [entry["name"] for entry in routing.secondary_materials] == ["AlSi9Mn", "Al plate <6082>"]
+
+
+def test_empty_routing_raises(index):
+    with pytest.raises(PartCostingError):
+        classify_routing(index.routing("NO-SUCH-PART"))
+
+
+def test_midpoint():
+    assert midpoint(21.079, 23) == pytest.approx(22.0395)
+    assert midpoint(None, 30) == 30
+    assert midpoint(float("nan"), None) is None
+
+
+# --------------------------------------------------------------------------- #
+# rollup
+# --------------------------------------------------------------------------- #
+def test_rollup_total_and_unpriced_items(index):
+    routing = classify_routing(index.routing("044220003G"))
+    result = rollup(routing, 0.5, step_results(routing.steps, cost=2.0, failed={"KTL coating"}))
+
+    material = 22.0395 * 0.5 * 1.03
+    value_add = 2.0 * 21
+    subtotal = material + 1.3 + value_add
+    assert result["material"]["cost_CNY_per_pcs"] == pytest.approx(material, abs=1e-4)
+    assert result["summary"] == {
+        "material": round(material, 4),
+        "components": 1.3,
+        "value_add": value_add,
+        "subtotal": round(subtotal, 4),
+        "sga_profit": round(subtotal * 0.26, 4),
+        "total_CNY_per_pcs": round(subtotal * 1.26, 4),
+    }
+    # 缺价项不计入合计，逐项列出
+    assert not result["complete"]
+    assert result["unpriced"] == [
+        "材料 Al plate <6082>（未提供单件用量 kg）",
+        "工序 KTL coating（LLM 调用失败）",
+    ]
+
+
+def test_rollup_with_quantities_is_complete(index):
+    routing = classify_routing(index.routing("044220003G"))
+    result = rollup(
+        routing, 0.5, step_results(routing.steps, cost=1.0),
+        component_quantities={"protective cap": 2},
+        secondary_weights_kg={"Al plate <6082>": 0.1},
+    )
+    assert result["complete"] and result["unpriced"] == []
+    assert result["components"][0]["cost_CNY_per_pcs"] == pytest.approx(2.6)
+    assert result["secondary_materials"][0]["cost_CNY_per_pcs"] == pytest.approx(2.9)
+    subtotal = 22.0395 * 0.5 * 1.03 + 2.9 + 2.6 + 22.0
+    assert result["summary"]["total_CNY_per_pcs"] == pytest.approx(subtotal * 1.26, abs=1e-3)
+
+
+def test_rollup_without_weight_reports_main_material(index):
+    routing = classify_routing(index.routing("4044220014M"))
+    result = rollup(routing, None, step_results(routing.steps))
+    assert result["material"]["cost_CNY_per_pcs"] is None
+    assert result["unpriced"] == ["主材料 AlSi9MnMoZr（缺少 /kg 单价或重量）"]
+    assert result["summary"]["total_CNY_per_pcs"] == 28.0
+
+
+def test_estimate_weight_kg():
+    # AlSi9Mn 2.65 g/cm³
+    assert estimate_weight_kg("AlSi9Mn", 195.6) == pytest.approx(0.51834)
+    assert estimate_weight_kg("unobtanium", 195.6) is None
+
+
+# --------------------------------------------------------------------------- #
+# 端到端：ProcessRateFinderTool.cost_part
+# --------------------------------------------------------------------------- #
+def test_cost_part_end_to_end(tmp_path, monkeypatch):
+    for name, value in {
+        "BASELINE_CACHE_DIR": str(tmp_path / "baseline_cache"),
+        "TAVILY_CACHE_TTL": "0",
+        "LLM_CACHE_TTL": "0",
+        "PROMPT_TOKEN_COUNTER": "estimate",
+        "BASELINE_RELOAD_INTERVAL": "0",
+    }.items():
+        monkeypatch.setenv(name, value)
+    tool = ProcessRateFinderTool(
+        llm=FakeCostLLM(profile=LatencyProfile(0, 0, 0, 1), recorded=[]),
+        csv_path=CSV_PATH,
+        search_client=FakeTavilySearch(LatencyProfile(0, 0, 0, 2), payload_chars=200),
+        traffic_mode="off",
+    )
+    result = tool.cost_part("044220003G", surface_area=3110.0, volume=195.6, annual_volume=1_100_000)
+
+    assert [step["step"] for step in result["value_add"]] == G_STEPS
+    assert all(step["ok"] and step["final_cost_source"] == "local_conversion" for step in result["value_add"])
+    assert result["unpriced"] == ["材料 Al plate <6082>（未提供单件用量 kg）"]
+    assert not result["complete"]
+
+    summary = result["summary"]
+    # 重量默认 体积 × 密度：195.6 cm³ × 2.65 g/cm³
+    assert result["material"]["weight_kg"] == pytest.approx(0.51834)
+    assert summary["material"] == pytest.approx(22.0395 * 0.51834 * 1.03, abs=1e-4)
+    assert summary["components"] == pytest.approx(1.3)
+    assert summary["value_add"] == pytest.approx(sum(step["cost"] for step in result["value_add"]), abs=1e-3)
+    assert summary["total_CNY_per_pcs"] == pytest.approx(summary["subtotal"] * 1.26, abs=1e-3)
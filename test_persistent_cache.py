@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+test_persistent_cache.py — PersistentTTLCache 的 TTL 过期与 LRU 淘汰单元测试（离线，python -m pytest -q）
+"""
+
+import pytest
+
+import persistent_cache
+from persistent_cache import PersistentTTLCache
+
+
+class FakeClock:
+    """替换 persistent_cache 模块里的 time.time，时间只在测试里手动推进"""
+
+    def __init__(self, now: float = 1_000_000.0) -> None:
+        self.now = now
+
+    def time(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float) -> None:
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(persistent_cache.time, "time", fake.time)
+    return fake
+
+
+@pytest.fixture
+def make_cache(tmp_path):
+    caches = []
+
+    def make(**kwargs) -> PersistentTTLCache:
+        kwargs.setdefault("path", str(tmp_path / "cache.sqlite"))
+        cache = PersistentTTLCache(**kwargs)
+        caches.append(cache)
+        return cache
+
+    yield make
+    for cache in caches:
+        cache.close()
+
+
+# --------------------------------------------------------------------------- #
+# TTL
+# --------------------------------------------------------------------------- #
+def test_entry_expires_after_ttl(clock, make_cache):
+    cache = make_cache(ttl_seconds=60)
+    cache.set("q", {"text": "result"})
+
+    clock.advance(59)
+    assert cache.get("q") == {"text": "result"}
+
+    clock.advance(2)
+    assert cache.get("q") is None
+    # 过期条目在读取时被删除
+    assert len(cache) == 0
+    assert cache.stats()["misses"] == 1
+
+
+def test_access_does_not_extend_ttl(clock, make_cache):
+    """TTL 按写入时间计算，读取只刷新 LRU 顺序"""
+    cache = make_cache(ttl_seconds=60)
+    cache.set("q", 1)
+    clock.advance(40)
+    assert cache.get("q") == 1
+    clock.advance(40)
+    assert cache.get("q") is None
+
+
+def test_zero_ttl_never_expires(clock, make_cache):
+    cache = make_cache(ttl_seconds=0)
+    cache.set("q", 1)
+    clock.advance(10 * 365 * 24 * 3600)
+    assert cache.get("q") == 1
+
+
+def test_set_purges_expired_entries(clock, make_cache):
+    cache = make_cache(ttl_seconds=60)
+    cache.set("old", 1)
+    clock.advance(120)
+    cache.set("new", 2)
+    assert len(cache) == 1
+
+
+# --------------------------------------------------------------------------- #
+# LRU
+# --------------------------------------------------------------------------- #
+def test_lru_evicts_least_recently_accessed(clock, make_cache):
+    cache = make_cache(max_entries=2, ttl_seconds=0)
+    cache.set("a", 1)
+    clock.advance(1)
+    cache.set("b", 2)
+    clock.advance(1)
+    # 读取 a 之后，b 成为最久未访问的条目
+    assert cache.get("a") == 1
+    clock.advance(1)
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_overwrite_does_not_evict(clock, make_cache):
+    cache = make_cache(max_entries=2, ttl_seconds=0)
+    cache.set("a", 1)
+    clock.advance(1)
+    cache.set("b", 2)
+    clock.advance(1)
+    cache.set("a", 10)
+    assert len(cache) == 2
+    assert cache.get("a") == 10
+    assert cache.stats()["evictions"] == 0
+
+
+def test_eviction_is_per_namespace(clock, make_cache):
+    search = make_cache(namespace="search", max_entries=1, ttl_seconds=0)
+    llm = make_cache(namespace="llm", max_entries=1, ttl_seconds=0)
+    search.set("q", "search result")
+    llm.set("q", "llm result")
+    clock.advance(1)
+    search.set("q2", "another search")
+
+    assert search.get("q") is None
+    assert llm.get("q") == "llm result"
+
+
+# --------------------------------------------------------------------------- #
+# 键与持久化
+# --------------------------------------------------------------------------- #
+def test_keys_are_normalized(clock, make_cache):
+    cache = make_cache()
+    cache.set("  China  Ningbo LABOR cost ", 1)
+    assert cache.get("china ningbo labor cost") == 1
+
+
+def test_entries_survive_reopen(clock, make_cache, tmp_path):
+    path = str(tmp_path / "shared.sqlite")
+    make_cache(path=path).set("q", [1, 2])
+    assert make_cache(path=path).get("q") == [1, 2]
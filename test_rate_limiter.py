@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+test_rate_limiter.py — RateLimiter 的 RPM / TPM 令牌桶计算与补充（注入假时钟，结果确定；离线，python -m pytest -q）
+"""
+
+import asyncio
+
+import pytest
+
+import rate_limiter
+from rate_limiter import RateLimiter, get_rate_limiter
+
+
+class FakeClock:
+    """time() 返回手动推进的时间；sleep() 不真正等待，只推进时间并记录"""
+
+    def __init__(self, now: float = 1_000_000.0) -> None:
+        self.now = now
+        self.sleeps = []
+
+    def time(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+    def advance(self, seconds: float) -> None:
+        self.now += seconds
+
+
+@pytest.fixture(autouse=True)
+def no_jitter(monkeypatch):
+    """等待时附加的随机抖动固定为 0，等待时间可以精确断言"""
+    monkeypatch.setattr(rate_limiter.random, "uniform", lambda low, high: low)
+
+
+@pytest.fixture
+def clock() -> FakeClock:
+    return FakeClock()
+
+
+def make_limiter(clock: FakeClock, **kwargs) -> RateLimiter:
+    kwargs.setdefault("burst_seconds", 10.0)
+    return RateLimiter("test", clock=clock.time, sleep=clock.sleep, **kwargs)
+
+
+# --------------------------------------------------------------------------- #
+# RPM
+# --------------------------------------------------------------------------- #
+def test_capacity_is_rate_times_burst(clock):
+    limiter = make_limiter(clock, requests_per_minute=60)
+    assert limiter.rates == {"requests": 1.0}
+    assert limiter.capacity == {"requests": 10.0}
+    # 最小容量为 1，否则极低速率下永远取不到令牌
+    assert make_limiter(clock, requests_per_minute=3, burst_seconds=1).capacity == {"requests": 1.0}
+
+
+def test_burst_then_wait_for_refill(clock):
+    limiter = make_limiter(clock, requests_per_minute=60)
+    assert [limiter.acquire() for _ in range(10)] == [0.0] * 10
+    # 桶空：每秒补 1 个请求
+    assert limiter.acquire() == pytest.approx(1.0)
+    assert clock.sleeps == [pytest.approx(1.0)]
+    assert limiter.stats()["throttled"] == 1
+    assert limiter.stats()["acquired"] == 11
+
+
+def test_refill_is_proportional_to_elapsed_time(clock):
+    limiter = make_limiter(clock, requests_per_minute=60)
+    for _ in range(10):
+        limiter.acquire()
+    clock.advance(4.5)
+    assert [limiter.acquire() for _ in range(4)] == [0.0] * 4
+    # 剩 0.5 个请求：再等 0.5s
+    assert limiter.acquire() == pytest.approx(0.5)
+
+
+def test_refill_is_capped_at_capacity(clock):
+    limiter = make_limiter(clock, requests_per_minute=60)
+    clock.advance(3600)
+    assert [limiter.acquire() for _ in range(10)] == [0.0] * 10
+    assert limiter.acquire() == pytest.approx(1.0)
+
+
+# --------------------------------------------------------------------------- #
+# TPM
+# --------------------------------------------------------------------------- #
+def test_tokens_bucket(clock):
+    limiter = make_limiter(clock, tokens_per_minute=6000)
+    assert limiter.capacity == {"tokens": 1000.0}
+    assert limiter.acquire(tokens=800) == 0.0
+    # 剩 200，需要 400：(400 - 200) / 100 每秒 = 2s
+    assert limiter.acquire(tokens=400) == pytest.approx(2.0)
+
+
+def test_request_larger_than_capacity_is_clamped(clock):
+    limiter = make_limiter(clock, tokens_per_minute=6000)
+    assert limiter.acquire(tokens=50_000) == 0.0
+    assert limiter.acquire(tokens=100) == pytest.approx(1.0)
+
+
+def test_wait_is_the_slower_of_both_buckets(clock):
+    limiter = make_limiter(clock, requests_per_minute=60, tokens_per_minute=6000)
+    limiter.acquire(tokens=1000)
+    # 请求桶还有 9 个，token 桶需要 500 / 100 = 5s
+    assert limiter.acquire(tokens=500) == pytest.approx(5.0)
+
+
+def test_adjust_debits_and_credits_tokens(clock):
+    limiter = make_limiter(clock, tokens_per_minute=6000)
+    limiter.acquire(tokens=800)
+    # 实际多用 500：水位 200 → -300，之后取 100 需要 (100 + 300) / 100 = 4s
+    limiter.adjust(500)
+    assert limiter.acquire(tokens=100) == pytest.approx(4.0)
+
+    # 预估偏多时退回额度，但不超过容量
+    limiter.adjust(-10_000)
+    assert limiter.acquire(tokens=1000) == 0.0
+
+
+def test_adjust_without_tokens_bucket_is_noop(clock):
+    limiter = make_limiter(clock, requests_per_minute=60)
+    limiter.adjust(1000)
+    assert limiter.acquire() == 0.0
+
+
+# --------------------------------------------------------------------------- #
+# 跨实例共享 / 异步 / 进程级实例
+# --------------------------------------------------------------------------- #
+def test_state_dir_shares_buckets_between_instances(clock, tmp_path):
+    first = make_limiter(clock, requests_per_minute=60, state_dir=str(tmp_path))
+    second = make_limiter(clock, requests_per_minute=60, state_dir=str(tmp_path))
+    for _ in range(6):
+        first.acquire()
+    assert [second.acquire() for _ in range(4)] == [0.0] * 4
+    assert first.acquire() == pytest.approx(1.0)
+
+
+def test_aacquire_waits_on_the_event_loop(clock, monkeypatch):
+    sleeps = []
+
+    async def fake_sleep(seconds: float) -> None:
+        sleeps.append(seconds)
+        clock.advance(seconds)
+
+    monkeypatch.setattr(rate_limiter.asyncio, "sleep", fake_sleep)
+    limiter = make_limiter(clock, requests_per_minute=60, burst_seconds=1)
+
+    async def main():
+        return [await limiter.aacquire(), await limiter.aacquire()]
+
+    assert asyncio.run(main()) == [0.0, pytest.approx(1.0)]
+    assert sleeps == [pytest.approx(1.0)]
+    assert clock.sleeps == []
+
+
+def test_get_rate_limiter_reads_env_once(monkeypatch):
+    monkeypatch.setattr(rate_limiter, "_LIMITERS", {})
+    monkeypatch.delenv("LLM_RATE_LIMIT_RPM", raising=False)
+    monkeypatch.delenv("LLM_RATE_LIMIT_TPM", raising=False)
+    monkeypatch.delenv("RATE_LIMIT_STATE_DIR", raising=False)
+    monkeypatch.setenv("TAVILY_RATE_LIMIT_RPM", "100")
+
+    assert get_rate_limiter("LLM") is None
+    limiter = get_rate_limiter("TAVILY")
+    assert limiter is get_rate_limiter("TAVILY")
+    assert limiter.requests_per_minute == 100
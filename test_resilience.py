@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+"""
+test_resilience.py — 重试层：full jitter 退避上下界、Retry-After、总截止时间、不可重试错误
+（resilience 模块里的 time 换成假时钟，不真正等待；离线，python -m pytest -q）
+"""
+
+import asyncio
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import resilience
+from resilience import (
+    AttemptTimeout,
+    RetryError,
+    RetryPolicy,
+    acall_with_retry,
+    call_with_retry,
+    is_retryable,
+    retry_after_seconds,
+)
+
+
+class FakeTime:
+    """替换 resilience.time：monotonic / time 返回手动推进的时间，sleep 只推进时间"""
+
+    def __init__(self) -> None:
+        self.now = 1_000_000.0
+        self.sleeps = []
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def time(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class HTTPError(Exception):
+    def __init__(self, status_code: int, headers=None) -> None:
+        super().__init__(f"Error code: {status_code}")
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class Flaky:
+    """前 failures 次抛出 error，之后返回 "ok"；记录每次调用的关键字参数"""
+
+    def __init__(self, error: BaseException, failures: int = 10**6, cost: float = 0.0, clock: FakeTime | None = None) -> None:
+        self.error = error
+        self.failures = failures
+        self.cost = cost
+        self.clock = clock
+        self.calls = []
+
+    def __call__(self, **kwargs):
+        self.calls.append(kwargs)
+        if self.clock is not None:
+            self.clock.now += self.cost
+        if len(self.calls) <= self.failures:
+            raise self.error
+        return "ok"
+
+
+@pytest.fixture
+def clock(monkeypatch) -> FakeTime:
+    fake = FakeTime()
+    monkeypatch.setattr(resilience, "time", fake)
+    return fake
+
+
+def quiet(*args) -> None:
+    """on_retry：测试中不打印"""
+
+
+# --------------------------------------------------------------------------- #
+# 退避
+# --------------------------------------------------------------------------- #
+def test_full_jitter_ceiling_grows_and_is_capped(monkeypatch):
+    policy = RetryPolicy(base_delay=0.5, multiplier=2.0, max_delay=5.0)
+    bounds = []
+    monkeypatch.setattr(resilience.random, "uniform", lambda low, high: bounds.append((low, high)) or high)
+    assert [policy.backoff(attempt) for attempt in range(1, 6)] == [0.5, 1.0, 2.0, 4.0, 5.0]
+    assert all(low == 0 for low, _ in bounds)
+
+
+def test_full_jitter_samples_stay_within_bounds():
+    policy = RetryPolicy(base_delay=0.5, multiplier=2.0, max_delay=5.0)
+    for attempt, ceiling in [(1, 0.5), (3, 2.0), (10, 5.0)]:
+        samples = [policy.backoff(attempt) for _ in range(500)]
+        assert all(0.0 <= delay <= ceiling for delay in samples)
+        # full jitter：在 [0, 上限] 内分散，而不是集中在上限附近
+        assert min(samples) < ceiling * 0.2 and max(samples) > ceiling * 0.8
+
+
+# --------------------------------------------------------------------------- #
+# Retry-After
+# --------------------------------------------------------------------------- #
+def test_retry_after_header_forms(clock):
+    assert retry_after_seconds(HTTPError(429, {"retry-after": "3"})) == 3.0
+    assert retry_after_seconds(HTTPError(429, {"retry-after-ms": "250"})) == 0.25
+    when = datetime.fromtimestamp(clock.now, tz=timezone.utc) + timedelta(seconds=7)
+    assert retry_after_seconds(HTTPError(429, {"retry-after": format_datetime(when, usegmt=True)})) == pytest.approx(7.0)
+    assert retry_after_seconds(HTTPError(429)) is None
+
+
+def test_retry_after_is_a_floor_capped_by_max_delay(clock, monkeypatch):
+    monkeypatch.setattr(resilience.random, "uniform", lambda low, high: low)
+    fn = Flaky(HTTPError(429, {"retry-after": "3"}), failures=1)
+    policy = RetryPolicy(max_attempts=3, base_delay=0.5, max_delay=20.0)
+    assert call_with_retry(fn, policy, on_retry=quiet) == "ok"
+    assert clock.sleeps == [3.0]
+
+    fn = Flaky(HTTPError(503, {"retry-after": "60"}), failures=1)
+    assert call_with_retry(fn, RetryPolicy(max_attempts=3, max_delay=4.0), on_retry=quiet) == "ok"
+    assert clock.sleeps[-1] == 4.0
+
+
+# --------------------------------------------------------------------------- #
+# 次数 / 截止时间
+# --------------------------------------------------------------------------- #
+def test_succeeds_after_transient_failures(clock):
+    retries = []
+    fn = Flaky(HTTPError(429), failures=2)
+    result = call_with_retry(fn, RetryPolicy(max_attempts=4), on_retry=lambda *args: retries.append(args[1]))
+    assert result == "ok"
+    assert len(fn.calls) == 3
+    assert retries == [1, 2]
+    assert len(clock.sleeps) == 2
+
+
+def test_max_attempts_exhausted(clock):
+    error = HTTPError(500)
+    fn = Flaky(error)
+    with pytest.raises(RetryError) as info:
+        call_with_retry(fn, RetryPolicy(max_attempts=3), label="LLM", on_retry=quiet)
+    assert info.value.attempts == 3
+    assert info.value.last_error is error
+    assert len(fn.calls) == 3
+    assert len(clock.sleeps) == 2
+
+
+def test_deadline_stops_retrying_before_sleeping_past_it(clock, monkeypatch):
+    monkeypatch.setattr(resilience.random, "uniform", lambda low, high: high)
+    policy = RetryPolicy(max_attempts=100, base_delay=1.0, multiplier=2.0, max_delay=8.0, deadline=10.0)
+    fn = Flaky(HTTPError(503), cost=0.5, clock=clock)
+    with pytest.raises(RetryError) as info:
+        call_with_retry(fn, policy, on_retry=quiet)
+    # 0.5 + 1 + 0.5 + 2 + 0.5 + 4 + 0.5 = 9.0；下一次等 8s 会越过 10s 截止时间，不再重试
+    assert clock.sleeps == [1.0, 2.0, 4.0]
+    assert info.value.attempts == 4
+    assert clock.now - 1_000_000.0 < policy.deadline
+
+
+def test_pass_timeout_hands_remaining_budget_to_client(clock, monkeypatch):
+    monkeypatch.setattr(resilience.random, "uniform", lambda low, high: high)
+    policy = RetryPolicy(max_attempts=5, base_delay=1.0, attempt_timeout=4.0, deadline=6.0)
+    fn = Flaky(HTTPError(503), failures=2, cost=1.0, clock=clock)
+    assert call_with_retry(fn, policy, on_retry=quiet, pass_timeout=True) == "ok"
+    # 每次的 timeout = min(attempt_timeout, 截止时间剩余)：4；6 - 2 = 4；6 - 5 = 1
+    assert [call["timeout"] for call in fn.calls] == [4.0, 4.0, 1.0]
+
+
+def test_pass_timeout_with_exhausted_deadline_does_not_call(clock):
+    policy = RetryPolicy(max_attempts=3, deadline=1.0)
+    fn = Flaky(HTTPError(503), cost=2.0, clock=clock)
+    with pytest.raises(RetryError) as info:
+        call_with_retry(fn, policy, on_retry=quiet, pass_timeout=True)
+    assert len(fn.calls) == 1
+    assert info.value.attempts == 1
+
+
+def test_before_attempt_runs_each_time(clock):
+    calls = []
+    fn = Flaky(HTTPError(429), failures=1)
+    call_with_retry(fn, RetryPolicy(max_attempts=3), on_retry=quiet, before_attempt=lambda: calls.append(1))
+    assert calls == [1, 1]
+
+
+# --------------------------------------------------------------------------- #
+# 不可重试
+# --------------------------------------------------------------------------- #
+@pytest.mark.parametrize("error", [ValueError("bad json"), HTTPError(400), HTTPError(401), KeyError("x")])
+def test_non_retryable_errors_raise_immediately(clock, error):
+    fn = Flaky(error)
+    with pytest.raises(type(error)):
+        call_with_retry(fn, RetryPolicy(max_attempts=5), on_retry=quiet)
+    assert len(fn.calls) == 1
+    assert clock.sleeps == []
+
+
+@pytest.mark.parametrize(
+    "error, expected",
+    [
+        (HTTPError(429), True),
+        (HTTPError(503), True),
+        (HTTPError(408), True),
+        (HTTPError(404), False),
+        (TimeoutError(), True),
+        (AttemptTimeout(), True),
+        (ConnectionResetError(), True),
+        (Exception("Error 502: bad gateway"), True),
+        (Exception("status code 422"), False),
+        (type("RateLimitError", (Exception,), {})(), True),
+        (ValueError("x"), False),
+    ],
+)
+def test_is_retryable(error, expected):
+    assert is_retryable(error) is expected
+
+
+# --------------------------------------------------------------------------- #
+# 异步版本
+# --------------------------------------------------------------------------- #
+def test_acall_with_retry(clock, monkeypatch):
+    slept = []
+
+    async def fake_sleep(seconds: float) -> None:
+        slept.append(seconds)
+        clock.now += seconds
+
+    monkeypatch.setattr(resilience.asyncio, "sleep", fake_sleep)
+    monkeypatch.setattr(resilience.random, "uniform", lambda low, high: low)
+    attempts = []
+
+    async def fn():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise HTTPError(429, {"retry-after": "2"})
+        if len(attempts) == 2:
+            raise ValueError("not retryable")
+        return "ok"
+
+    with pytest.raises(ValueError):
+        asyncio.run(acall_with_retry(fn, RetryPolicy(max_attempts=5), on_retry=quiet))
+    assert slept == [2.0]
+    assert len(attempts) == 2
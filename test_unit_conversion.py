@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+test_unit_conversion.py — unit_conversion.CostConverter 各换算路径的单元测试（离线，python -m pytest -q）
+"""
+
+import pytest
+
+from unit_conversion import (
+    CostConverter,
+    UnitConversionError,
+    converter_from_llm_result,
+    parse_cost_unit,
+)
+
+
+def cost(converter: CostConverter, unit: str) -> float:
+    return converter.convert(unit)["final_cost"]
+
+
+@pytest.fixture(autouse=True)
+def fixed_fx(monkeypatch):
+    """汇率固定为模块内的参考值，不受运行环境的 UNIT_FX_RATES 影响"""
+    monkeypatch.delenv("UNIT_FX_RATES", raising=False)
+
+
+# --------------------------------------------------------------------------- #
+# 时间 ↔ 时间
+# --------------------------------------------------------------------------- #
+def test_time_units_need_no_speed():
+    converter = CostConverter(120.0)
+    assert cost(converter, "CNY/h") == pytest.approx(120.0)
+    assert cost(converter, "CNY/min") == pytest.approx(2.0)
+    assert cost(converter, "RMB/小时") == pytest.approx(120.0)
+
+
+def test_currency_conversion(monkeypatch):
+    monkeypatch.setenv("UNIT_FX_RATES", "USD=8")
+    assert cost(CostConverter(80.0), "USD/h") == pytest.approx(10.0)
+
+
+# --------------------------------------------------------------------------- #
+# 同量纲直接换算（不经过单件）
+# --------------------------------------------------------------------------- #
+def test_mass_speed_to_mass_unit_without_density():
+    """kg/h → CNY/kg、CNY/t：不需要体积和密度"""
+    converter = CostConverter(100.0, processing_speed=50, speed_unit="kg/h", material_name="unobtanium")
+    assert cost(converter, "CNY/kg") == pytest.approx(2.0)
+    assert cost(converter, "CNY/t") == pytest.approx(2000.0)
+    assert cost(converter, "CNY/g") == pytest.approx(0.002)
+
+
+def test_volume_speed_per_minute():
+    converter = CostConverter(60.0, processing_speed=10, speed_unit="cm³/min")
+    assert cost(converter, "CNY/cm³") == pytest.approx(0.1)
+    assert cost(converter, "CNY/dm³") == pytest.approx(100.0)
+
+
+def test_mass_speed_without_geometry_cannot_reach_pieces():
+    converter = CostConverter(100.0, processing_speed=50, speed_unit="kg/h")
+    with pytest.raises(UnitConversionError):
+        converter.convert("CNY/pcs")
+
+
+# --------------------------------------------------------------------------- #
+# 经密度 / 单件换算
+# --------------------------------------------------------------------------- #
+def test_piece_speed_to_mass_uses_reference_density():
+    # 6082 铝合金 2.70 g/cm³ → 200 cm³ 单件 0.54 kg
+    converter = CostConverter(
+        100.0, processing_speed=60, speed_unit="pcs/h", volume_cm3=200, material_name="6082"
+    )
+    assert converter.per_piece["mass"] == pytest.approx(0.54)
+    assert cost(converter, "CNY/pcs") == pytest.approx(100.0 / 60)
+    assert cost(converter, "CNY/kg") == pytest.approx(100.0 / 60 / 0.54)
+    assert cost(converter, "CNY/cm³") == pytest.approx(100.0 / 60 / 200)
+
+
+def test_mass_speed_to_volume_and_pieces_through_density():
+    converter = CostConverter(
+        100.0, processing_speed=50, speed_unit="kg/h", volume_cm3=200, density_g_per_cm3=8.0
+    )
+    # 50 kg/h ÷ 1.6 kg/件 = 31.25 件/h；50 kg/h = 6250 cm³/h
+    assert converter.pieces_per_hour == pytest.approx(31.25)
+    assert cost(converter, "CNY/pcs") == pytest.approx(3.2)
+    assert cost(converter, "CNY/cm³") == pytest.approx(0.016)
+
+
+def test_area_unit_needs_surface_area():
+    converter = CostConverter(100.0, processing_speed=10, speed_unit="pcs/h", volume_cm3=200)
+    with pytest.raises(UnitConversionError, match="表面积"):
+        converter.convert("CNY/m²")
+
+    converter = CostConverter(100.0, processing_speed=10, speed_unit="pcs/h", surface_area_cm2=2500)
+    # 10 件/h × 0.25 m² = 2.5 m²/h
+    assert cost(converter, "CNY/m²") == pytest.approx(40.0)
+
+
+def test_unknown_density_blocks_mass_units():
+    converter = CostConverter(
+        100.0, processing_speed=10, speed_unit="pcs/h", volume_cm3=200, material_name="unobtanium"
+    )
+    with pytest.raises(UnitConversionError, match="密度"):
+        converter.convert("CNY/kg")
+
+
+def test_reference_density_wins_over_llm_density():
+    converter = CostConverter(100.0, volume_cm3=100, material_name="AlSi9Mn", density_g_per_cm3=7.85)
+    assert converter.density == pytest.approx(2.65)
+
+
+# --------------------------------------------------------------------------- #
+# 从 LLM 结果构建
+# --------------------------------------------------------------------------- #
+def test_converter_from_llm_result_falls_back_to_llm_density():
+    llm_result = {
+        "base_hourly_cost": {"total_CNY_per_hour": "100"},
+        "processing_speed": {"value": "2", "unit": "pcs/min"},
+        "material_density_g_per_cm3": "7.85",
+    }
+    converter = converter_from_llm_result(llm_result, 100, None, "steel")
+    assert converter.density == pytest.approx(7.85)
+    # 120 件/h × 0.785 kg = 94.2 kg/h
+    assert cost(converter, "CNY/kg") == pytest.approx(100.0 / 94.2)
+
+
+def test_converter_from_llm_result_requires_hourly_cost():
+    with pytest.raises(UnitConversionError):
+        converter_from_llm_result({"base_hourly_cost": {}}, 100, None, None)
+
+
+def test_unparseable_speed_only_affects_non_time_units():
+    converter = CostConverter(90.0, processing_speed=5, speed_unit="widgets per hour")
+    assert cost(converter, "CNY/h") == pytest.approx(90.0)
+    results = converter.convert_many(["CNY/h", "CNY/pcs"])
+    assert results["CNY/h"]["final_cost"] == pytest.approx(90.0)
+    assert "error" in results["CNY/pcs"]
+
+
+@pytest.mark.parametrize("unit", ["CNY", "XYZ/h", "CNY/furlong"])
+def test_invalid_units(unit):
+    with pytest.raises(UnitConversionError):
+        parse_cost_unit(unit)
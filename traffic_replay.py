@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+"""
+traffic_replay.py — Tavily 搜索与 LLM 推理流量的录制 / 回放
+功能：
+- TrafficStore：SQLite 单文件存储，按请求哈希（sha256）寻址，响应以 zlib 压缩的 JSON 保存
+- record 模式：真实调用外部服务，同时把每次 Tavily 查询 / 响应、LLM prompt / 响应写入存储
+- replay 模式：不访问网络，按请求哈希从存储中取回响应；未录制的请求抛出 ReplayMissError（不重试）
+- 回放的 LLM 响应保留 usage_metadata，token 统计与真实调用一致
+用途：用真实大小的负载在本地速度下跑基准（benchmark_suite.py --traffic）和回归测试。
+环境变量：RATE_TOOL_TRAFFIC_MODE=off|record|replay，RATE_TOOL_TRAFFIC_PATH（默认 ./.cache/traffic.sqlite3）。
+说明：LLM / Tavily 缓存命中的请求不会到达外部服务，也就不会被录制；需要完整录制时把
+LLM_CACHE_TTL 与 TAVILY_CACHE_TTL 设为 0。
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+TRAFFIC_MODES = ("off", "record", "replay")
+
+
+class ReplayMissError(LookupError):
+    """回放模式下请求未被录制过"""
+
+
+# --------------------------------------------------------------------------- #
+# 存储
+# --------------------------------------------------------------------------- #
+def request_key(kind: str, request: Any) -> str:
+    """请求哈希：kind + 规范化 JSON（键排序）"""
+    payload = json.dumps(request, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(f"{kind}\n{payload}".encode("utf-8")).hexdigest()
+
+
+class TrafficStore:
+    """线程安全的录制存储；同一请求重复录制时保留最新的响应"""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.recorded = 0
+        self.replayed = 0
+        self.missed = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        try:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        except sqlite3.DatabaseError:
+            pass
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS traffic (
+                kind        TEXT NOT NULL,
+                key         TEXT NOT NULL,
+                request     BLOB NOT NULL,
+                response    BLOB NOT NULL,
+                recorded_at REAL NOT NULL,
+                PRIMARY KEY (kind, key)
+            )
+            """
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def _pack(value: Any) -> bytes:
+        return zlib.compress(json.dumps(value, ensure_ascii=False, default=str).encode("utf-8"), 6)
+
+    @staticmethod
+    def _unpack(blob: bytes) -> Any:
+        return json.loads(zlib.decompress(blob).decode("utf-8"))
+
+    def put(self, kind: str, request: Any, response: Any) -> None:
+        key = request_key(kind, request)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO traffic (kind, key, request, response, recorded_at) VALUES (?, ?, ?, ?, ?)",
+                (kind, key, self._pack(request), self._pack(response), time.time()),
+            )
+            self._conn.commit()
+            self.recorded += 1
+
+    def get(self, kind: str, request: Any) -> Any:
+        """取回录制的响应；未录制时抛出 ReplayMissError"""
+        key = request_key(kind, request)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response FROM traffic WHERE kind = ? AND key = ?", (kind, key)
+            ).fetchone()
+            if row is None:
+                self.missed += 1
+            else:
+                self.replayed += 1
+        if row is None:
+            raise ReplayMissError(f"回放存储 {self.path} 中没有该 {kind} 请求（{key[:12]}）")
+        return self._unpack(row[0])
+
+    def responses(self, kind: str, limit: Optional[int] = None) -> List[Any]:
+        """按录制顺序返回某类请求的全部响应（基准测试取真实负载用）"""
+        sql = "SELECT response FROM traffic WHERE kind = ? ORDER BY recorded_at"
+        params: Tuple[Any, ...] = (kind,)
+        if limit:
+            sql += " LIMIT ?"
+            params += (int(limit),)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [self._unpack(blob) for (blob,) in rows]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = dict(self._conn.execute("SELECT kind, COUNT(*) FROM traffic GROUP BY kind").fetchall())
+        return {
+            "path": self.path,
+            "entries": counts,
+            "file_bytes": os.path.getsize(self.path) if os.path.exists(self.path) else 0,
+            "recorded": self.recorded,
+            "replayed": self.replayed,
+            "missed": self.missed,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+# --------------------------------------------------------------------------- #
+# Tavily
+# --------------------------------------------------------------------------- #
+def _jsonable(value: Any) -> Any:
+    """Tavily 结果转成可存储的形式（dict / str 原样保存，ToolMessage 等取 content）"""
+    if isinstance(value, (dict, list, str)) or value is None:
+        return value
+    if hasattr(value, "content"):
+        return str(value.content or "")
+    return str(value)
+
+
+class RecordingSearchClient:
+    """包装真实的 TavilySearch：调用并录制成功的响应（出错的 {"error": e} 不录制）"""
+
+    def __init__(self, inner: Any, store: TrafficStore) -> None:
+        self.inner = inner
+        self.store = store
+
+    def _record(self, query: str, result: Any) -> Any:
+        if not (isinstance(result, dict) and "error" in result):
+            self.store.put("tavily", {"query": query}, _jsonable(result))
+        return result
+
+    def invoke(self, query: str) -> Any:
+        return self._record(query, self.inner.invoke(query))
+
+    async def ainvoke(self, query: str) -> Any:
+        return self._record(query, await self.inner.ainvoke(query))
+
+
+class ReplaySearchClient:
+    """从存储回放 Tavily 响应；未录制时与 TavilySearch 一样返回 {"error": e}"""
+
+    def __init__(self, store: TrafficStore) -> None:
+        self.store = store
+
+    def invoke(self, query: str) -> Any:
+        try:
+            return self.store.get("tavily", {"query": query})
+        except ReplayMissError as e:
+            return {"error": e}
+
+    async def ainvoke(self, query: str) -> Any:
+        return self.invoke(query)
+
+
+# --------------------------------------------------------------------------- #
+# LLM
+# --------------------------------------------------------------------------- #
+def _messages_request(messages: Iterable[BaseMessage]) -> List[Dict[str, str]]:
+    return [{"type": message.type, "content": str(message.content)} for message in messages]
+
+
+def _message_to_record(message: AIMessage) -> Dict[str, Any]:
+    return {
+        "content": message.content,
+        "usage_metadata": dict(message.usage_metadata) if message.usage_metadata else None,
+        "response_metadata": dict(message.response_metadata or {}),
+    }
+
+
+def _record_to_message(record: Dict[str, Any]) -> AIMessage:
+    return AIMessage(
+        content=record.get("content", ""),
+        usage_metadata=record.get("usage_metadata"),
+        response_metadata=dict(record.get("response_metadata") or {}, replayed=True),
+    )
+
+
+class TrafficChatModel(BaseChatModel):
+    """
+    录制 / 回放 LLM 流量的对话模型：
+    - mode="record"：调用 inner（真实模型，可以是 bind 过 response_format 的 Runnable）并录制
+    - mode="replay"：按 prompt 哈希回放，不需要 inner
+    """
+
+    store: Any
+    mode: str = "replay"
+    inner: Any = None
+
+    @property
+    def _llm_type(self) -> str:
+        return f"traffic-{self.mode}"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        request = _messages_request(messages)
+        if self.mode == "replay":
+            message = _record_to_message(self.store.get("llm", request))
+        else:
+            message = self.inner.invoke(messages)
+            self.store.put("llm", request, _message_to_record(message))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        request = _messages_request(messages)
+        if self.mode == "replay":
+            message = _record_to_message(self.store.get("llm", request))
+        else:
+            message = await self.inner.ainvoke(messages)
+            self.store.put("llm", request, _message_to_record(message))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+# --------------------------------------------------------------------------- #
+# 环境变量
+# --------------------------------------------------------------------------- #
+_STORES: Dict[str, TrafficStore] = {}
+_STORES_LOCK = threading.Lock()
+
+
+def traffic_mode_from_env() -> str:
+    """读取 RATE_TOOL_TRAFFIC_MODE；非法取值按 off 处理"""
+    mode = os.getenv("RATE_TOOL_TRAFFIC_MODE", "off").strip().lower()
+    if mode not in TRAFFIC_MODES:
+        print(f"[WARN] RATE_TOOL_TRAFFIC_MODE={mode} 无效（可选 {TRAFFIC_MODES}），按 off 处理")
+        return "off"
+    return mode
+
+
+def get_traffic_store(path: Optional[str] = None) -> TrafficStore:
+    """同一进程内相同路径共用一个存储（SQLite 连接）"""
+    path = path or os.getenv("RATE_TOOL_TRAFFIC_PATH") or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), ".cache", "traffic.sqlite3"
+    )
+    with _STORES_LOCK:
+        if path not in _STORES:
+            _STORES[path] = TrafficStore(path)
+        return _STORES[path]
@@ -0,0 +1,288 @@
+# -*- coding: utf-8 -*-
+"""
+unit_conversion.py — 本地确定性的成本单位换算
+功能：
+- 解析 "CNY/kg"、"USD/h"、"EUR/pcs"、"CNY/cm³"、"RMB/件" 这类成本单位
+- 基于 LLM 给出的 base_hourly_cost（CNY/h）与 processing_speed（如 pcs/h、kg/h、cm³/h），
+  结合零件体积、表面积和材料密度（参考表优先，其次用 LLM 估算值），把 CNY/h 换算到任意目标单位
+- 速度与目标单位同量纲（kg/h → CNY/kg）时直接换算，不需要零件几何与密度
+- 同一个 LLM 结果换算成多个单位只需微秒级的本地计算，不再需要额外的 LLM 调用
+说明：密度与汇率为参考值，汇率可通过环境变量 UNIT_FX_RATES（例如 "USD=7.1,EUR=7.8"）覆盖。
+"""
+
+import os
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, List, Tuple
+
+
+class UnitConversionError(ValueError):
+    """无法解析或无法换算的单位"""
+
+
+# --------------------------------------------------------------------------- #
+# 参考数据
+# --------------------------------------------------------------------------- #
+# 材料密度（g/cm³），按规范化后的材料名做包含匹配
+MATERIAL_DENSITY_G_PER_CM3: Dict[str, float] = {
+    "alsi9mnmozr": 2.68,
+    "alsi9mn": 2.65,
+    "6082": 2.70,
+}
+
+# 1 单位外币 = 多少 CNY（参考汇率）
+CNY_PER_CURRENCY: Dict[str, float] = {
+    "CNY": 1.0,
+    "USD": 7.10,
+    "EUR": 7.80,
+}
+
+_CURRENCY_ALIASES = {"RMB": "CNY", "¥": "CNY", "元": "CNY", "$": "USD", "€": "EUR"}
+
+# 计价分母：别名 → (量纲, 换算到该量纲基准单位的系数)
+# 基准单位：time=h, mass=kg, volume=cm³, area=cm², count=pcs
+_QUANTITIES: Dict[str, Tuple[str, float]] = {}
+for _aliases, _dimension, _factor in [
+    (("h", "hr", "hour", "hours", "小时"), "time", 1.0),
+    (("min", "minute", "minutes", "分钟"), "time", 1.0 / 60.0),
+    (("s", "sec", "second", "seconds", "秒"), "time", 1.0 / 3600.0),
+    (("kg", "公斤", "千克"), "mass", 1.0),
+    (("g", "克"), "mass", 0.001),
+    (("t", "ton", "吨"), "mass", 1000.0),
+    (("cm3", "cm³", "cc", "ml"), "volume", 1.0),
+    (("dm3", "dm³", "l", "升"), "volume", 1000.0),
+    (("m3", "m³"), "volume", 1_000_000.0),
+    (("cm2", "cm²"), "area", 1.0),
+    (("dm2", "dm²"), "area", 100.0),
+    (("m2", "m²"), "area", 10_000.0),
+    (("pcs", "pc", "piece", "pieces", "part", "parts", "件", "个", "只"), "count", 1.0),
+]:
+    for _alias in _aliases:
+        _QUANTITIES[_alias] = (_dimension, _factor)
+
+
+def _fx_rates() -> Dict[str, float]:
+    """参考汇率 + 环境变量覆盖（UNIT_FX_RATES="USD=7.1,EUR=7.8"）"""
+    rates = dict(CNY_PER_CURRENCY)
+    for item in os.getenv("UNIT_FX_RATES", "").split(","):
+        if "=" in item:
+            code, value = item.split("=", 1)
+            try:
+                rates[code.strip().upper()] = float(value)
+            except ValueError:
+                continue
+    return rates
+
+
+# --------------------------------------------------------------------------- #
+# 单位解析
+# --------------------------------------------------------------------------- #
+@dataclass(frozen=True)
+class QuantityUnit:
+    """计价分母，例如 kg、cm³、pcs、h"""
+
+    symbol: str
+    dimension: str
+    factor: float
+
+
+@dataclass(frozen=True)
+class CostUnit:
+    """成本单位：货币 / 计价分母"""
+
+    currency: str
+    quantity: QuantityUnit
+
+
+def parse_quantity(text: str) -> QuantityUnit:
+    """解析计价分母（大小写、空格、上标均可）"""
+    symbol = str(text).strip().lower().replace(" ", "")
+    if symbol not in _QUANTITIES:
+        raise UnitConversionError(f"无法识别的计量单位: {text!r}")
+    dimension, factor = _QUANTITIES[symbol]
+    return QuantityUnit(symbol=symbol, dimension=dimension, factor=factor)
+
+
+def parse_cost_unit(unit: str) -> CostUnit:
+    """解析 "CNY/kg"、"USD / h"、"/cm²"（缺省货币按 CNY）"""
+    parts = str(unit).split("/")
+    if len(parts) != 2:
+        raise UnitConversionError(f"成本单位应为 “货币/计量单位” 形式: {unit!r}")
+
+    currency = parts[0].strip().upper() or "CNY"
+    currency = _CURRENCY_ALIASES.get(currency, currency)
+    if currency not in _fx_rates():
+        raise UnitConversionError(f"缺少汇率的货币: {currency}")
+
+    return CostUnit(currency=currency, quantity=parse_quantity(parts[1]))
+
+
+def parse_rate_unit(unit: str) -> Tuple[QuantityUnit, QuantityUnit]:
+    """解析加工速度单位 "pcs/h"、"kg/h"、"cm³/min"，返回 (分子, 时间分母)"""
+    parts = str(unit).split("/")
+    if len(parts) != 2:
+        raise UnitConversionError(f"加工速度单位应为 “计量单位/时间” 形式: {unit!r}")
+
+    numerator, denominator = parse_quantity(parts[0]), parse_quantity(parts[1])
+    if denominator.dimension != "time":
+        raise UnitConversionError(f"加工速度单位的分母必须是时间: {unit!r}")
+    return numerator, denominator
+
+
+def material_density(material_name: str) -> float | None:
+    """按材料名查参考密度（g/cm³），未知材料返回 None"""
+    name = re.sub(r"\s+", "", str(material_name)).casefold()
+    for key in sorted(MATERIAL_DENSITY_G_PER_CM3, key=len, reverse=True):
+        if key in name:
+            return MATERIAL_DENSITY_G_PER_CM3[key]
+    return None
+
+
+# --------------------------------------------------------------------------- #
+# 换算
+# --------------------------------------------------------------------------- #
+class CostConverter:
+    """
+    先把加工速度换算成各量纲下的“每小时产出”，再用 CNY/h 除以对应产出：
+      - 速度与目标单位同量纲时直接换算（kg/h → CNY/kg、CNY/t；cm³/min → CNY/cm³），不需要几何参数
+      - 质量 ↔ 体积通过材料密度换算（参考密度表优先，其次用 LLM 给出的密度）
+      - 其它量纲以“单件”为桥梁：件/h × 每件的 kg / cm³ / cm²
+    时间类目标单位（CNY/h、USD/min）不依赖加工速度。
+    """
+
+    def __init__(
+        self,
+        base_hourly_cost: float,
+        processing_speed: float | None = None,
+        speed_unit: str | None = None,
+        volume_cm3: float | None = None,
+        surface_area_cm2: float | None = None,
+        material_name: str | None = None,
+        density_g_per_cm3: float | None = None,
+    ) -> None:
+        self.base_hourly_cost = float(base_hourly_cost)
+        self.density = (material_density(material_name) if material_name else None) or (
+            float(density_g_per_cm3) if density_g_per_cm3 and density_g_per_cm3 > 0 else None
+        )
+
+        # 单件在各量纲下的数量（基准单位）
+        self.per_piece: Dict[str, float] = {"count": 1.0}
+        if volume_cm3:
+            self.per_piece["volume"] = float(volume_cm3)
+            if self.density:
+                self.per_piece["mass"] = float(volume_cm3) * self.density / 1000.0
+        if surface_area_cm2:
+            self.per_piece["area"] = float(surface_area_cm2)
+
+        # 各量纲每小时的产出（基准单位 / h）；加工速度无法解析时只影响非时间类单位的换算
+        self.hourly_output: Dict[str, float] = {}
+        if processing_speed and speed_unit:
+            try:
+                numerator, denominator = parse_rate_unit(speed_unit)
+            except UnitConversionError:
+                numerator = denominator = None
+            if numerator is not None:
+                self.hourly_output[numerator.dimension] = (
+                    float(processing_speed) * numerator.factor / denominator.factor
+                )
+                self._derive_hourly_output()
+        self.pieces_per_hour: float | None = self.hourly_output.get("count")
+
+    def _derive_hourly_output(self) -> None:
+        """由已知量纲的每小时产出推出其它量纲：先走密度，再经单件桥接"""
+        output = self.hourly_output
+        if self.density:
+            # 1 kg = 1000 / 密度 cm³
+            if "mass" in output and "volume" not in output:
+                output["volume"] = output["mass"] * 1000.0 / self.density
+            elif "volume" in output and "mass" not in output:
+                output["mass"] = output["volume"] * self.density / 1000.0
+
+        if "count" not in output:
+            for dimension, rate in list(output.items()):
+                if self.per_piece.get(dimension):
+                    output["count"] = rate / self.per_piece[dimension]
+                    break
+        if "count" in output:
+            for dimension, amount in self.per_piece.items():
+                output.setdefault(dimension, output["count"] * amount)
+
+    def convert(self, target_unit: str) -> Dict[str, Any]:
+        """把 base_hourly_cost 换算到 target_unit，返回换算结果与中间量"""
+        target = parse_cost_unit(target_unit)
+        fx = _fx_rates()[target.currency]
+        quantity = target.quantity
+
+        if quantity.dimension == "time":
+            # CNY/h → CNY/min 等：每个目标单位对应 factor 小时
+            cost_cny = self.base_hourly_cost * quantity.factor
+        else:
+            if not self.hourly_output:
+                raise UnitConversionError(
+                    f"换算到 {target_unit} 需要可用的加工速度（pcs/h、kg/h、cm³/h 等）"
+                )
+            per_hour = self.hourly_output.get(quantity.dimension)
+            if not per_hour:
+                missing = {
+                    "mass": "材料密度或体积", "volume": "体积或材料密度", "area": "表面积", "count": "单件体积或材料密度",
+                }
+                raise UnitConversionError(
+                    f"换算到 {target_unit} 缺少{missing.get(quantity.dimension, '几何参数')}"
+                )
+            # 每个目标单位对应 factor 个基准单位
+            cost_cny = self.base_hourly_cost / per_hour * quantity.factor
+
+        final_cost = cost_cny / fx
+        return {
+            "from_unit": "CNY/h",
+            "to_unit": target_unit,
+            "final_cost": final_cost,
+            "conversion_factor": final_cost / self.base_hourly_cost if self.base_hourly_cost else None,
+            "pieces_per_hour": self.pieces_per_hour,
+            "material_density_g_per_cm3": self.density,
+            "calculated_weight_kg": self.per_piece.get("mass"),
+            "fx_cny_per_unit": fx,
+        }
+
+    def convert_many(self, target_units: List[str]) -> Dict[str, Dict[str, Any]]:
+        """一次换算多个单位；无法换算的单位返回 {"error": ...}"""
+        results: Dict[str, Dict[str, Any]] = {}
+        for unit in target_units:
+            try:
+                results[unit] = self.convert(unit)
+            except UnitConversionError as e:
+                results[unit] = {"error": str(e)}
+        return results
+
+
+def converter_from_llm_result(
+    llm_result: Dict[str, Any],
+    volume_cm3: float | None,
+    surface_area_cm2: float | None,
+    material_name: str | None,
+) -> CostConverter:
+    """从 LLM 输出中取 base_hourly_cost.total_CNY_per_hour 与 processing_speed 构建换算器"""
+    base = (llm_result.get("base_hourly_cost") or {}).get("total_CNY_per_hour")
+    try:
+        base = float(base)
+    except (TypeError, ValueError):
+        raise UnitConversionError("LLM 结果中缺少有效的 base_hourly_cost.total_CNY_per_hour")
+
+    speed = llm_result.get("processing_speed") or {}
+    return CostConverter(
+        base_hourly_cost=base,
+        processing_speed=_optional_float(speed.get("value")),
+        speed_unit=speed.get("unit"),
+        volume_cm3=volume_cm3,
+        surface_area_cm2=surface_area_cm2,
+        material_name=material_name,
+        # 参考密度表没有该材料时，用 LLM 估算的密度
+        density_g_per_cm3=_optional_float(llm_result.get("material_density_g_per_cm3")),
+    )
+
+
+def _optional_float(value: Any) -> float | None:
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None